@@ -1,57 +1,295 @@
-from fastapi import FastAPI, UploadFile, File, Form, Body
-from fastapi.responses import JSONResponse
+import warmup
+from fastapi import FastAPI, UploadFile, File, Form, Body, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from typing import List, Optional
-from sentence_transformers import SentenceTransformer, util
+import asyncio
+import importlib.util
 import json
 import tempfile
+import threading
 import os
+import data_logger
 from data_logger import log_test_data
+import history_store
+import metrics
+import model_registry
+import tracing
+import transcription
+import transcription_jobs
+import audio_stream
+import passage_index
+import word_align
+import petal_engine
+import tree_engine
+from request_coalescer import RequestCoalescer, COALESCE_ENABLED
+from result_cache import ResultCache, vector_key
+from inference_executor import executor, ExecutorSaturated
 import sys
+import time
+warmup.record_import("fastapi+core", warmup._elapsed_ms(warmup.PROCESS_START))
 
-# Import petal modules for prediction
-try:
-    import petal_reading
-    import petal_logic
-    import petal_writing
-    import petal_memory
-    PETAL_MODULES_AVAILABLE = True
-except ImportError:
-    PETAL_MODULES_AVAILABLE = False
-
-try:
-    from faster_whisper import WhisperModel  # type: ignore
-    WHISPER_AVAILABLE = True
-except ImportError:
-    WHISPER_AVAILABLE = False
-    WhisperModel = None
+# Import petal modules for prediction (cheap: TensorFlow is only imported
+# when a model has no NumPy export, see petal_engine)
+petal_reading = warmup.timed_import("petal_reading")
+petal_logic = warmup.timed_import("petal_logic")
+petal_writing = warmup.timed_import("petal_writing")
+petal_memory = warmup.timed_import("petal_memory")
+PETAL_MODULES_AVAILABLE = None not in (petal_reading, petal_logic, petal_writing, petal_memory)
+
+# How /consolidated-analysis runs its four petal predictions (see predict_all_petals_async)
+CONSOLIDATED_MODE = os.environ.get("CONSOLIDATED_MODE", "fused")
+
+# sentence_transformers and faster_whisper are imported by get_model()/get_whisper()
+WHISPER_AVAILABLE = importlib.util.find_spec("faster_whisper") is not None
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
 
 app = FastAPI(title="AI Test Analysis API")
 
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    """Every inference worker is busy and the wait queue is full"""
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "error": f"Server busy, retry shortly ({exc})"},
+        headers={"Retry-After": "1"}
+    )
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Per-route latency histogram and request/error counters for /metrics"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.observe_request(route.path if route is not None else "unmatched", request.method, status,
+                                time.perf_counter() - started)
+
+# Single-row /predict-* calls are micro-batched per petal model
+# (COALESCE_ENABLED, COALESCE_WINDOW_MS, COALESCE_MAX_BATCH)
+coalescers = {}
+if PETAL_MODULES_AVAILABLE and COALESCE_ENABLED:
+    coalescers = {
+        "reading": RequestCoalescer("reading", petal_reading.predict_read_batch, executor=executor),
+        "logic": RequestCoalescer("logic", petal_logic.predict_logic_batch, executor=executor),
+        "writing": RequestCoalescer("writing", petal_writing.predict_write_batch, executor=executor),
+        "memory": RequestCoalescer("memory", petal_memory.predict_mem_batch, executor=executor),
+    }
+
+metrics.gauge("executor_queue_depth", "Inference calls waiting for a free worker", lambda: executor.queue_depth)
+metrics.gauge("executor_running", "Inference calls currently running", lambda: executor.running)
+metrics.gauge("coalescer_pending", "Rows waiting in a micro-batching window",
+              lambda: {name: c.pending for name, c in coalescers.items()}, ("model",))
+metrics.gauge("transcription_queue_depth", "Audio clips waiting for a transcription worker",
+              lambda: transcription.pool.queue_depth)
+metrics.gauge("transcription_jobs", "Queued transcription jobs by status", transcription_jobs.counts, ("status",))
+metrics.gauge("data_logger_queue_depth", "Log entries waiting for the background writer",
+              lambda: data_logger.stats().get("queue_depth", 0))
+
+# Repeated inputs are answered without inference, per model version
+# (RESULT_CACHE_SIZE, RESULT_CACHE_TTL_S; see result_cache.py)
+result_caches = {name: ResultCache(name) for name in ("reading", "logic", "writing", "memory", "tree")}
+metrics.gauge("result_cache_entries", "Prediction results held in the result cache",
+              lambda: {name: len(c) for name, c in result_caches.items()}, ("cache",))
+
+PETAL_MODEL_PATHS = {}
+if PETAL_MODULES_AVAILABLE:
+    PETAL_MODEL_PATHS = {
+        "reading": petal_reading.MODEL_PATH,
+        "logic": petal_logic.MODEL_PATH,
+        "writing": petal_writing.MODEL_PATH,
+        "memory": petal_memory.MODEL_PATH,
+    }
+
+def petal_cache_version(test_type: str):
+    """Version of the weights serving test_type, or None (don't cache) if they can't be found"""
+    try:
+        return petal_engine.model_version(PETAL_MODEL_PATHS[test_type])
+    except (KeyError, OSError):
+        return None
+
+def tree_cache_version():
+    try:
+        return tree_engine.model_version()
+    except OSError:
+        return None
+
+async def predict_single(test_type: str, predict, values: List[float]) -> dict:
+    """Score one row: result cache first, then the micro-batching coalescer when enabled"""
+    cache = result_caches[test_type]
+    version = petal_cache_version(test_type)
+    key = vector_key(values)
+    if version is not None:
+        cached = cache.get(version, key)
+        if cached is not None:
+            return cached
+
+    coalescer = coalescers.get(test_type)
+    if coalescer is not None:
+        result = await coalescer.submit(values)
+    else:
+        result = await executor.run(predict, values)
+    if version is not None:
+        cache.put(version, key, result)
+    return result
+
+PETAL_PREDICTORS = {}
+if PETAL_MODULES_AVAILABLE:
+    PETAL_PREDICTORS = {
+        petal_reading.MODEL_PATH: petal_reading.predict_read_batch,
+        petal_logic.MODEL_PATH: petal_logic.predict_logic_batch,
+        petal_writing.MODEL_PATH: petal_writing.predict_write_batch,
+        petal_memory.MODEL_PATH: petal_memory.predict_mem_batch,
+    }
+
+def _load_petals():
+    for model_path in PETAL_PREDICTORS:
+        petal_engine.get_net(model_path)
+    if petal_engine.PETAL_LOOKUP:
+        import petal_lookup
+        for model_path in PETAL_PREDICTORS:
+            petal_lookup.get_table(model_path)
+    if CONSOLIDATED_MODE == "fused" and petal_engine.fused_available():
+        petal_engine.get_fused()
+
+def _probe_petals():
+    for predict_batch in PETAL_PREDICTORS.values():
+        predict_batch([[0.0, 0.0, 0.0, 0.0]])
+    if CONSOLIDATED_MODE == "fused" and petal_engine.fused_available():
+        petal_engine.predict_fused_confidences([[0.0] * 16])
+
+def _probe_tree():
+    tree = tree_engine.get_tree()
+    tree.predict_one({name: 0.0 for name in tree.feature_names})
+
+def _probe_sentence_transformer():
+    get_model().encode(["warm-up"])
+
+def _probe_whisper():
+    import numpy as np
+    segments, _ = get_whisper().transcribe(np.zeros(16000, dtype=np.float32))
+    list(segments)
+
+def warmup_tasks() -> dict:
+    """Model name -> loader, for the WARMUP_MODELS warm-up"""
+    tasks = {"tree": tree_engine.get_tree, "sentence_transformer": get_model}
+    if PETAL_MODULES_AVAILABLE:
+        tasks["petals"] = _load_petals
+    if WHISPER_AVAILABLE:
+        tasks["whisper"] = get_whisper
+    return tasks
+
+WARMUP_PROBES = {
+    "tree": _probe_tree,
+    "petals": _probe_petals,
+    "sentence_transformer": _probe_sentence_transformer,
+    "whisper": _probe_whisper,
+}
+
+@app.on_event("startup")
+async def preload_petal_models():
+    """Load the models once (in the background by default) so requests only pay for inference"""
+    warmup.mark("serving")
+    warmup.start(warmup_tasks(), WARMUP_PROBES)
+    if WHISPER_AVAILABLE:
+        job_workers.start()
+    milestones = warmup.report()["milestones_ms"]
+    print(f"Startup: serving after {milestones['serving']:.0f} ms (warm-up: {warmup.WARMUP}, models: {', '.join(warmup.WARMUP_MODELS)})")
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    """Let in-flight inference finish and flush queued log entries to disk"""
+    executor.shutdown(wait=True)
+    transcription.pool.shutdown(wait=True)
+    job_workers.shutdown()
+    data_logger.shutdown()
+
 # Load models lazily
 model = None
 whisper = None
+# concurrent first requests must not each load a model
+_model_lock = threading.Lock()
+_whisper_lock = threading.Lock()
+
+def _load_sentence_transformer():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(passage_index.SENTENCE_MODEL)
+
+def _load_whisper():
+    # int8 CPU weights (WHISPER_MODEL, WHISPER_COMPUTE_TYPE; see transcription.py)
+    return transcription.load_model()
 
 def get_model():
-    """Lazy load sentence transformer model"""
+    """Lazy load sentence transformer model (imports sentence_transformers on first use)"""
     global model
     if model is None:
-        try:
-            model = SentenceTransformer("all-MiniLM-L6-v2")
-        except Exception as e:
-            print(f"Warning: Could not load SentenceTransformer: {e}")
+        with _model_lock:
+            if model is None:
+                try:
+                    model = warmup.timed_load("sentence_transformer", _load_sentence_transformer)
+                except Exception as e:
+                    print(f"Warning: Could not load SentenceTransformer: {e}")
     return model
 
 def get_whisper():
-    """Lazy load whisper model"""
+    """Lazy load whisper model (imports faster_whisper on first use)"""
     global whisper
     if whisper is None and WHISPER_AVAILABLE:
-        try:
-            whisper = WhisperModel("base")
-        except Exception as e:
-            print(f"Warning: Could not load Whisper: {e}")
+        with _whisper_lock:
+            if whisper is None:
+                try:
+                    whisper = warmup.timed_load("whisper", _load_whisper)
+                except Exception as e:
+                    print(f"Warning: Could not load Whisper: {e}")
     return whisper
 
+def encode_texts(texts: List[str]):
+    """Unit-length SentenceTransformer vectors for a batch of texts"""
+    sentence_model = get_model()
+    if sentence_model is None:
+        raise RuntimeError("SentenceTransformer not available")
+    return sentence_model.encode(list(texts), batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+
+# Student texts from concurrent requests are encoded in one batch
+if COALESCE_ENABLED:
+    coalescers["sentence"] = RequestCoalescer("sentence", encode_texts, executor=executor)
+
+async def semantic_similarity(student_texts: List[str], reference_texts: List[str]) -> Optional[List[float]]:
+    """
+    Cosine similarity of each student text to its reference passage, or None
+    when sentence-transformers is unavailable. Reference vectors come from the
+    passage index (passage_index.py); only the student side is encoded here.
+    """
+    if not SENTENCE_TRANSFORMERS_AVAILABLE or not student_texts:
+        return None
+    # a model that failed to load would otherwise fail the coalesced batch and then every row on its own
+    if model is None and await executor.run(get_model) is None:
+        return None
+    try:
+        # nothing written or read scores 0 without a trip through the model
+        scored = [i for i, text in enumerate(student_texts) if text.strip()]
+        scores = [0.0] * len(student_texts)
+        if not scored:
+            return scores
+        students = [student_texts[i] for i in scored]
+        if "sentence" in coalescers:
+            student_vectors = await asyncio.gather(*(coalescers["sentence"].submit(text) for text in students))
+        else:
+            student_vectors = await executor.run(encode_texts, students)
+        passage_vectors = await executor.run(passage_index.passage_vectors,
+                                             [reference_texts[i] for i in scored], encode_texts)
+        for i, score in zip(scored, passage_index.similarity(student_vectors, passage_vectors)):
+            scores[i] = score
+        return scores
+    except Exception as e:
+        # semantic similarity is reported alongside the test array, never instead of it
+        print(f"Warning: semantic similarity unavailable: {e}")
+        return None
+
 # ============ DATA MODELS ============
 
 class Test1Data(BaseModel):
@@ -64,6 +302,7 @@ class Test1Data(BaseModel):
     reading_time_ms: int  # Time taken to read in milliseconds
     max_reading_time_ms: int  # Maximum allowed time
     pronunciation_errors: int  # Count of pronunciation errors (0-17)
+    transcript: Optional[str] = None  # What was actually read; replaces the three counts above when given
 
 class Test2Data(BaseModel):
     """Logic Test Data Model"""
@@ -86,6 +325,7 @@ class Test3Data(BaseModel):
     writing_time_ms: int  # Time taken to write in milliseconds
     max_writing_time_ms: int  # Maximum allowed time
     spelling_errors: int  # Count of spelling errors (0-20)
+    expected_text: Optional[str] = None  # Reference text, for semantic_similarity
 
 class Test4Data(BaseModel):
     """Speaking/Audio Test Data Model"""
@@ -111,6 +351,14 @@ class ConsolidatedAnalysisRequest(BaseModel):
     writing_values: List[float]  # Test3: 4 values from writing test
     memory_values: List[float]   # Test4: 4 values from memory test
 
+class PetalBatchRequest(BaseModel):
+    """Batch request for petal predictions (one row per student)"""
+    rows: List[List[float]]  # N rows of 4 normalized values
+
+class ConsolidatedBatchRequest(BaseModel):
+    """Consolidated analysis for a whole class in one round trip"""
+    students: List[ConsolidatedAnalysisRequest]
+
 # ============ HELPER FUNCTIONS ============
 
 def normalize_score(score: float, min_val: float = 0.0, max_val: float = 1.0) -> float:
@@ -138,8 +386,44 @@ async def analyze_test1(data: Test1Data):
     """
     Analyze Reading Test
     Returns: [reading_accuracy, reading_time, words_read, pronunciation_error]
+    With a transcript, words_read, total_words and pronunciation_errors are
+    measured by aligning it with text_content instead of taken from the client,
+    and semantic_similarity is reported as for /analyze-test1-audio.
     """
-    
+    alignment, semantic = None, None
+    if data.transcript is not None:
+        alignment = await executor.run(word_align.reading_counts, data.text_content, data.transcript)
+        data = Test1Data(**{**data.dict(), **{field: alignment[field] for field in
+                                             ("words_read", "total_words", "pronunciation_errors")}})
+        similarity = await semantic_similarity([data.transcript], [data.text_content])
+        semantic = similarity[0] if similarity else None
+    test1_results = score_test1(data)
+    extra_data = None
+    if alignment:
+        extra_data = {"source": "transcript", **alignment}
+        if semantic is not None:
+            extra_data["semantic_similarity"] = semantic
+    log_test_data(
+        user_id=data.user_id,
+        test_id=data.test_id,
+        test_type="reading",
+        input_data=data.dict(),
+        output_array=test1_results,
+        extra_data=extra_data
+    )
+    response = {
+        "user_id": data.user_id,
+        "test_id": data.test_id,
+        "test_type": "reading",
+        "array": test1_results
+    }
+    if alignment:
+        response["alignment"] = alignment
+        response["semantic_similarity"] = semantic
+    return response
+
+def score_test1(data: Test1Data) -> List[float]:
+    """The /analyze-test1 array (scoring.py has the columnar version)"""
     # 1. Reading Accuracy (0-1 float) - reduced significantly for realistic scoring (max 50%)
     reading_accuracy = normalize_score(data.words_read / data.total_words, 0.0, 1.0) if data.total_words > 0 else 0.0
     reading_accuracy = reading_accuracy * 0.5  # Max 50% accuracy
@@ -159,27 +443,339 @@ async def analyze_test1(data: Test1Data):
         round(words_read_score, 2),
         round(pronunciation_penalty, 2)
     ]
+    return test1_results
+
+def _upload_size(upload: UploadFile) -> int:
+    f = upload.file
+    position = f.tell()
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(position)
+    return size
+
+@app.post("/analyze-test1-audio")
+async def analyze_test1_audio(
+    user_id: str = Form(...),
+    test_id: str = Form(...),
+    expected_text: List[str] = Form(...),
+    reading_time_ms: int = Form(...),
+    max_reading_time_ms: int = Form(...),
+    audio: List[UploadFile] = File(...),
+):
+    """
+    Reading test scored from the recordings instead of client-reported counts.
+    One audio clip per passage (same order as expected_text). Each clip is
+    transcribed on the transcription pool (faster-whisper, int8 CPU, VAD
+    trimming) and aligned with its passage: words_read = matched words,
+    pronunciation_errors = substituted words. Returns the /analyze-test1
+    response plus a per-clip transcription report with real-time factors.
+    """
+    if len(audio) != len(expected_text):
+        return JSONResponse(status_code=422, content={
+            "success": False,
+            "error": f"got {len(audio)} audio clips for {len(expected_text)} passages"
+        })
+    if not WHISPER_AVAILABLE:
+        return JSONResponse(status_code=503, content={
+            "success": False,
+            "error": "Transcription unavailable: faster-whisper is not installed"
+        })
+    for clip in audio:
+        if _upload_size(clip) > transcription.TRANSCRIBE_MAX_BYTES:
+            return JSONResponse(status_code=413, content={
+                "success": False,
+                "error": f"{clip.filename}: larger than {transcription.TRANSCRIBE_MAX_BYTES} bytes"
+            })
+
+    # one request submits at most TRANSCRIBE_WORKERS clips at a time, so a long
+    # test waits for its own clips instead of overflowing the pool's queue
+    fan_out = asyncio.Semaphore(transcription.pool.workers)
+
+    async def transcribe(clip: UploadFile, text: str) -> dict:
+        async with fan_out:
+            return await transcription.pool.run(transcription.transcribe_clip, get_whisper, clip.file, text)
+
+    try:
+        clips = await asyncio.gather(*(transcribe(clip, text) for clip, text in zip(audio, expected_text)))
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"success": False, "error": f"Transcription failed: {e}"})
+
+    return await _reading_audio_result(user_id, test_id, expected_text, reading_time_ms, max_reading_time_ms, clips)
+
+async def _reading_audio_result(user_id: str, test_id: str, expected_text: List[str], reading_time_ms: int,
+                                max_reading_time_ms: int, clips: List[dict], extra_data: Optional[dict] = None) -> dict:
+    """Score and log a reading test from its transcribed clips (the /analyze-test1-audio response)"""
+    similarity = await semantic_similarity([clip["transcript"] for clip in clips], expected_text)
+    semantic = transcription.add_semantic_similarity(clips, similarity)
+    if semantic is not None:
+        extra_data = dict(extra_data or {}, semantic_similarity=semantic)
+    summary = transcription.summarize(clips)
+    data = Test1Data(
+        user_id=user_id,
+        test_id=test_id,
+        text_content=" ".join(expected_text),
+        words_read=summary["words_read"],
+        total_words=summary["total_words"],
+        reading_time_ms=reading_time_ms,
+        max_reading_time_ms=max_reading_time_ms,
+        pronunciation_errors=summary["pronunciation_errors"]
+    )
+    test1_results = score_test1(data)
     log_test_data(
         user_id=data.user_id,
         test_id=data.test_id,
         test_type="reading",
         input_data=data.dict(),
-        output_array=test1_results
+        output_array=test1_results,
+        extra_data={"source": "audio", "clips": len(clips), "audio_s": summary["transcription"]["audio_s"],
+                    **(extra_data or {})}
     )
     return {
         "user_id": data.user_id,
         "test_id": data.test_id,
         "test_type": "reading",
-        "array": test1_results
+        "array": test1_results,
+        **summary,
+        "semantic_similarity": semantic
     }
 
+@app.post("/analyze-test1-audio/stream")
+async def analyze_test1_audio_stream(request: Request):
+    """
+    /analyze-test1-audio for streamed (chunked) uploads: the same form fields,
+    read incrementally with each expected_text sent before its audio part.
+    16 kHz mono 16-bit PCM (audio/pcm or WAV) is cut into segments at pauses
+    that are transcribed while the upload continues; other formats are
+    spooled to disk and transcribed as soon as their part ends. Memory per
+    upload stays constant (see audio_stream.py).
+    """
+    if not WHISPER_AVAILABLE:
+        return JSONResponse(status_code=503, content={
+            "success": False,
+            "error": "Transcription unavailable: faster-whisper is not installed"
+        })
+    try:
+        form = audio_stream.FormStream(request.headers.get("content-type", ""))
+    except ValueError as e:
+        return JSONResponse(status_code=415, content={"success": False, "error": str(e)})
+
+    started = time.perf_counter()
+    fields = {}
+    expected_text = []
+    streams = []
+    parts = []       # per clip: transcription tasks, in recording order
+    pending = []     # tasks not yet finished, for backpressure on the upload
+
+    def submit(piece):
+        task = asyncio.ensure_future(transcription.pool.run(transcription.transcribe_piece, get_whisper, piece))
+        parts[-1].append(task)
+        pending.append(task)
+
+    def invalid(status_code: int, error: str):
+        return JSONResponse(status_code=status_code, content={"success": False, "error": error})
+
+    try:
+        async for chunk in request.stream():
+            try:
+                events = form.write(chunk) if chunk else form.finalize()
+            except ValueError as e:
+                return invalid(422, str(e))
+            for event in events:
+                if event[0] == "field":
+                    if event[1] == "expected_text":
+                        expected_text.append(event[2])
+                    else:
+                        fields[event[1]] = event[2]
+                elif event[0] == "file_begin":
+                    if len(streams) >= len(expected_text):
+                        return invalid(422, "each audio part must follow its expected_text field")
+                    streams.append(audio_stream.ClipStream(event[2], event[3]))
+                    parts.append([])
+                elif event[0] == "file_data":
+                    stream = streams[-1]
+                    for piece in stream.feed(event[1]):
+                        submit(piece)
+                    if stream.bytes > transcription.TRANSCRIBE_MAX_BYTES:
+                        return invalid(413, f"{stream.filename}: larger than {transcription.TRANSCRIBE_MAX_BYTES} bytes")
+                else:
+                    for piece in streams[-1].finish():
+                        submit(piece)
+            # hold the upload while this client's segments are still waiting to be transcribed
+            pending[:] = [task for task in pending if not task.done()]
+            if len(pending) > audio_stream.STREAM_MAX_PENDING:
+                await asyncio.wait(pending[:len(pending) - audio_stream.STREAM_MAX_PENDING])
+        uploaded = time.perf_counter()
+
+        if not streams or len(streams) != len(expected_text):
+            return invalid(422, f"got {len(streams)} audio clips for {len(expected_text)} passages")
+        try:
+            user_id, test_id = fields["user_id"], fields["test_id"]
+            reading_time_ms, max_reading_time_ms = int(fields["reading_time_ms"]), int(fields["max_reading_time_ms"])
+        except (KeyError, ValueError) as e:
+            return invalid(422, f"missing or invalid form field: {e}")
+
+        try:
+            results = [await asyncio.gather(*clip_tasks) for clip_tasks in parts]
+        except ExecutorSaturated:
+            raise
+        except Exception as e:
+            return invalid(503, f"Transcription failed: {e}")
+    finally:
+        # a cancelled task stops waiting, but a piece already on the pool is still
+        # being read: transcribe_piece closes spools handed to the pool, and
+        # stream.close() only those of a part that never finished uploading
+        for task in (task for clip_tasks in parts for task in clip_tasks):
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+        for stream in streams:
+            stream.close()
+
+    clips = []
+    for text, stream, pieces in zip(expected_text, streams, results):
+        clip = transcription.score_clip(text, **transcription.join_parts(pieces))
+        clip["segments"] = len(pieces)
+        clips.append(clip)
+    response = await _reading_audio_result(user_id, test_id, expected_text, reading_time_ms, max_reading_time_ms, clips,
+                                     extra_data={"streamed": True})
+    response["transcription"]["upload_s"] = round(uploaded - started, 3)
+    response["transcription"]["after_upload_s"] = round(time.perf_counter() - uploaded, 3)
+    return response
+
+def _log_job(job: dict):
+    """Write a finished /jobs/test1-audio result to the test log (runs on the job supervisor thread)"""
+    request, result = job["request"], job["result"]
+    data = Test1Data(
+        user_id=request["user_id"],
+        test_id=request["test_id"],
+        text_content=" ".join(request["expected_text"]),
+        words_read=result["words_read"],
+        total_words=result["total_words"],
+        reading_time_ms=request["reading_time_ms"],
+        max_reading_time_ms=request["max_reading_time_ms"],
+        pronunciation_errors=result["pronunciation_errors"]
+    )
+    log_test_data(
+        user_id=data.user_id,
+        test_id=data.test_id,
+        test_type="reading",
+        input_data=data.dict(),
+        output_array=result["array"],
+        extra_data={"source": "audio", "job_id": job["job_id"], "clips": len(request["audio"]),
+                    "audio_s": result["transcription"]["audio_s"],
+                    **({"semantic_similarity": result["semantic_similarity"]}
+                       if result.get("semantic_similarity") is not None else {})}
+    )
+
+# Transcription worker processes (TRANSCRIBE_PROCESSES; see transcription_jobs.py)
+job_workers = transcription_jobs.WorkerPool(on_done=_log_job)
+
+@app.post("/jobs/test1-audio", status_code=202)
+async def submit_test1_audio_job(
+    user_id: str = Form(...),
+    test_id: str = Form(...),
+    expected_text: List[str] = Form(...),
+    reading_time_ms: int = Form(...),
+    max_reading_time_ms: int = Form(...),
+    audio: List[UploadFile] = File(...),
+    priority: int = Form(0),
+):
+    """
+    Queue an /analyze-test1-audio submission and return its job id at once.
+    Worker processes take jobs highest priority first; poll /jobs/{job_id}
+    for progress and /jobs/{job_id}/result for the response.
+    """
+    if len(audio) != len(expected_text):
+        return JSONResponse(status_code=422, content={
+            "success": False,
+            "error": f"got {len(audio)} audio clips for {len(expected_text)} passages"
+        })
+    if not WHISPER_AVAILABLE:
+        return JSONResponse(status_code=503, content={
+            "success": False,
+            "error": "Transcription unavailable: faster-whisper is not installed"
+        })
+    for clip in audio:
+        if _upload_size(clip) > transcription.TRANSCRIBE_MAX_BYTES:
+            return JSONResponse(status_code=413, content={
+                "success": False,
+                "error": f"{clip.filename}: larger than {transcription.TRANSCRIBE_MAX_BYTES} bytes"
+            })
+
+    request = {
+        "user_id": user_id,
+        "test_id": test_id,
+        "expected_text": expected_text,
+        "reading_time_ms": reading_time_ms,
+        "max_reading_time_ms": max_reading_time_ms,
+    }
+    try:
+        job_id = await executor.run(transcription_jobs.submit, "test1_audio", request,
+                                    [(clip.filename, clip.file) for clip in audio], priority)
+    except transcription_jobs.QueueFull as e:
+        return JSONResponse(status_code=503, content={"success": False, "error": f"Job queue full ({e})"},
+                            headers={"Retry-After": "5"})
+    job = await executor.run(transcription_jobs.get, job_id)
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status": job["status"],
+        "queue_position": job.get("queue_position"),
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result"
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a queued transcription job (with the result once done)"""
+    job = await executor.run(transcription_jobs.get, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": f"Unknown job {job_id}"})
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """The job's /analyze-test1-audio response: 200 when done, 202 while waiting, 500 if it failed"""
+    job = await executor.run(transcription_jobs.get, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": f"Unknown job {job_id}"})
+    if job["status"] == "done":
+        return job["result"]
+    if job["status"] == "failed":
+        return JSONResponse(status_code=500, content={
+            "success": False, "job_id": job_id, "status": "failed", "error": job.get("error")
+        })
+    return JSONResponse(status_code=202, headers={"Retry-After": "2"}, content={
+        "success": True, "job_id": job_id, "status": job["status"], "queue_position": job.get("queue_position")
+    })
+
 @app.post("/analyze-test2")
 async def analyze_test2(data: Test2Data):
     """
     Analyze Logic Test
     Returns: [logic_accuracy, logic_time, questions_attempted, logical_error]
     """
-    
+    test2_results = score_test2(data)
+    log_test_data(
+        user_id=data.user_id,
+        test_id=data.test_id,
+        test_type="logic",
+        input_data=data.dict(),
+        output_array=test2_results
+    )
+
+    return {
+        "user_id": data.user_id,
+        "test_id": data.test_id,
+        "test_type": "logic",
+        "array": test2_results
+    }
+
+def score_test2(data: Test2Data) -> List[float]:
+    """The /analyze-test2 array"""
     # 1. Logic Accuracy (0-1 float) - based on correct answers
     logic_accuracy = normalize_score(
         data.correct_answers / data.total_questions if data.total_questions > 0 else 0.0,
@@ -206,28 +802,38 @@ async def analyze_test2(data: Test2Data):
         round(questions_ratio, 2),
         round(logical_error_penalty, 2)
     ]
+    return test2_results
+
+@app.post("/analyze-test3")
+async def analyze_test3(data: Test3Data):
+    """
+    Analyze Grammar/Writing Test
+    Returns: [grammar_score, writing_time, word_count, spelling_errors]
+    """
+    test3_results = score_test3(data)
+    similarity = None
+    if data.expected_text:
+        similarity = await semantic_similarity([data.text_written], [data.expected_text])
     log_test_data(
         user_id=data.user_id,
         test_id=data.test_id,
-        test_type="logic",
+        test_type="grammar_writing",
         input_data=data.dict(),
-        output_array=test2_results
+        output_array=test3_results,
+        extra_data={"semantic_similarity": similarity[0]} if similarity else None
     )
-
-    return {
+    response = {
         "user_id": data.user_id,
         "test_id": data.test_id,
-        "test_type": "logic",
-        "array": test2_results
+        "test_type": "grammar_writing",
+        "array": test3_results
     }
+    if data.expected_text:
+        response["semantic_similarity"] = similarity[0] if similarity else None
+    return response
 
-@app.post("/analyze-test3")
-async def analyze_test3(data: Test3Data):
-    """
-    Analyze Grammar/Writing Test
-    Returns: [grammar_score, writing_time, word_count, spelling_errors]
-    """
-    
+def score_test3(data: Test3Data) -> List[float]:
+    """The /analyze-test3 array"""
     # 1. Grammar Score (0-1 float)
     grammar_score = normalize_score(1.0 - (data.spelling_errors / 20), 0.0, 1.0)
     
@@ -246,19 +852,7 @@ async def analyze_test3(data: Test3Data):
         round(word_count_score, 2),
         round(spelling_error_penalty, 2)
     ]
-    log_test_data(
-        user_id=data.user_id,
-        test_id=data.test_id,
-        test_type="grammar_writing",
-        input_data=data.dict(),
-        output_array=test3_results
-    )
-    return {
-        "user_id": data.user_id,
-        "test_id": data.test_id,
-        "test_type": "grammar_writing",
-        "array": test3_results
-    }
+    return test3_results
 
 @app.post("/analyze-test4")
 async def analyze_test4(data: dict = Body(...)):
@@ -269,24 +863,7 @@ async def analyze_test4(data: dict = Body(...)):
     """
     
     try:
-        # Extract values
-        recall_accuracy = data.get("recall_accuracy", 0.5)  # 0-1 range
-        response_time = data.get("response_time", 6)  # 0-12 range (in seconds equivalent)
-        sequence_length = data.get("sequence_length", 7.5)  # 0-15 range
-        error_count = data.get("error_count", 7.5)  # 0-15 range
-        
-        # Normalize to 0-1 range for consistency
-        recall_accuracy_norm = normalize_score(recall_accuracy, 0.0, 1.0)
-        response_time_norm = normalize_score(response_time / 12, 0.0, 1.0)  # Convert to 0-1
-        sequence_score = normalize_score(sequence_length / 15, 0.0, 1.0)  # Convert to 0-1
-        error_penalty = normalize_score(error_count / 15, 0.0, 1.0)  # Convert to 0-1
-        
-        test4_results = [
-            round(recall_accuracy_norm, 2),
-            round(response_time_norm, 2),
-            round(sequence_score, 2),
-            round(1 - error_penalty, 2)  # Inverse: more errors = lower score
-        ]
+        test4_results = score_test4(data)
         
         log_test_data(
             user_id=data.get("user_id", "unknown"),
@@ -308,6 +885,8 @@ async def analyze_test4(data: dict = Body(...)):
             "test_type": "memory_recognition",
             "array": test4_results
         }
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         return {
             "error": f"Failed to analyze test4: {str(e)}",
@@ -315,6 +894,27 @@ async def analyze_test4(data: dict = Body(...)):
             "test_id": data.get("test_id", "memory_test_1")
         }
 
+def score_test4(data: dict) -> List[float]:
+    """The /analyze-test4 array"""
+    # Extract values
+    recall_accuracy = data.get("recall_accuracy", 0.5)  # 0-1 range
+    response_time = data.get("response_time", 6)  # 0-12 range (in seconds equivalent)
+    sequence_length = data.get("sequence_length", 7.5)  # 0-15 range
+    error_count = data.get("error_count", 7.5)  # 0-15 range
+    
+    # Normalize to 0-1 range for consistency
+    recall_accuracy_norm = normalize_score(recall_accuracy, 0.0, 1.0)
+    response_time_norm = normalize_score(response_time / 12, 0.0, 1.0)  # Convert to 0-1
+    sequence_score = normalize_score(sequence_length / 15, 0.0, 1.0)  # Convert to 0-1
+    error_penalty = normalize_score(error_count / 15, 0.0, 1.0)  # Convert to 0-1
+    
+    return [
+        round(recall_accuracy_norm, 2),
+        round(response_time_norm, 2),
+        round(sequence_score, 2),
+        round(1 - error_penalty, 2)  # Inverse: more errors = lower score
+    ]
+
 @app.post("/analyze-all-tests")
 async def analyze_all_tests(
     test1_data: Optional[Test1Data] = Body(None),
@@ -357,14 +957,68 @@ async def analyze_all_tests(
     return results
 
 @app.get("/health")
+@app.get("/health/live")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness: the process is up and serving (models may still be loading)"""
     return {
         "status": "healthy",
         "service": "AI Test Analysis API",
         "version": "1.0.0"
     }
 
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: every warmed model is loaded and answered a dummy prediction"""
+    readiness = warmup.readiness()
+    readiness["model_files"] = model_registry.model_stats()
+    readiness["service"] = "AI Test Analysis API"
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+@app.get("/stats")
+async def stats():
+    """Runtime statistics: model load times/reload counts and micro-batching"""
+    return {
+        "models": model_registry.model_stats(),
+        "coalescer": {name: c.stats() for name, c in coalescers.items()},
+        "executor": executor.stats(),
+        "data_logger": data_logger.stats(),
+        "startup": warmup.report(),
+        "tracing": tracing.stats(),
+        "transcription": transcription.stats(),
+        "transcription_jobs": job_workers.stats(),
+        "result_cache": {name: c.stats() for name, c in result_caches.items()}
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text format: route latencies, model/inference/log timers, gauges"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# ============ HISTORY ENDPOINTS ============
+
+@app.get("/users/{user_id}/history")
+async def user_history(user_id: str, test_type: Optional[str] = None, limit: int = 100,
+                       before: Optional[str] = None):
+    """A user's logged results, newest first (indexed lookup in the history store)"""
+    try:
+        results = await executor.run(history_store.user_history, user_id, test_type, min(max(limit, 1), 1000), before)
+        return {"success": True, "user_id": user_id, "count": len(results), "results": results}
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@app.get("/users/{user_id}/latest")
+async def user_latest(user_id: str):
+    """The most recent result of each test type for a user"""
+    try:
+        latest = await executor.run(history_store.latest_results, user_id)
+        return {"success": True, "user_id": user_id, "latest": latest}
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
 @app.get("/")
 async def root():
     """API Information"""
@@ -374,11 +1028,18 @@ async def root():
         "description": "API for analyzing reading, logic, grammar/writing, and speaking tests",
         "endpoints": {
             "test1": "/analyze-test1 (POST) - Reading Test Analysis",
+            "test1_audio": "/analyze-test1-audio (POST, multipart) - Reading Test Scored From Recordings",
+            "test1_audio_stream": "/analyze-test1-audio/stream (POST, chunked multipart) - Streamed Recordings",
+            "jobs": "/jobs/test1-audio (POST, multipart), /jobs/{job_id}, /jobs/{job_id}/result (GET) - Queued Transcription",
             "test2": "/analyze-test2 (POST) - Logic Test Analysis",
             "test3": "/analyze-test3 (POST) - Grammar/Writing Test Analysis",
             "test4": "/analyze-test4 (POST) - Speaking/Audio Test Analysis",
             "all": "/analyze-all-tests (POST) - Analyze Multiple Tests",
-            "health": "/health (GET) - Health Check"
+            "batch": "/predict-{reading,logic,writing,memory}-batch, /consolidated-analysis-batch (POST) - Whole-Class Predictions",
+            "health": "/health, /health/live (GET) - Liveness; /health/ready (GET) - Readiness",
+            "history": "/users/{user_id}/history, /users/{user_id}/latest (GET) - Per-User Results",
+            "stats": "/stats (GET) - Model Load Statistics",
+            "metrics": "/metrics (GET) - Prometheus Metrics"
         }
     }
 
@@ -394,12 +1055,14 @@ async def predict_reading(request: PetalPredictionRequest):
         if not PETAL_MODULES_AVAILABLE:
             return {"error": "Petal modules not available"}
         
-        result = petal_reading.predict_read(request.values)
+        result = await predict_single("reading", petal_reading.predict_read, request.values)
         return {
             "success": True,
             "test_type": "reading",
             "prediction": result
         }
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -417,12 +1080,14 @@ async def predict_logic(request: PetalPredictionRequest):
         if not PETAL_MODULES_AVAILABLE:
             return {"error": "Petal modules not available"}
         
-        result = petal_logic.predict_logic(request.values)
+        result = await predict_single("logic", petal_logic.predict_logic, request.values)
         return {
             "success": True,
             "test_type": "logic",
             "prediction": result
         }
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -440,12 +1105,14 @@ async def predict_writing(request: PetalPredictionRequest):
         if not PETAL_MODULES_AVAILABLE:
             return {"error": "Petal modules not available"}
         
-        result = petal_writing.predict_write(request.values)
+        result = await predict_single("writing", petal_writing.predict_write, request.values)
         return {
             "success": True,
             "test_type": "writing",
             "prediction": result
         }
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -463,12 +1130,14 @@ async def predict_memory(request: PetalPredictionRequest):
         if not PETAL_MODULES_AVAILABLE:
             return {"error": "Petal modules not available"}
         
-        result = petal_memory.predict_mem(request.values)
+        result = await predict_single("memory", petal_memory.predict_mem, request.values)
         return {
             "success": True,
             "test_type": "memory",
             "prediction": result
         }
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -476,64 +1145,253 @@ async def predict_memory(request: PetalPredictionRequest):
             "test_type": "memory"
         }
 
+def build_consolidated_result(request: ConsolidatedAnalysisRequest,
+                              reading_pred: dict, logic_pred: dict,
+                              writing_pred: dict, memory_pred: dict) -> dict:
+    """Aggregate the four petal predictions for one student"""
+    # Extract scores for decision tree
+    decision_tree_input = {
+        "reading_score": reading_pred.get("reading_score", 0),
+        "logic_score": logic_pred.get("logic_score", 0),
+        "writing_score": writing_pred.get("writing_score", 0),
+        "memory_score": memory_pred.get("memory_score", 0),
+        "reading_time": request.reading_values[1] if len(request.reading_values) > 1 else 0,
+        "logic_time": request.logic_values[1] if len(request.logic_values) > 1 else 0,
+        "writing_time": request.writing_values[1] if len(request.writing_values) > 1 else 0,
+        "memory_time": request.memory_values[1] if len(request.memory_values) > 1 else 0
+    }
+
+    return {
+        "success": True,
+        "user_id": request.user_id,
+        "test_id": request.test_id,
+        "petal_predictions": {
+            "reading": reading_pred,
+            "logic": logic_pred,
+            "writing": writing_pred,
+            "memory": memory_pred
+        },
+        "analysis_data": decision_tree_input,
+        "consolidated_scores": {
+            "avg_reading": round(reading_pred.get("reading_score", 0), 2),
+            "avg_logic": round(logic_pred.get("logic_score", 0), 2),
+            "avg_writing": round(writing_pred.get("writing_score", 0), 2),
+            "avg_memory": round(memory_pred.get("memory_score", 0), 2),
+            "overall_average": round(
+                (reading_pred.get("reading_score", 0) + 
+                 logic_pred.get("logic_score", 0) + 
+                 writing_pred.get("writing_score", 0) + 
+                 memory_pred.get("memory_score", 0)) / 4,
+                2
+            )
+        }
+    }
+
+def petal_calls(request: ConsolidatedAnalysisRequest):
+    """(name, predict function, input row) for each petal of one student"""
+    return [
+        ("reading", petal_reading.predict_read, request.reading_values),
+        ("logic", petal_logic.predict_logic, request.logic_values),
+        ("writing", petal_writing.predict_write, request.writing_values),
+        ("memory", petal_memory.predict_mem, request.memory_values),
+    ]
+
+def predict_petal(name: str, predict, values: List[float]) -> dict:
+    with tracing.span(f"petal.{name}"):
+        return predict(values)
+
+def predict_all_petals(request: ConsolidatedAnalysisRequest):
+    """The four petal predictions for one student (runs on the inference executor)"""
+    return tuple(predict_petal(*call) for call in petal_calls(request))
+
+def predict_petals_fused(students: List[ConsolidatedAnalysisRequest]):
+    """
+    All four petals for every student in one forward pass of the stacked
+    network (petal_engine.FUSED_PATH); same output as the separate models
+    """
+    rows = []
+    for student in students:
+        row = []
+        for values in (student.reading_values, student.logic_values, student.writing_values, student.memory_values):
+            if len(values) != 4:
+                raise ValueError(f"expected rows of 4 values, got shape (1, {len(values)})")
+            row.extend(values)
+        rows.append(row)
+    with tracing.span("petals.fused"):
+        confidences = petal_engine.predict_fused_confidences(rows)
+    return tuple(
+        module.results_from_confidences(confidences[:, i])
+        for i, module in enumerate((petal_reading, petal_logic, petal_writing, petal_memory))
+    )
+
+def predict_all_petals_fused(request: ConsolidatedAnalysisRequest):
+    return tuple(preds[0] for preds in predict_petals_fused([request]))
+
+async def predict_all_petals_async(request: ConsolidatedAnalysisRequest):
+    """
+    The four petal predictions for one student, per CONSOLIDATED_MODE:
+    "fused" (default) scores all four with one pass of the stacked network
+    and falls back to "sequential" until it has been exported; "parallel"
+    runs each petal on its own executor worker, so latency is the slowest
+    petal rather than the sum; "sequential" runs all four in one call.
+    """
+    if CONSOLIDATED_MODE == "fused" and petal_engine.fused_available():
+        return await executor.run(predict_all_petals_fused, request)
+    if CONSOLIDATED_MODE == "parallel":
+        return tuple(await asyncio.gather(*(executor.run(predict_petal, *call) for call in petal_calls(request))))
+    return await executor.run(predict_all_petals, request)
+
+async def predict_all_petals_cached(request: ConsolidatedAnalysisRequest):
+    """The four petal predictions for one student, skipping inference when all four are cached"""
+    lookups = [(name, petal_cache_version(name), vector_key(values)) for name, _, values in petal_calls(request)]
+    with tracing.span("result_cache"):
+        cached = [result_caches[name].get(version, key) if version is not None else None
+                  for name, version, key in lookups]
+    if all(pred is not None for pred in cached):
+        return tuple(cached)
+
+    with tracing.span("executor"):
+        preds = await predict_all_petals_async(request)
+    for (name, version, key), pred in zip(lookups, preds):
+        if version is not None:
+            result_caches[name].put(version, key, pred)
+    return preds
+
 @app.post("/consolidated-analysis")
-async def consolidated_analysis(request: ConsolidatedAnalysisRequest):
+async def consolidated_analysis(request: ConsolidatedAnalysisRequest, http_request: Request):
     """
     Perform consolidated analysis across all four tests
     Calls decision tree with aggregated results
     """
+    trace = tracing.start("consolidated-analysis", user_id=request.user_id, test_id=request.test_id)
     try:
         if not PETAL_MODULES_AVAILABLE:
             return {"error": "Petal modules not available"}
-        
-        # Get predictions from all petal modules
-        reading_pred = petal_reading.predict_read(request.reading_values)
-        logic_pred = petal_logic.predict_logic(request.logic_values)
-        writing_pred = petal_writing.predict_write(request.writing_values)
-        memory_pred = petal_memory.predict_mem(request.memory_values)
-        
-        # Extract scores for decision tree
-        decision_tree_input = {
-            "reading_score": reading_pred.get("reading_score", 0),
-            "logic_score": logic_pred.get("logic_score", 0),
-            "writing_score": writing_pred.get("writing_score", 0),
-            "memory_score": memory_pred.get("memory_score", 0),
-            "reading_time": request.reading_values[1] if len(request.reading_values) > 1 else 0,
-            "logic_time": request.logic_values[1] if len(request.logic_values) > 1 else 0,
-            "writing_time": request.writing_values[1] if len(request.writing_values) > 1 else 0,
-            "memory_time": request.memory_values[1] if len(request.memory_values) > 1 else 0
-        }
-        
+        try:
+            # Get predictions from all petal modules
+            reading_pred, logic_pred, writing_pred, memory_pred = await predict_all_petals_cached(request)
+
+            with tracing.span("aggregate"):
+                result = build_consolidated_result(request, reading_pred, logic_pred, writing_pred, memory_pred)
+        except ExecutorSaturated:
+            raise
+        except Exception as e:
+            result = {
+                "success": False,
+                "error": str(e),
+                "user_id": request.user_id
+            }
+    finally:
+        tracing.finish(trace)
+    if tracing.wants_timings(http_request.headers):
+        result["timings"] = trace.timings()
+    return result
+
+# ============ BATCH PREDICTION ENDPOINTS ============
+
+async def predict_petal_batch(test_type: str, predict_batch, rows: List[List[float]]) -> dict:
+    """Run one vectorized forward pass over all rows of a batch request"""
+    try:
+        predictions = await executor.run(predict_batch, rows) if rows else []
         return {
             "success": True,
-            "user_id": request.user_id,
-            "test_id": request.test_id,
-            "petal_predictions": {
-                "reading": reading_pred,
-                "logic": logic_pred,
-                "writing": writing_pred,
-                "memory": memory_pred
-            },
-            "analysis_data": decision_tree_input,
-            "consolidated_scores": {
-                "avg_reading": round(reading_pred.get("reading_score", 0), 2),
-                "avg_logic": round(logic_pred.get("logic_score", 0), 2),
-                "avg_writing": round(writing_pred.get("writing_score", 0), 2),
-                "avg_memory": round(memory_pred.get("memory_score", 0), 2),
-                "overall_average": round(
-                    (reading_pred.get("reading_score", 0) + 
-                     logic_pred.get("logic_score", 0) + 
-                     writing_pred.get("writing_score", 0) + 
-                     memory_pred.get("memory_score", 0)) / 4,
-                    2
-                )
-            }
+            "test_type": test_type,
+            "count": len(predictions),
+            "predictions": predictions
         }
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         return {
             "success": False,
             "error": str(e),
-            "user_id": request.user_id
+            "test_type": test_type
+        }
+
+@app.post("/predict-reading-batch")
+async def predict_reading_batch(request: PetalBatchRequest):
+    """
+    Predict reading risk for a whole class
+    Input: N rows of 4 normalized values (same order as /predict-reading)
+    """
+    if not PETAL_MODULES_AVAILABLE:
+        return {"error": "Petal modules not available"}
+    return await predict_petal_batch("reading", petal_reading.predict_read_batch, request.rows)
+
+@app.post("/predict-logic-batch")
+async def predict_logic_batch(request: PetalBatchRequest):
+    """
+    Predict logic risk for a whole class
+    Input: N rows of 4 normalized values (same order as /predict-logic)
+    """
+    if not PETAL_MODULES_AVAILABLE:
+        return {"error": "Petal modules not available"}
+    return await predict_petal_batch("logic", petal_logic.predict_logic_batch, request.rows)
+
+@app.post("/predict-writing-batch")
+async def predict_writing_batch(request: PetalBatchRequest):
+    """
+    Predict writing risk for a whole class
+    Input: N rows of 4 normalized values (same order as /predict-writing)
+    """
+    if not PETAL_MODULES_AVAILABLE:
+        return {"error": "Petal modules not available"}
+    return await predict_petal_batch("writing", petal_writing.predict_write_batch, request.rows)
+
+@app.post("/predict-memory-batch")
+async def predict_memory_batch(request: PetalBatchRequest):
+    """
+    Predict memory risk for a whole class
+    Input: N rows of 4 normalized values (same order as /predict-memory)
+    """
+    if not PETAL_MODULES_AVAILABLE:
+        return {"error": "Petal modules not available"}
+    return await predict_petal_batch("memory", petal_memory.predict_mem_batch, request.rows)
+
+def predict_all_petals_batch(students: List[ConsolidatedAnalysisRequest]):
+    """One forward pass per petal model for the whole class (runs on the inference executor)"""
+    return (
+        petal_reading.predict_read_batch([s.reading_values for s in students]),
+        petal_logic.predict_logic_batch([s.logic_values for s in students]),
+        petal_writing.predict_write_batch([s.writing_values for s in students]),
+        petal_memory.predict_mem_batch([s.memory_values for s in students])
+    )
+
+@app.post("/consolidated-analysis-batch")
+async def consolidated_analysis_batch(request: ConsolidatedBatchRequest):
+    """
+    Consolidated analysis for a whole class
+    One forward pass per petal model for all students, then per-student aggregation
+    """
+    try:
+        if not PETAL_MODULES_AVAILABLE:
+            return {"error": "Petal modules not available"}
+
+        students = request.students
+        if not students:
+            return {"success": True, "count": 0, "results": []}
+
+        if CONSOLIDATED_MODE == "fused" and petal_engine.fused_available():
+            predict_batch = predict_petals_fused
+        else:
+            predict_batch = predict_all_petals_batch
+        reading_preds, logic_preds, writing_preds, memory_preds = await executor.run(predict_batch, students)
+
+        results = [
+            build_consolidated_result(student, *preds)
+            for student, preds in zip(students, zip(reading_preds, logic_preds, writing_preds, memory_preds))
+        ]
+        return {
+            "success": True,
+            "count": len(results),
+            "results": results
+        }
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e)
         }
 
 @app.post("/predict-results")
@@ -544,9 +1402,6 @@ async def predict_results(data: dict = Body(...)):
     Returns: petal analysis for flower visualization
     """
     try:
-        import joblib
-        import pandas as pd
-        
         # Extract scores and convert to 0-1 range
         reading_score = data.get("reading_score", 50) / 100
         logic_score = data.get("logic_score", 50) / 100
@@ -571,22 +1426,30 @@ async def predict_results(data: dict = Body(...)):
             "memory_time": memory_time
         }
         
-        # Load and run decision tree
-        MODEL_PATH = "trained/decision_tree_model.pkl"
+        # Run the decision tree (compiled once per process, see tree_engine.py)
         petal_predictions = {}
         
-        if os.path.exists(MODEL_PATH):
+        if tree_engine.model_available():
             try:
-                model = joblib.load(MODEL_PATH)
-                df = pd.DataFrame([dt_input])
-                preds = model.predict(df)[0]
-                
-                petal_predictions = {
-                    "dyslexia": round(float(preds[0]) * 100, 2),
-                    "dyscalculia": round(float(preds[1]) * 100, 2),
-                    "dysgraphia": round(float(preds[2]) * 100, 2),
-                    "adhd": round(float(preds[3]) * 100, 2)
-                }
+                # fallbacks below are never cached
+                version = tree_cache_version()
+                key = vector_key(dt_input.values())
+                cached = result_caches["tree"].get(version, key) if version is not None else None
+                if cached is not None:
+                    petal_predictions = cached
+                else:
+                    preds = await executor.run(tree_engine.get_tree().predict_one, dt_input)
+
+                    petal_predictions = {
+                        "dyslexia": round(float(preds[0]) * 100, 2),
+                        "dyscalculia": round(float(preds[1]) * 100, 2),
+                        "dysgraphia": round(float(preds[2]) * 100, 2),
+                        "adhd": round(float(preds[3]) * 100, 2)
+                    }
+                    if version is not None:
+                        result_caches["tree"].put(version, key, petal_predictions)
+            except ExecutorSaturated:
+                raise
             except Exception as e:
                 print(f"Decision tree error: {e}")
                 # Fallback to inverse scores
@@ -617,6 +1480,8 @@ async def predict_results(data: dict = Body(...)):
             "overall_avg": round(avg_score, 2),
             "petals": petal_predictions
         }
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         return {
             "success": False,
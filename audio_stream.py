@@ -0,0 +1,316 @@
+# audio_stream.py
+# Incremental reading of multipart audio uploads for
+# POST /analyze-test1-audio/stream.
+# The request body is fed through python-multipart's push parser one network
+# chunk at a time, so a part is never held in memory as a whole:
+#   - 16-bit PCM (audio/pcm, or a .wav / audio/wav part holding 16 kHz mono
+#     16-bit samples) is decoded as it arrives and cut into segments of
+#     STREAM_MIN_SEGMENT_S..STREAM_MAX_SEGMENT_S seconds at pauses. api.py
+#     transcribes each segment while the rest of the clip is still uploading.
+#   - any other format (webm, ogg, mp3, ...) needs the whole container to
+#     decode, so it is spooled to a SpooledTemporaryFile (in memory up to
+#     AUDIO_SPOOL_MEMORY_BYTES, then on disk) and transcribed as soon as its
+#     part ends, while the next clip uploads.
+# Per upload this holds one network chunk, one segment buffer and at most
+# STREAM_MAX_PENDING segments waiting for transcription, however long the
+# recording is.
+
+import os
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart >= 0.0.13 without the compatibility shim
+    from python_multipart.multipart import MultipartParser, parse_options_header
+
+AUDIO_SPOOL_MEMORY_BYTES = int(os.environ.get("AUDIO_SPOOL_MEMORY_BYTES", str(1024 * 1024)))
+STREAM_MIN_SEGMENT_S = float(os.environ.get("STREAM_MIN_SEGMENT_S", "8"))
+STREAM_MAX_SEGMENT_S = float(os.environ.get("STREAM_MAX_SEGMENT_S", "28"))
+STREAM_MAX_PENDING = int(os.environ.get("STREAM_MAX_PENDING", "2"))
+
+SAMPLE_RATE = 16000
+# 30 ms analysis frames; a pause is STREAM_PAUSE_MS of frames below SILENCE_RMS (about -40 dBFS)
+FRAME = 480
+STREAM_PAUSE_MS = 300
+SILENCE_RMS = 0.01
+# a segment that reaches STREAM_MAX_SEGMENT_S without a pause is cut at the
+# quietest frame of its last CUT_SEARCH_S seconds
+CUT_SEARCH_S = 5.0
+
+# largest form field (passage text, ids) accepted from a streamed form
+MAX_FIELD_BYTES = 64 * 1024
+# a WAV part whose sample data has not started within this many bytes is spooled instead
+MAX_WAV_HEADER_BYTES = 64 * 1024
+
+PCM_TYPES = {"audio/pcm", "audio/x-pcm", "audio/pcm-s16le"}
+WAV_TYPES = {"audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave"}
+
+
+class PcmSegmenter:
+    """16 kHz mono s16le bytes in, float32 segments cut at pauses out"""
+
+    def __init__(self):
+        self.capacity = int(STREAM_MAX_SEGMENT_S * SAMPLE_RATE) // FRAME * FRAME
+        self.min_samples = int(STREAM_MIN_SEGMENT_S * SAMPLE_RATE)
+        self.pause_frames = max(STREAM_PAUSE_MS * SAMPLE_RATE // 1000 // FRAME, 1)
+        self.buffer = np.empty(self.capacity, dtype=np.float32)
+        self.rms = np.empty(self.capacity // FRAME, dtype=np.float32)
+        self.n = 0           # samples in buffer
+        self.frames = 0      # complete frames with an rms value
+        self.samples = 0     # samples received in total
+        self._carry = b""
+
+    def feed(self, data: bytes) -> List[np.ndarray]:
+        if self._carry:
+            data = self._carry + data
+        usable = len(data) - len(data) % 2
+        self._carry = data[usable:]
+        samples = np.frombuffer(data, dtype="<i2", count=usable // 2)
+        self.samples += len(samples)
+
+        segments = []
+        pos = 0
+        while pos < len(samples):
+            take = min(self.capacity - self.n, len(samples) - pos)
+            np.multiply(samples[pos:pos + take], 1 / 32768, out=self.buffer[self.n:self.n + take], casting="unsafe")
+            self.n += take
+            pos += take
+            self._update_rms()
+            segment = self._cut()
+            while segment is not None:
+                segments.append(segment)
+                segment = self._cut()
+        return segments
+
+    def finish(self) -> List[np.ndarray]:
+        """The rest of the recording"""
+        if self.n == 0:
+            return []
+        segment = self.buffer[:self.n].copy()
+        self.n = self.frames = 0
+        return [segment]
+
+    def _update_rms(self) -> None:
+        complete = self.n // FRAME
+        if complete > self.frames:
+            block = self.buffer[self.frames * FRAME:complete * FRAME].reshape(-1, FRAME)
+            self.rms[self.frames:complete] = np.sqrt(np.mean(block * block, axis=1))
+            self.frames = complete
+
+    def _cut(self) -> Optional[np.ndarray]:
+        if self.n < self.min_samples:
+            return None
+        silent = self.rms[:self.frames] < SILENCE_RMS
+        # last pause long enough, with its middle past the minimum segment length
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], silent.view(np.int8), [0]))))
+        starts, ends = edges[0::2], edges[1::2]
+        middles = (starts + ends) // 2
+        usable = (ends - starts >= self.pause_frames) & (middles * FRAME >= self.min_samples)
+        if usable.any():
+            return self._split(int(middles[usable][-1]) * FRAME)
+        if self.n >= self.capacity:
+            first = max(self.frames - int(CUT_SEARCH_S * SAMPLE_RATE / FRAME), 1)
+            quietest = first + int(np.argmin(self.rms[first:self.frames]))
+            return self._split(quietest * FRAME)
+        return None
+
+    def _split(self, cut: int) -> np.ndarray:
+        segment = self.buffer[:cut].copy()
+        rest = self.n - cut
+        self.buffer[:rest] = self.buffer[cut:self.n]
+        cut_frames = cut // FRAME
+        self.rms[:self.frames - cut_frames] = self.rms[cut_frames:self.frames]
+        self.n = rest
+        self.frames -= cut_frames
+        return segment
+
+
+def parse_wav_header(header: bytes) -> Tuple[Optional[Dict[str, int]], int]:
+    """
+    (format, offset of the sample data) once the RIFF header up to the "data"
+    chunk is complete; (None, 0) while more bytes are needed. Raises
+    ValueError for something that is not a WAV file.
+    """
+    if len(header) < 12:
+        return None, 0
+    if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise ValueError("not a RIFF/WAVE file")
+    fmt: Dict[str, int] = {}
+    pos = 12
+    while pos + 8 <= len(header):
+        chunk_id, size = header[pos:pos + 4], int.from_bytes(header[pos + 4:pos + 8], "little")
+        body = pos + 8
+        if chunk_id == b"data":
+            return fmt, body
+        if body + size > len(header):
+            return None, 0
+        if chunk_id == b"fmt " and size >= 16:
+            fmt = {
+                "audio_format": int.from_bytes(header[body:body + 2], "little"),
+                "channels": int.from_bytes(header[body + 2:body + 4], "little"),
+                "sample_rate": int.from_bytes(header[body + 4:body + 8], "little"),
+                "bits": int.from_bytes(header[body + 14:body + 16], "little"),
+            }
+        pos = body + size + (size & 1)
+    return None, 0
+
+
+def _is_pcm16_mono(fmt: Dict[str, int]) -> bool:
+    return (fmt.get("audio_format") in (1, 0xFFFE) and fmt.get("channels") == 1
+            and fmt.get("sample_rate") == SAMPLE_RATE and fmt.get("bits") == 16)
+
+
+class ClipStream:
+    """
+    One uploaded audio part. feed() returns the pieces that can be
+    transcribed now, finish() the rest: float32 arrays for PCM, or the spooled
+    file for other formats. A spool returned by finish() belongs to the
+    caller (see transcription.transcribe_piece); close() only closes one that
+    was never handed out.
+    """
+
+    def __init__(self, filename: str, content_type: str):
+        self.filename = filename
+        self.bytes = 0
+        extension = os.path.splitext(filename or "")[1].lower()
+        if content_type in PCM_TYPES:
+            self.mode = "pcm"
+        elif content_type in WAV_TYPES or extension == ".wav":
+            self.mode = "wav"
+        else:
+            self.mode = "spool"
+        self.segmenter = PcmSegmenter() if self.mode != "spool" else None
+        self.spool: Optional[Any] = None
+        self._header = bytearray()
+        self.pieces = 0
+
+    def _spool(self, data: bytes) -> None:
+        if self.spool is None:
+            self.spool = tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_MEMORY_BYTES)
+        self.spool.write(data)
+
+    def feed(self, data: bytes) -> List[Any]:
+        self.bytes += len(data)
+        if self.mode == "wav":
+            self._header += data
+            try:
+                fmt, offset = parse_wav_header(bytes(self._header))
+            except ValueError:
+                fmt, offset = {}, -1
+            if fmt is None and len(self._header) <= MAX_WAV_HEADER_BYTES:
+                return []
+            if fmt is not None and offset >= 0 and _is_pcm16_mono(fmt):
+                self.mode = "pcm"
+                data = bytes(self._header[offset:])
+            else:
+                # compressed, stereo or resampled WAV: let the decoder handle the whole file
+                self.mode, self.segmenter = "spool", None
+                data = bytes(self._header)
+            self._header = bytearray()
+        if self.mode == "pcm":
+            segments = self.segmenter.feed(data)
+            self.pieces += len(segments)
+            return segments
+        self._spool(data)
+        return []
+
+    def finish(self) -> List[Any]:
+        if self.mode == "wav" and self._header:
+            self.mode, self.segmenter = "spool", None
+            self._spool(bytes(self._header))
+        if self.mode == "pcm":
+            pieces = self.segmenter.finish()
+        elif self.spool is not None:
+            self.spool.seek(0)
+            pieces, self.spool = [self.spool], None
+        else:
+            pieces = []
+        self.pieces += len(pieces)
+        return pieces
+
+    def close(self) -> None:
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+
+class FormStream:
+    """
+    Push parser for a multipart/form-data body. write() takes the next chunk
+    and returns the events it completed, in order:
+        ("field", name, value)
+        ("file_begin", name, filename, content_type)
+        ("file_data", bytes)
+        ("file_end",)
+    """
+
+    def __init__(self, content_type: str):
+        ctype, params = parse_options_header(content_type)
+        if ctype != b"multipart/form-data" or b"boundary" not in params:
+            raise ValueError("expected multipart/form-data with a boundary")
+        self.events: List[tuple] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._name = ""
+        self._is_file = False
+        self._value = bytearray()
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def write(self, chunk: bytes) -> List[tuple]:
+        self._parser.write(chunk)
+        events, self.events = self.events, []
+        return events
+
+    def finalize(self) -> List[tuple]:
+        self._parser.finalize()
+        events, self.events = self.events, []
+        return events
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, disposition = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = disposition.get(b"name", b"").decode("latin-1")
+        self._is_file = b"filename" in disposition
+        if self._is_file:
+            content_type, _ = parse_options_header(self._headers.get(b"content-type", b""))
+            self.events.append(("file_begin", self._name, disposition[b"filename"].decode("utf-8", "replace"),
+                                content_type.decode("latin-1").lower()))
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._is_file:
+            self.events.append(("file_data", bytes(data[start:end])))
+        else:
+            self._value += data[start:end]
+            if len(self._value) > MAX_FIELD_BYTES:
+                raise ValueError(f"form field {self._name!r} is larger than {MAX_FIELD_BYTES} bytes")
+
+    def _on_part_end(self) -> None:
+        if self._is_file:
+            self.events.append(("file_end",))
+        else:
+            self.events.append(("field", self._name, self._value.decode("utf-8", "replace")))
@@ -1,20 +1,235 @@
 # data_logger.py
 # Very small, focused logger: append one JSON entry per line (NDJSON).
-# Stores only the fields necessary: timestamp, user_id, test_id, test_type, array.
+# Stores only the fields necessary: timestamp, user_id, test_id, test_type, array,
+# plus the numeric request fields ("input") so the history can be re-scored
+# when scoring rules change (see scoring.py). Free text is not stored.
 # This keeps the implementation minimal and avoids reading/writing a full JSON array.
+#
+# Entries are handed to a background writer thread through a bounded in-memory
+# queue, so log_test_data() never touches the disk on the request path. The
+# writer keeps one open file handle and group-commits entries: a batch is
+# written with a single write() once LOG_BATCH_SIZE entries are waiting or
+# LOG_FLUSH_INTERVAL_MS has passed. When the queue is full the entry waits up
+# to LOG_BLOCK_TIMEOUT_MS (0 = not at all) and is then dropped and counted;
+# only synchronous callers wait: on an event-loop thread (the async endpoints)
+# a full queue drops the entry at once rather than stalling every request.
+# shutdown() (also registered with atexit) drains the queue before exiting.
+# Set LOG_ASYNC=0 to write every entry synchronously instead.
+# The file is rolled into compressed segments by size or day, with a manifest
+# of segment time ranges and record counts (see log_rotation.py).
+# Every written batch is also inserted into the indexed SQLite history store
+# (history_store.py) in one transaction; set HISTORY_ENABLED=0 to skip it.
 
-import json
+import asyncio
+import atexit
 import os
+import queue
+import threading
+import time
 from datetime import datetime
 from typing import Any, Dict, List
 
+import history_store
+import metrics
+from log_rotation import RotatingLog
+
 LOG_FILE = os.environ.get("LOG_FILE", "test_data_logs.ndjson")
+LOG_ASYNC = os.environ.get("LOG_ASYNC", "1") != "0"
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL_MS = float(os.environ.get("LOG_FLUSH_INTERVAL_MS", "200"))
+LOG_BLOCK_TIMEOUT_MS = float(os.environ.get("LOG_BLOCK_TIMEOUT_MS", "0"))
 
 
 def _utc_iso() -> str:
     return datetime.utcnow().isoformat() + "Z"
 
 
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class _BufferedWriter:
+    """Background thread that group-commits queued entries to LOG_FILE"""
+
+    def __init__(self, path: str, queue_size: int, batch_size: int, flush_interval_ms: float,
+                 block_timeout_ms: float):
+        self.path = path
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = max(flush_interval_ms, 0.0) / 1000
+        self.block_timeout = max(block_timeout_ms, 0.0) / 1000
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(queue_size, 1))
+        self._stop = object()
+        self._log = RotatingLog(path)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="data-logger", daemon=True)
+        self._thread.start()
+
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.backpressure = 0
+        self.write_errors = 0
+        self.history_written = 0
+        self.history_errors = 0
+        self.max_queue_depth = 0
+
+    def submit(self, entry: Dict[str, Any]) -> bool:
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.backpressure += 1
+            try:
+                if self.block_timeout <= 0 or _on_event_loop():
+                    raise queue.Full
+                self._queue.put(entry, timeout=self.block_timeout)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+                return False
+        with self._lock:
+            self.enqueued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return True
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is self._stop:
+                self._queue.task_done()
+                break
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._stop:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stop:
+                break
+        self._log.shutdown()
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            with metrics.timer(metrics.LOG_WRITE_SECONDS, stage="write"):
+                self._log.write(batch)
+            with self._lock:
+                self.written += len(batch)
+                self.batches += 1
+        except Exception as e:
+            # keep logging non-fatal for the API; print the error for debugging
+            print(f"⚠️ data_logger: failed to write {len(batch)} log entries: {e}")
+            with self._lock:
+                self.write_errors += 1
+                self.dropped += len(batch)
+            self._log.close()
+        else:
+            self._record_history(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _record_history(self, batch: List[Dict[str, Any]]) -> None:
+        if not history_store.HISTORY_ENABLED:
+            return
+        try:
+            with metrics.timer(metrics.LOG_WRITE_SECONDS, stage="history"):
+                history_store.insert_many(batch)
+            with self._lock:
+                self.history_written += len(batch)
+        except Exception as e:
+            # the NDJSON log is the source of truth; `history_store.py backfill` can catch up
+            print(f"⚠️ data_logger: failed to record {len(batch)} entries in history: {e}")
+            with self._lock:
+                self.history_errors += 1
+
+    def flush(self) -> None:
+        """Block until every queued entry has been written"""
+        self._queue.join()
+
+    def shutdown(self) -> None:
+        """Write everything queued, then stop the writer thread (idempotent)"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(self._stop)
+        self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "file": self.path,
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "max_queue_depth": self.max_queue_depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+            "dropped": self.dropped,
+            "backpressure": self.backpressure,
+            "write_errors": self.write_errors,
+            "history_written": self.history_written,
+            "history_errors": self.history_errors,
+            "rotation": self._log.stats(),
+        }
+
+
+_writer: _BufferedWriter | None = None
+_writer_lock = threading.Lock()
+_sync_log: RotatingLog | None = None
+
+
+def _get_writer() -> _BufferedWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _BufferedWriter(
+                    LOG_FILE, LOG_QUEUE_SIZE, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL_MS, LOG_BLOCK_TIMEOUT_MS
+                )
+    return _writer
+
+
+def _write_now(entry: Dict[str, Any]) -> None:
+    global _sync_log
+    try:
+        # append one JSON object per line (NDJSON)
+        with _writer_lock:
+            if _sync_log is None:
+                _sync_log = RotatingLog(LOG_FILE)
+            _sync_log.write([entry])
+    except Exception as e:
+        # keep logging non-fatal for the API; print the error for debugging
+        print(f"⚠️ data_logger: failed to write log entry: {e}")
+        return
+    if history_store.HISTORY_ENABLED:
+        try:
+            history_store.insert_many([entry])
+        except Exception as e:
+            print(f"⚠️ data_logger: failed to record log entry in history: {e}")
+
+
+def _numeric_fields(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Numeric request fields (counts, times, scores) worth keeping for re-scoring"""
+    return {
+        key: value for key, value in (input_data or {}).items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
 def log_test_data(
     user_id: str,
     test_id: str,
@@ -24,12 +239,14 @@ def log_test_data(
     extra_data: Dict[str, Any] | None = None
 ) -> None:
     """
-    Append a minimal log entry to LOG_FILE as one JSON object per line.
+    Queue a minimal log entry for LOG_FILE (one JSON object per line).
 
     Only the API-generated array (output_array) is required to be stored;
-    we also save a small header (timestamp, ids, type) so entries are useful later.
-    This function will create the file (and parent dir) if needed and will
-    never raise — errors are printed and swallowed so logging won't break the API.
+    we also save a small header (timestamp, ids, type) so entries are useful later,
+    and the numeric fields of input_data that the array was computed from.
+    The background writer creates the file (and parent dir) if needed. This
+    function never raises and never blocks on disk I/O — write errors are
+    printed and counted, and a full queue drops the entry (see stats()).
     """
     entry = {
         "timestamp": _utc_iso(),
@@ -38,19 +255,45 @@ def log_test_data(
         "test_type": test_type,
         "array": output_array
     }
+    scoring_input = _numeric_fields(input_data)
+    if scoring_input:
+        entry["input"] = scoring_input
     if extra_data is not None:
         entry["extra_data"] = extra_data
 
+    if not LOG_ASYNC:
+        with metrics.timer(metrics.LOG_WRITE_SECONDS, stage="sync"):
+            _write_now(entry)
+        return
     try:
-        # ensure directory exists
-        dirpath = os.path.dirname(LOG_FILE)
-        if dirpath:
-            os.makedirs(dirpath, exist_ok=True)
-
-        # append one JSON object per line (NDJSON)
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry, ensure_ascii=False))
-            f.write("\n")
+        with metrics.timer(metrics.LOG_WRITE_SECONDS, stage="enqueue"):
+            _get_writer().submit(entry)
     except Exception as e:
-        # keep logging non-fatal for the API; print the error for debugging
-        print(f"⚠️ data_logger: failed to write log entry: {e}")
\ No newline at end of file
+        print(f"⚠️ data_logger: failed to queue log entry: {e}")
+
+
+def flush() -> None:
+    """Wait until every queued entry is on disk"""
+    if _writer is not None:
+        _writer.flush()
+
+
+def shutdown() -> None:
+    """Drain the queue, close the file and stop the writer thread"""
+    global _writer, _sync_log
+    with _writer_lock:
+        if _writer is not None:
+            _writer.shutdown()
+            _writer = None
+        if _sync_log is not None:
+            _sync_log.shutdown()
+            _sync_log = None
+
+
+def stats() -> Dict[str, Any]:
+    if _writer is None:
+        return {"file": LOG_FILE, "async": LOG_ASYNC, "started": False}
+    return dict(_writer.stats(), **{"async": LOG_ASYNC, "started": True})
+
+
+atexit.register(shutdown)
@@ -1,15 +1,14 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-import pandas as pd
-import joblib
-import os
 from typing import Dict
 
+import tree_engine
+
 app = FastAPI()
 
 # Paths - Ensure these directories exist
-MODEL_PATH = "trained/decision_tree_model.pkl"
-TARGETS = ["dyslexia", "dyscalculia", "dysgraphia", "adhd"]
+MODEL_PATH = tree_engine.MODEL_PATH
+TARGETS = tree_engine.TARGETS
 
 class TestData(BaseModel):
     # Features used by the decision tree
@@ -24,7 +23,7 @@ class TestData(BaseModel):
 
 @app.post("/predict-results")
 async def get_prediction(data: TestData):
-    if not os.path.exists(MODEL_PATH):
+    if not tree_engine.model_available():
         # Fallback logic if model file is missing during dev
         avg_score = (data.reading_score + data.logic_score + data.writing_score + data.memory_score) / 4
         return {
@@ -40,10 +39,8 @@ async def get_prediction(data: TestData):
         }
     
     try:
-        model = joblib.load(MODEL_PATH)
-        user_features = data.dict()
-        df = pd.DataFrame([user_features])
-        preds = model.predict(df)[0]
+        # loaded and compiled once per process; no pandas/sklearn per request
+        preds = tree_engine.get_tree().predict_one(data.dict())
         
         avg_score = (data.reading_score + data.logic_score + data.writing_score + data.memory_score) / 4
         
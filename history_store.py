@@ -0,0 +1,191 @@
+# history_store.py
+# Indexed per-user store of test results (SQLite, stdlib only).
+# data_logger's writer inserts every batch it writes to the NDJSON log into
+# HISTORY_DB as well, so "all tests for user X" and "latest result per test
+# type" are index lookups instead of a scan of the whole log. Rows appear
+# once the writer has flushed (within LOG_FLUSH_INTERVAL_MS).
+#
+#   python history_store.py backfill   # import entries already in LOG_FILE and its segments
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+HISTORY_DB = os.environ.get("HISTORY_DB", "test_history.db")
+HISTORY_ENABLED = os.environ.get("HISTORY_ENABLED", "1") != "0"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS test_results (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    test_id TEXT NOT NULL,
+    test_type TEXT NOT NULL,
+    array TEXT NOT NULL,
+    extra_data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_user_type_time ON test_results (user_id, test_type, timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_user_time ON test_results (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_test ON test_results (test_id);
+CREATE INDEX IF NOT EXISTS idx_results_type_time ON test_results (test_type, timestamp);
+"""
+
+# one row per logged entry, so backfill can be re-run without duplicating history
+NATURAL_KEY = "timestamp, user_id, test_id, test_type"
+UNIQUE_INDEX = f"CREATE UNIQUE INDEX IF NOT EXISTS idx_results_entry ON test_results ({NATURAL_KEY})"
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _connect(path: str = HISTORY_DB) -> sqlite3.Connection:
+    """One connection per thread and database file"""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        dirpath = os.path.dirname(path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock:
+            if path not in _schema_ready:
+                conn.executescript(SCHEMA)
+                _add_unique_index(conn)
+                _schema_ready.add(path)
+        connections[path] = conn
+    return conn
+
+
+def _add_unique_index(conn: sqlite3.Connection) -> None:
+    """Databases created before the unique index may hold backfill duplicates; drop them first"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_results_entry'"
+    ).fetchone()
+    if exists:
+        return
+    with conn:
+        conn.execute(
+            f"DELETE FROM test_results WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM test_results GROUP BY {NATURAL_KEY})"
+        )
+        conn.execute(UNIQUE_INDEX)
+
+
+def insert_many(entries: Iterable[Dict[str, Any]], path: str = HISTORY_DB) -> int:
+    """Insert log entries (data_logger format) in one transaction; returns how many were new
+
+    Entries already stored (same timestamp, user_id, test_id and test_type) are skipped.
+    """
+    rows = [
+        (
+            entry.get("timestamp", ""),
+            str(entry.get("user_id", "unknown")),
+            str(entry.get("test_id", "")),
+            str(entry.get("test_type", "")),
+            json.dumps(entry.get("array", []), ensure_ascii=False),
+            json.dumps(entry["extra_data"], ensure_ascii=False) if entry.get("extra_data") is not None else None,
+        )
+        for entry in entries
+    ]
+    if not rows:
+        return 0
+    conn = _connect(path)
+    with conn:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO test_results (timestamp, user_id, test_id, test_type, array, extra_data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        return conn.total_changes - before
+
+
+def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    result = {
+        "timestamp": row["timestamp"],
+        "user_id": row["user_id"],
+        "test_id": row["test_id"],
+        "test_type": row["test_type"],
+        "array": json.loads(row["array"]),
+    }
+    if row["extra_data"] is not None:
+        result["extra_data"] = json.loads(row["extra_data"])
+    return result
+
+
+def user_history(user_id: str, test_type: Optional[str] = None, limit: int = 100,
+                 before: Optional[str] = None, path: str = HISTORY_DB) -> List[Dict[str, Any]]:
+    """A user's results, newest first (optionally one test type / older than `before`)"""
+    query = "SELECT * FROM test_results WHERE user_id = ?"
+    params: List[Any] = [user_id]
+    if test_type:
+        query += " AND test_type = ?"
+        params.append(test_type)
+    if before:
+        query += " AND timestamp < ?"
+        params.append(before)
+    query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    params.append(max(int(limit), 0))
+    return [_row_to_dict(row) for row in _connect(path).execute(query, params)]
+
+
+def latest_results(user_id: str, path: str = HISTORY_DB) -> Dict[str, Dict[str, Any]]:
+    """The most recent result of each test type for a user"""
+    rows = _connect(path).execute(
+        """
+        SELECT t.* FROM test_results t
+        JOIN (
+            SELECT test_type, MAX(timestamp) AS latest FROM test_results
+            WHERE user_id = ? GROUP BY test_type
+        ) m ON t.test_type = m.test_type AND t.timestamp = m.latest
+        WHERE t.user_id = ?
+        ORDER BY t.id
+        """,
+        (user_id, user_id),
+    )
+    # later inserts with the same timestamp win
+    return {row["test_type"]: _row_to_dict(row) for row in rows}
+
+
+def test_results(test_id: str, path: str = HISTORY_DB) -> List[Dict[str, Any]]:
+    """Every result logged under one test_id, oldest first"""
+    rows = _connect(path).execute(
+        "SELECT * FROM test_results WHERE test_id = ? ORDER BY timestamp, id", (test_id,)
+    )
+    return [_row_to_dict(row) for row in rows]
+
+
+def count(path: str = HISTORY_DB) -> int:
+    return _connect(path).execute("SELECT COUNT(*) FROM test_results").fetchone()[0]
+
+
+def backfill(log_file: str, path: str = HISTORY_DB, batch_size: int = 1000) -> int:
+    """Import entries written to log_file (and its rotated segments) that are not stored yet"""
+    from log_rotation import iter_entries
+
+    total, batch = 0, []
+    for entry in iter_entries(log_file):
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            total += insert_many(batch, path)
+            batch = []
+    return total + insert_many(batch, path)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "backfill":
+        from data_logger import LOG_FILE
+        print(f"imported {backfill(LOG_FILE)} entries from {LOG_FILE} into {HISTORY_DB}")
+    else:
+        print("usage: python history_store.py backfill")
+        sys.exit(2)
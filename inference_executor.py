@@ -0,0 +1,105 @@
+# inference_executor.py
+# Bounded thread pool for blocking work called from async handlers.
+# Model inference, decision-tree evaluation and file writes run here so a slow
+# call never stalls the event loop. At most `workers` calls run at once and at
+# most `queue_size` more may wait; beyond that run() raises ExecutorSaturated
+# and api.py answers 503 instead of letting the backlog grow without limit.
+# Calls run in a copy of the caller's context, so per-request state such as
+# the current trace (tracing.py) is visible on the worker thread.
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+INFERENCE_QUEUE_SIZE = int(os.environ.get("INFERENCE_QUEUE_SIZE", "64"))
+
+
+class ExecutorSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full"""
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor with an admission limit and queue-depth counters"""
+
+    def __init__(self, workers: int = INFERENCE_WORKERS, queue_size: int = INFERENCE_QUEUE_SIZE,
+                 name: str = "inference"):
+        self.workers = max(int(workers), 1)
+        self.queue_size = max(int(queue_size), 0)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+
+        self.inflight = 0   # admitted and not finished (running + queued)
+        self.running = 0
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Admitted tasks waiting for a free worker"""
+        return max(self.inflight - self.workers, 0)
+
+    def _call(self, fn: Callable[..., Any]) -> Any:
+        with self._lock:
+            self.running += 1
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run fn(*args, **kwargs) on a worker thread and await its result"""
+        with self._lock:
+            if self.inflight >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise ExecutorSaturated(
+                    f"{self.inflight} tasks in flight ({self.workers} workers, queue {self.queue_size})"
+                )
+            self.inflight += 1
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        try:
+            future = self._pool.submit(self._call, call)
+        except Exception:
+            self._release(None)
+            raise
+        # the slot is released when the work itself ends, not when the awaiting
+        # request does: a cancelled request leaves its call running on the pool
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future: "Future[Any] | None") -> None:
+        with self._lock:
+            self.inflight -= 1
+            self.completed += 1
+            if future is None or future.cancelled() or future.exception() is not None:
+                self.failed += 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "running": self.running,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+executor = BoundedExecutor()
@@ -0,0 +1,429 @@
+# log_rotation.py
+# Segmented storage for the test data log (used by data_logger).
+# The live segment is always LOG_FILE. It is rolled over when it would grow
+# past LOG_ROTATE_BYTES or when the first entry of a new UTC day arrives;
+# the closed segment is renamed to <stem>.<seq>.<YYYYMMDD>.ndjson and then
+# compressed (gzip, or zstd when LOG_COMPRESSION=zstd and the zstandard
+# package is installed) by a background thread. A manifest next to the log,
+# <LOG_FILE>.manifest.json, lists every closed segment with its time range
+# and record count, so readers can open only the segments they need (see
+# iter_entries). A segment is listed as soon as it is rotated, with
+# "compression": null until the background thread has compressed it, so its
+# entries stay readable while compression is pending or if it fails.
+# LOG_MAX_SEGMENTS > 0 deletes the oldest segments beyond that count to keep
+# disk usage bounded.
+#
+# Several API worker processes may append to the same LOG_FILE. Every write,
+# rotation and manifest update holds an exclusive fcntl.flock on
+# <LOG_FILE>.lock, and a writer whose open file is no longer the inode at
+# LOG_FILE (another process rotated it) reopens before writing, so no entry
+# lands in a segment that has already been renamed away. Without fcntl
+# (Windows) there is no cross-process lock: run a single writer process there.
+
+import glob
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer process only
+    fcntl = None
+
+LOG_ROTATE_BYTES = int(os.environ.get("LOG_ROTATE_BYTES", str(64 * 1024 * 1024)))
+LOG_ROTATE_DAILY = os.environ.get("LOG_ROTATE_DAILY", "1") != "0"
+LOG_COMPRESSION = os.environ.get("LOG_COMPRESSION", "gzip")
+LOG_MAX_SEGMENTS = int(os.environ.get("LOG_MAX_SEGMENTS", "0"))
+
+# <stem>.<seq>.<YYYYMMDD>.ndjson[.gz|.zst]
+_SEGMENT_RE = re.compile(r"\.(\d+)\.[^.]+\.ndjson(\.gz|\.zst)?$")
+
+try:
+    import zstandard  # type: ignore
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+
+def manifest_path(log_file: str) -> str:
+    return log_file + ".manifest.json"
+
+
+def _stem(log_file: str) -> str:
+    root, ext = os.path.splitext(log_file)
+    return root if ext == ".ndjson" else log_file
+
+
+def read_manifest(log_file: str) -> Dict[str, Any]:
+    try:
+        with open(manifest_path(log_file), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"segments": []}
+
+
+def _write_manifest(log_file: str, manifest: Dict[str, Any]) -> None:
+    path = manifest_path(log_file)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _entry_timestamp(line: str) -> Optional[str]:
+    try:
+        return json.loads(line).get("timestamp")
+    except ValueError:
+        return None
+
+
+def _scan(path: str, start: int = 0) -> Dict[str, Any]:
+    """Record count and first/last timestamp of an uncompressed NDJSON file from byte offset start"""
+    records, first, last = 0, None, None
+    with open(path, "rb") as f:
+        f.seek(start)
+        for raw in f:
+            line = raw.decode("utf-8", "replace")
+            if not line.strip():
+                continue
+            records += 1
+            ts = _entry_timestamp(line)
+            if ts:
+                first = first or ts
+                last = ts
+    return {"records": records, "first_timestamp": first, "last_timestamp": last}
+
+
+def _next_seq(log_file: str) -> int:
+    """Sequence number for the next closed segment, from the files on disk and the manifest"""
+    existing = [m for m in map(_SEGMENT_RE.search, glob.glob(glob.escape(_stem(log_file)) + ".*.ndjson*")) if m]
+    return max([int(m.group(1)) for m in existing] + [read_manifest(log_file).get("next_seq", 1) - 1]) + 1
+
+
+def _segment_entry(info: Dict[str, Any], path: str, compression: Optional[str], raw_bytes: int) -> Dict[str, Any]:
+    return dict(info, **{
+        "file": os.path.basename(path),
+        "compression": compression,
+        "bytes": os.path.getsize(path),
+        "raw_bytes": raw_bytes,
+    })
+
+
+def _open_segment(path: str):
+    if path.endswith(".zst"):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        import io
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+class RotatingLog:
+    """Append-only NDJSON file with size/day rotation and compressed segments"""
+
+    def __init__(self, path: str, max_bytes: int = LOG_ROTATE_BYTES, daily: bool = LOG_ROTATE_DAILY,
+                 compression: str = LOG_COMPRESSION, max_segments: int = LOG_MAX_SEGMENTS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.daily = daily
+        if compression == "zstd" and not ZSTD_AVAILABLE:
+            print("⚠️ log_rotation: zstandard not installed, compressing segments with gzip")
+            compression = "gzip"
+        self.compression = compression
+        self.max_segments = max_segments
+
+        self._file = None
+        self._bytes = 0
+        self._records = 0
+        self._first_ts: Optional[str] = None
+        self._last_ts: Optional[str] = None
+
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._pending: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._compressor = threading.Thread(target=self._compress_loop, name="log-compressor", daemon=True)
+        self._compressor.start()
+
+        self.rotations = 0
+
+        # segments left behind by an interrupted rotation are compressed now
+        for leftover in sorted(glob.glob(glob.escape(_stem(path)) + ".*.ndjson")):
+            if _SEGMENT_RE.search(leftover):
+                self._pending.put(leftover)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Exclusive against the other threads of this process and, via flock, other processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            if self._lock_file is None:
+                dirpath = os.path.dirname(self.path)
+                if dirpath:
+                    os.makedirs(dirpath, exist_ok=True)
+                self._lock_file = open(self.path + ".lock", "a")
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _open(self) -> None:
+        dirpath = os.path.dirname(self.path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            info = _scan(self.path)
+            self._records = info["records"]
+            self._first_ts, self._last_ts = info["first_timestamp"], info["last_timestamp"]
+        else:
+            self._records, self._first_ts, self._last_ts = 0, None, None
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._bytes = self._file.tell()
+
+    def _sync(self) -> None:
+        """Reopen if another process rotated LOG_FILE, and count what other processes appended"""
+        if self._file is not None:
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != os.fstat(self._file.fileno()).st_ino:
+                self.close()
+        if self._file is None:
+            self._open()
+            return
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self._bytes:
+            self.close()
+            self._open()
+        elif size > self._bytes:
+            info = _scan(self.path, self._bytes)
+            self._records += info["records"]
+            self._first_ts = self._first_ts or info["first_timestamp"]
+            self._last_ts = info["last_timestamp"] or self._last_ts
+            self._bytes = size
+
+    def _needs_rotation(self, size: int, first_ts: Optional[str]) -> bool:
+        if self._records == 0:
+            return False
+        if self.max_bytes > 0 and self._bytes + size > self.max_bytes:
+            return True
+        if self.daily and first_ts and self._first_ts and first_ts[:10] != self._first_ts[:10]:
+            return True
+        return False
+
+    def write(self, entries: List[Dict[str, Any]]) -> None:
+        """Append entries (dicts with an ISO "timestamp"), rotating first if needed"""
+        if not entries:
+            return
+        with self._locked():
+            self._sync()
+            # split at day boundaries so every segment covers a single UTC day
+            start = 0
+            while start < len(entries):
+                end = start + 1
+                while end < len(entries) and not (
+                    self.daily and entries[end].get("timestamp", "")[:10] != entries[start].get("timestamp", "")[:10]
+                ):
+                    end += 1
+                self._write_chunk(entries[start:end])
+                start = end
+
+    def _write_chunk(self, entries: List[Dict[str, Any]]) -> None:
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        size = len(data.encode("utf-8"))
+        if self._needs_rotation(size, entries[0].get("timestamp")):
+            self._rotate()
+            self._open()
+        self._file.write(data)
+        self._file.flush()
+        self._bytes += size
+        self._records += len(entries)
+        self._first_ts = self._first_ts or entries[0].get("timestamp")
+        self._last_ts = entries[-1].get("timestamp") or self._last_ts
+
+    def rotate(self) -> Optional[str]:
+        """Close the live segment and queue it for compression"""
+        with self._locked():
+            self._sync()
+            return self._rotate()
+
+    def _rotate(self) -> Optional[str]:
+        self.close()
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return None
+        day = (self._first_ts or "")[:10].replace("-", "") or "undated"
+        closed = f"{_stem(self.path)}.{_next_seq(self.path):06d}.{day}.ndjson"
+        os.replace(self.path, closed)
+        self.rotations += 1
+        info = {"records": self._records, "first_timestamp": self._first_ts, "last_timestamp": self._last_ts}
+        manifest = read_manifest(self.path)
+        manifest["segments"].append(_segment_entry(info, closed, None, os.path.getsize(closed)))
+        manifest["segments"].sort(key=lambda s: s["file"])
+        manifest["next_seq"] = max(manifest.get("next_seq", 1), int(_SEGMENT_RE.search(closed).group(1)) + 1)
+        _write_manifest(self.path, manifest)
+        self._records, self._bytes, self._first_ts, self._last_ts = 0, 0, None, None
+        self._pending.put(closed)
+        return closed
+
+    def close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+
+    def shutdown(self) -> None:
+        """Close the live segment and finish compressing closed ones"""
+        self.close()
+        self._pending.put(None)
+        self._compressor.join()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _compress_loop(self) -> None:
+        while True:
+            closed = self._pending.get()
+            if closed is None:
+                break
+            try:
+                self._compress(closed)
+            except Exception as e:
+                print(f"⚠️ log_rotation: failed to compress {closed}: {e}")
+
+    def _compress(self, closed: str) -> None:
+        # compress outside the lock; another process may be compressing the same
+        # leftover segment, so the tmp name is ours and the first to finish wins
+        try:
+            info = _scan(closed)
+            raw_bytes = os.path.getsize(closed)
+        except FileNotFoundError:
+            return
+        target = closed + (".zst" if self.compression == "zstd" else ".gz")
+        tmp = f"{target}.{os.getpid()}.tmp"
+        if self.compression == "zstd":
+            with open(closed, "rb") as src, open(tmp, "wb") as dst:
+                zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+        else:
+            with open(closed, "rb") as src, gzip.open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+
+        seq = int(_SEGMENT_RE.search(closed).group(1))
+        with self._locked():
+            if not os.path.exists(closed):
+                os.remove(tmp)
+                return
+            os.replace(tmp, target)
+            os.remove(closed)
+            manifest = read_manifest(self.path)
+            # replace the uncompressed listing from _rotate (absent for leftovers of a crash)
+            manifest["segments"] = [s for s in manifest["segments"] if s["file"] != os.path.basename(closed)]
+            manifest["segments"].append(_segment_entry(info, target, self.compression, raw_bytes))
+            manifest["segments"].sort(key=lambda s: s["file"])
+            manifest["next_seq"] = max(manifest.get("next_seq", 1), seq + 1)
+            if self.max_segments > 0:
+                while len(manifest["segments"]) > self.max_segments:
+                    oldest = manifest["segments"].pop(0)
+                    try:
+                        os.remove(os.path.join(os.path.dirname(self.path), oldest["file"]))
+                    except FileNotFoundError:
+                        pass
+            _write_manifest(self.path, manifest)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_bytes": self._bytes,
+            "active_records": self._records,
+            "rotations": self.rotations,
+            "pending_compression": self._pending.qsize(),
+            "segments": len(read_manifest(self.path)["segments"]),
+        }
+
+
+@contextmanager
+def _shared_lock(log_file: str) -> Iterator[None]:
+    """Shared flock on <LOG_FILE>.lock: no rotation can happen while it is held"""
+    try:
+        lock_file = open(log_file + ".lock", "a") if fcntl is not None else None
+    except OSError:  # read-only directory: read without the lock
+        lock_file = None
+    if lock_file is None:
+        yield
+        return
+    with lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _open_listed(path: str):
+    """Open a segment from the manifest; an uncompressed one may have been compressed since"""
+    candidates = [path]
+    if path.endswith(".ndjson"):
+        candidates += [path + ".gz", path + ".zst"]
+    for candidate in candidates:
+        try:
+            return _open_segment(candidate)
+        except FileNotFoundError:
+            continue
+    return None  # removed by LOG_MAX_SEGMENTS meanwhile
+
+
+def _matching(f, start: Optional[str], end: Optional[str]) -> Iterator[Dict[str, Any]]:
+    for line in f:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        ts = entry.get("timestamp", "")
+        if (start and ts < start) or (end and ts > end):
+            continue
+        yield entry
+
+
+def iter_entries(log_file: str, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Entries with start <= timestamp <= end (ISO strings, either bound
+    optional), oldest first. Only segments whose manifest time range overlaps
+    the window are opened; the live LOG_FILE is always read last. The manifest
+    and the live file are taken together under the lock, so a rotation in
+    between cannot hide or repeat a segment.
+    """
+    directory = os.path.dirname(log_file)
+    with _shared_lock(log_file):
+        segments = read_manifest(log_file)["segments"]
+        try:
+            live = open(log_file, "r", encoding="utf-8")
+        except FileNotFoundError:
+            live = None
+
+    try:
+        for segment in segments:
+            if start and segment.get("last_timestamp") and segment["last_timestamp"] < start:
+                continue
+            if end and segment.get("first_timestamp") and segment["first_timestamp"] > end:
+                continue
+            f = _open_listed(os.path.join(directory, segment["file"]))
+            if f is None:
+                continue
+            with f:
+                yield from _matching(f, start, end)
+        if live is not None:
+            yield from _matching(live, start, end)
+    finally:
+        if live is not None:
+            live.close()
@@ -0,0 +1,156 @@
+# model_registry.py
+# Process-wide cache of loaded models, keyed by file path.
+# Each model is loaded once (at startup through preload() or on first get_model())
+# and is reloaded automatically when the file's mtime changes, so a retrained
+# model is picked up without restarting the server.
+
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import metrics
+
+# export path -> (source mtimes, export mtime, export matches sources)
+_export_freshness: Dict[str, Tuple[Tuple[float, ...], float, bool]] = {}
+
+
+def _utc_iso(ts: float) -> str:
+    return datetime.utcfromtimestamp(ts).isoformat() + "Z"
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def export_is_current(source_path: Union[str, Sequence[str]], export_path: str) -> bool:
+    """
+    True if export_path (an .npz written with a "source_sha256" entry) was
+    exported from the current contents of source_path. For an export built
+    from several files, pass the list of paths; "source_sha256" then holds
+    one hash per file, in the same order. The hashes are only recomputed
+    when one of the files changes.
+    """
+    import numpy as np
+
+    sources = [source_path] if isinstance(source_path, str) else list(source_path)
+    if not os.path.exists(export_path):
+        return False
+    if not all(os.path.exists(path) for path in sources):
+        return True
+
+    key = (tuple(os.path.getmtime(path) for path in sources), os.path.getmtime(export_path))
+    cached = _export_freshness.get(export_path)
+    if cached is None or cached[:2] != key:
+        with np.load(export_path) as data:
+            stored = [str(h) for h in np.atleast_1d(data["source_sha256"])] if "source_sha256" in data else None
+        cached = _export_freshness[export_path] = key + (stored == [file_sha256(path) for path in sources],)
+    return cached[2]
+
+
+def load_keras_model(path: str) -> Any:
+    """Default loader: a Keras model saved with model.save()"""
+    import tensorflow as tf
+    return tf.keras.models.load_model(path)
+
+
+class ModelRegistry:
+    """Thread-safe path -> model cache with mtime based reloads"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._path_locks: Dict[str, threading.Lock] = {}
+
+    def _path_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            lock = self._path_locks.get(path)
+            if lock is None:
+                lock = self._path_locks[path] = threading.Lock()
+            return lock
+
+    def get(self, path: str, loader: Optional[Callable[[str], Any]] = None) -> Any:
+        """
+        Return the model stored at path, loading it on first use.
+
+        The file's mtime is checked on every call (one stat syscall); if it
+        changed since the last load the model is loaded again. Raises if the
+        file is missing or the loader fails, so callers keep their own
+        error handling.
+        """
+        mtime = os.path.getmtime(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry["mtime"] == mtime:
+            return entry["model"]
+
+        # one loader per path at a time; other paths stay available
+        with self._path_lock(path):
+            entry = self._entries.get(path)
+            if entry is not None and entry["mtime"] == mtime:
+                return entry["model"]
+
+            started = time.perf_counter()
+            model = (loader or load_keras_model)(path)
+            load_time_ms = (time.perf_counter() - started) * 1000
+            metrics.MODEL_LOAD_SECONDS.observe(load_time_ms / 1000, model=path)
+
+            self._entries[path] = {
+                "model": model,
+                "mtime": mtime,
+                "load_time_ms": round(load_time_ms, 2),
+                "loaded_at": _utc_iso(time.time()),
+                "load_count": (entry["load_count"] + 1) if entry else 1,
+                "reload_count": (entry["reload_count"] + 1) if entry else 0,
+            }
+            return model
+
+    def version(self, path: str) -> Optional[float]:
+        """mtime of the currently loaded copy of path (None if not loaded)"""
+        entry = self._entries.get(path)
+        return entry["mtime"] if entry else None
+
+    def is_loaded(self, path: str) -> bool:
+        return path in self._entries
+
+    def loaded_count(self) -> int:
+        return len(self._entries)
+
+    def preload(self, paths: Iterable[str], loader: Optional[Callable[[str], Any]] = None) -> None:
+        """Load every path now; failures are printed and skipped"""
+        for path in paths:
+            try:
+                self.get(path, loader)
+            except Exception as e:
+                print(f"Warning: Could not preload model {path}: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-model load time, load/reload counts and file mtime"""
+        return {
+            path: {
+                "load_time_ms": entry["load_time_ms"],
+                "loaded_at": entry["loaded_at"],
+                "load_count": entry["load_count"],
+                "reload_count": entry["reload_count"],
+                "file_mtime": _utc_iso(entry["mtime"]),
+            }
+            for path, entry in list(self._entries.items())
+        }
+
+
+registry = ModelRegistry()
+metrics.gauge("models_loaded", "Model files currently held by the model registry", registry.loaded_count)
+
+
+def get_model(path: str, loader: Optional[Callable[[str], Any]] = None) -> Any:
+    return registry.get(path, loader)
+
+
+def preload(paths: Iterable[str], loader: Optional[Callable[[str], Any]] = None) -> None:
+    registry.preload(paths, loader)
+
+
+def model_stats() -> Dict[str, Dict[str, Any]]:
+    return registry.stats()
@@ -0,0 +1,317 @@
+# onnx_engine.py
+# ONNX export of the petal networks and the decision tree, served through
+# ONNX Runtime on CPU (optional: needs the onnx and onnxruntime packages).
+# Graphs are built directly from the exported NumPy weights
+# (trained/*_model.npz, trained/decision_tree_model.npz), so neither
+# TensorFlow nor sklearn is needed to export or to serve:
+#   petal: MatMul/Add/Relu x2 -> MatMul/Add/Sigmoid, input (N, 4) float32
+#   tree:  ai.onnx.ml TreeEnsembleRegressor, input (N, 12) float32 -> (N, 4)
+# Every file records the sha256 of the model it was exported from; an export
+# older than its model is not served (StaleExport), and petal_engine and
+# tree_engine fall back to the NumPy engine until it is re-exported.
+#
+# Select it with PETAL_BACKEND=onnx (petal_engine) and TREE_BACKEND=onnx
+# (tree_engine).
+#
+#   python onnx_engine.py export   # write trained/*_model.onnx, trained/decision_tree_model.onnx
+#   python onnx_engine.py check    # compare ONNX Runtime vs Keras / sklearn
+
+import os
+import sys
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+import model_registry
+import petal_engine
+import tree_engine
+
+# max |onnx - keras| on the sigmoid output, same bar as the NumPy engine
+PARITY_TOLERANCE = petal_engine.PARITY_TOLERANCE
+# the tree's leaf values are float32 in ONNX (float64 in sklearn)
+TREE_TOLERANCE = 1e-6
+
+OPSET = 13
+ML_OPSET = 3
+# oldest IR version that supports these opsets, for older onnxruntime builds
+IR_VERSION = 8
+
+TREE_ONNX_PATH = tree_engine.ONNX_PATH
+
+# onnx path -> (source mtime, onnx mtime, export matches source)
+_export_freshness: Dict[str, Tuple[float, float, bool]] = {}
+
+
+def onnx_path_for(model_path: str) -> str:
+    """trained/reading_model.h5 -> trained/reading_model.onnx"""
+    return os.path.splitext(model_path)[0] + ".onnx"
+
+
+def _require_onnx():
+    try:
+        import onnx
+        from onnx import helper
+    except ImportError as e:
+        raise RuntimeError("the onnx package is required to export ONNX models (pip install onnx)") from e
+    return onnx, helper
+
+
+def _save(model: Any, path: str, source_path: str) -> str:
+    onnx, helper = _require_onnx()
+    helper.set_model_props(model, {
+        "source": source_path,
+        "source_sha256": model_registry.file_sha256(source_path) if os.path.exists(source_path) else "",
+    })
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+    return path
+
+
+def petal_graph(net: petal_engine.PetalNet, name: str = "petal") -> Any:
+    """ONNX model computing PetalNet.forward (output shape (N, 1))"""
+    onnx, helper = _require_onnx()
+    from onnx import TensorProto, numpy_helper
+
+    nodes, initializers = [], []
+    current = "input"
+    last = len(net.kernels) - 1
+    for i, (W, b) in enumerate(zip(net.kernels, net.biases)):
+        initializers.append(numpy_helper.from_array(W, f"kernel_{i}"))
+        initializers.append(numpy_helper.from_array(b, f"bias_{i}"))
+        nodes.append(helper.make_node("MatMul", [current, f"kernel_{i}"], [f"matmul_{i}"]))
+        nodes.append(helper.make_node("Add", [f"matmul_{i}", f"bias_{i}"], [f"dense_{i}"]))
+        output = "confidence" if i == last else f"hidden_{i}"
+        nodes.append(helper.make_node("Sigmoid" if i == last else "Relu", [f"dense_{i}"], [output]))
+        current = output
+
+    graph = helper.make_graph(
+        nodes, name,
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", net.input_dim])],
+        [helper.make_tensor_value_info("confidence", TensorProto.FLOAT, ["N", net.kernels[-1].shape[1]])],
+        initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", OPSET)], ir_version=IR_VERSION)
+
+
+def _float32_threshold(threshold: np.ndarray) -> np.ndarray:
+    """
+    Largest float32 <= each float64 threshold. For float32 inputs x,
+    x <= t holds exactly when x <= this value, so splits match sklearn.
+    """
+    t32 = threshold.astype(np.float32)
+    above = t32.astype(np.float64) > threshold
+    t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+    return t32
+
+
+def tree_graph(tree: tree_engine.CompiledTree, name: str = "decision_tree") -> Any:
+    """ONNX TreeEnsembleRegressor with one ensemble tree per distinct root"""
+    onnx, helper = _require_onnx()
+    from onnx import TensorProto
+
+    thresholds = _float32_threshold(tree.threshold)
+    attrs = {key: [] for key in (
+        "nodes_treeids", "nodes_nodeids", "nodes_featureids", "nodes_values", "nodes_modes",
+        "nodes_truenodeids", "nodes_falsenodeids", "target_treeids", "target_nodeids", "target_ids",
+        "target_weights",
+    )}
+    for tree_id, root in enumerate(dict.fromkeys(int(r) for r in tree.roots)):
+        outputs = [k for k, r in enumerate(tree.roots) if r == root]
+        # number the nodes of this tree 0..n-1 in traversal order
+        order, local = [root], {root: 0}
+        for node in order:
+            for child in (tree.left[node], tree.right[node]):
+                if child != tree_engine._LEAF and int(child) not in local:
+                    local[int(child)] = len(order)
+                    order.append(int(child))
+        for node in order:
+            leaf = tree.left[node] == tree_engine._LEAF
+            attrs["nodes_treeids"].append(tree_id)
+            attrs["nodes_nodeids"].append(local[node])
+            attrs["nodes_featureids"].append(0 if leaf else int(tree.feature[node]))
+            attrs["nodes_values"].append(0.0 if leaf else float(thresholds[node]))
+            attrs["nodes_modes"].append("LEAF" if leaf else "BRANCH_LEQ")
+            attrs["nodes_truenodeids"].append(0 if leaf else local[int(tree.left[node])])
+            attrs["nodes_falsenodeids"].append(0 if leaf else local[int(tree.right[node])])
+            if leaf:
+                for k in outputs:
+                    attrs["target_treeids"].append(tree_id)
+                    attrs["target_nodeids"].append(local[node])
+                    attrs["target_ids"].append(k)
+                    attrs["target_weights"].append(float(tree.value[node, k]))
+
+    node = helper.make_node(
+        "TreeEnsembleRegressor", ["input"], ["variable"], domain="ai.onnx.ml",
+        n_targets=tree.n_outputs, aggregate_function="SUM", post_transform="NONE", **attrs,
+    )
+    graph = helper.make_graph(
+        [node], name,
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", len(tree.feature_names)])],
+        [helper.make_tensor_value_info("variable", TensorProto.FLOAT, ["N", tree.n_outputs])],
+    )
+    model = helper.make_model(
+        graph, ir_version=IR_VERSION,
+        opset_imports=[helper.make_opsetid("", OPSET), helper.make_opsetid("ai.onnx.ml", ML_OPSET)],
+    )
+    # feature order for dict inputs
+    model.doc_string = ",".join(tree.feature_names)
+    return model
+
+
+def export_petal(model_path: str) -> str:
+    npz_path = petal_engine.npz_path_for(model_path)
+    if not model_registry.export_is_current(model_path, npz_path):
+        petal_engine.export_weights(model_path)
+    net = petal_engine.load_petal_net(npz_path)
+    name = os.path.basename(os.path.splitext(model_path)[0])
+    return _save(petal_graph(net, name), onnx_path_for(model_path), model_path)
+
+
+def export_tree(pkl_path: str = tree_engine.MODEL_PATH, onnx_path: str = TREE_ONNX_PATH) -> str:
+    if model_registry.export_is_current(pkl_path, tree_engine.COMPILED_PATH):
+        tree = tree_engine.load_compiled(tree_engine.COMPILED_PATH)
+    else:
+        tree = tree_engine.load_and_compile(pkl_path)
+    return _save(tree_graph(tree), onnx_path, pkl_path)
+
+
+class StaleExport(RuntimeError):
+    """Raised when an ONNX file was exported from an older version of its source model"""
+
+
+def _open_session(path: str) -> Any:
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise RuntimeError("onnxruntime is required for the onnx backend (pip install onnxruntime)") from e
+    options = ort.SessionOptions()
+    # the graphs are tiny: threads cost more than they save
+    options.intra_op_num_threads = 1
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def export_is_current(source_path: str, onnx_path: str) -> bool:
+    """
+    True if onnx_path was exported from the current contents of source_path
+    (or the source is not deployed). Like model_registry.export_is_current,
+    the hashes are only recomputed when one of the files changes.
+    """
+    if not os.path.exists(onnx_path):
+        return False
+    if not os.path.exists(source_path):
+        return True
+    key = (os.path.getmtime(source_path), os.path.getmtime(onnx_path))
+    cached = _export_freshness.get(onnx_path)
+    if cached is None or cached[:2] != key:
+        metadata = _open_session(onnx_path).get_modelmeta().custom_metadata_map
+        current = metadata.get("source_sha256") == model_registry.file_sha256(source_path)
+        cached = _export_freshness[onnx_path] = key + (current,)
+    return cached[2]
+
+
+def _session(path: str) -> Any:
+    session = _open_session(path)
+    source = session.get_modelmeta().custom_metadata_map.get("source", "")
+    if source and not export_is_current(source, path):
+        raise StaleExport(f"{path} was exported from an older {source}; run python onnx_engine.py export")
+    return session
+
+
+class OnnxPetalNet:
+    """PetalNet-compatible wrapper around an ONNX Runtime session"""
+
+    backend = "onnx"
+
+    def __init__(self, session: Any):
+        self.session = session
+        shape = session.get_inputs()[0].shape
+        self.input_dim = int(shape[1])
+
+    def forward(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.input_dim:
+            raise ValueError(f"expected rows of {self.input_dim} values, got shape {X.shape}")
+        return self.session.run(None, {"input": X})[0].reshape(-1)
+
+
+class OnnxTree(tree_engine.TreePredictor):
+    """TreePredictor backed by an ONNX Runtime session"""
+
+    def __init__(self, session: Any, feature_names: Sequence[str]):
+        self.session = session
+        self.feature_names = list(feature_names)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+            raise ValueError(f"expected rows of {len(self.feature_names)} features, got shape {X.shape}")
+        with tree_engine.metrics.timer(tree_engine.metrics.TREE_EVAL_SECONDS):
+            return self.session.run(None, {"input": X})[0].astype(np.float64)
+
+
+def load_petal_session(onnx_path: str) -> OnnxPetalNet:
+    """Registry loader for trained/*_model.onnx"""
+    return OnnxPetalNet(_session(onnx_path))
+
+
+def load_tree_session(onnx_path: str) -> OnnxTree:
+    """Registry loader for TREE_ONNX_PATH"""
+    session = _session(onnx_path)
+    return OnnxTree(session, session.get_modelmeta().description.split(","))
+
+
+def get_petal_net(model_path: str) -> OnnxPetalNet:
+    return model_registry.get_model(onnx_path_for(model_path), load_petal_session)
+
+
+def get_tree() -> OnnxTree:
+    return model_registry.get_model(TREE_ONNX_PATH, load_tree_session)
+
+
+def check_petal(model_path: str, X: np.ndarray) -> float:
+    """Max |onnx - keras| on X"""
+    keras_out = model_registry.load_keras_model(model_path).predict(X, verbose=0).reshape(-1)
+    onnx_out = load_petal_session(onnx_path_for(model_path)).forward(X)
+    return float(np.max(np.abs(keras_out - onnx_out)))
+
+
+def check_tree(X: np.ndarray) -> float:
+    """Max |onnx - sklearn| on X (rows in feature order)"""
+    import joblib
+    expected = joblib.load(tree_engine.MODEL_PATH).predict(X)
+    return float(np.max(np.abs(load_tree_session(TREE_ONNX_PATH).predict(X) - expected)))
+
+
+def _petal_model_paths() -> List[str]:
+    return [module.MODEL_PATH for module in petal_engine._petal_modules()]
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+
+    if command == "export":
+        for model_path in _petal_model_paths():
+            print(f"{model_path} -> {export_petal(model_path)}")
+        print(f"{tree_engine.MODEL_PATH} -> {export_tree()}")
+    elif command == "check":
+        import pandas as pd
+
+        failed = False
+        for module in petal_engine._petal_modules():
+            X, _ = module.load_data()
+            diff = check_petal(module.MODEL_PATH, X.astype(np.float32))
+            ok = diff <= PARITY_TOLERANCE
+            failed = failed or not ok
+            print(f"{onnx_path_for(module.MODEL_PATH)}: max |onnx - keras| = {diff:.2e} {'OK' if ok else 'FAIL'}")
+
+        feature_names = load_tree_session(TREE_ONNX_PATH).feature_names
+        df = pd.read_csv("data/vectortreeper.csv")[feature_names]
+        diff = check_tree(df)
+        ok = diff <= TREE_TOLERANCE
+        failed = failed or not ok
+        print(f"{TREE_ONNX_PATH}: max |onnx - sklearn| = {diff:.2e} on {len(df)} rows {'OK' if ok else 'FAIL'}")
+        sys.exit(1 if failed else 0)
+    else:
+        print("usage: python onnx_engine.py [export|check]")
+        sys.exit(2)
@@ -0,0 +1,191 @@
+# passage_index.py
+# Precomputed SentenceTransformer embeddings of the reference passages.
+# Every student reads or writes the same few passages, so their vectors are
+# computed once by `build` and stored L2-normalized as float32 in
+# PASSAGE_INDEX (trained/passages.emb.npy, memory-mapped when served) with a
+# .npz of row keys (sha256 of the whitespace-normalized text) and the model
+# name. At request time only the student's text is encoded; the semantic
+# similarity is the dot product of the two unit vectors (cosine similarity).
+# Passages missing from the index are encoded once and kept in an LRU of
+# PASSAGE_CACHE_SIZE vectors (result_cache), so they too are encoded only once
+# per process.
+#
+#   python passage_index.py build [passages.txt ...]   # default data/passages.txt, one passage per line
+#   python passage_index.py check                      # passages, model and size of the index
+
+import hashlib
+import os
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+import model_registry
+from result_cache import ResultCache
+
+SENTENCE_MODEL = os.environ.get("SENTENCE_MODEL", "all-MiniLM-L6-v2")
+PASSAGE_INDEX = os.environ.get("PASSAGE_INDEX", "trained/passages.emb.npy")
+PASSAGE_SOURCES = ["data/passages.txt"]
+PASSAGE_CACHE_SIZE = int(os.environ.get("PASSAGE_CACHE_SIZE", "1024"))
+
+Encoder = Callable[[List[str]], np.ndarray]
+
+_extra = ResultCache("passages", PASSAGE_CACHE_SIZE, float("inf"))
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def content_hash(text: str) -> str:
+    """Index key of a passage: sha256 of its whitespace-normalized text"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def meta_path_for(path: str = PASSAGE_INDEX) -> str:
+    """trained/passages.emb.npy -> trained/passages.emb.npz"""
+    return f"{os.path.splitext(path)[0]}.npz"
+
+
+def unit_rows(vectors: Any) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class PassageIndex:
+    """Memory-mapped passage vectors and their content-hash keys"""
+
+    def __init__(self, vectors: np.ndarray, keys: Sequence[str], model: str):
+        self.vectors = vectors
+        self.rows = {key: i for i, key in enumerate(keys)}
+        self.model = model
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def row(self, text: str) -> Optional[int]:
+        return self.rows.get(content_hash(text))
+
+
+def load_index(meta_path: str) -> PassageIndex:
+    """Registry loader: keys from the .npz, vectors memory-mapped from the .npy next to it"""
+    with np.load(meta_path) as meta:
+        keys = [str(key) for key in meta["keys"]]
+        model = str(meta["model"])
+    vectors = np.load(f"{os.path.splitext(meta_path)[0]}.npy", mmap_mode="r")
+    if len(vectors) != len(keys):
+        # read between the two replaces of a rebuild; the new .npz triggers a reload
+        raise OSError(f"{meta_path}: {len(keys)} keys but {len(vectors)} vectors (index being rebuilt)")
+    return PassageIndex(vectors, keys, model)
+
+
+def get_index(path: str = PASSAGE_INDEX) -> Optional[PassageIndex]:
+    """The served index, or None if it has not been built for SENTENCE_MODEL"""
+    meta_path = meta_path_for(path)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        index = model_registry.get_model(meta_path, load_index)
+    except OSError:
+        return None
+    return index if index.model == SENTENCE_MODEL else None
+
+
+def passage_vectors(texts: Sequence[str], encode: Encoder, path: str = PASSAGE_INDEX) -> np.ndarray:
+    """
+    Unit vectors of reference passages: rows of the index where present,
+    otherwise from the LRU, encoding whatever is left in one batch
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    index = get_index(path)
+    vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+    missing: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+        row = index.row(text) if index is not None else None
+        if row is not None:
+            vectors[i] = index.vectors[row]
+            continue
+        key = content_hash(text)
+        cached = _extra.get(SENTENCE_MODEL, key)
+        if cached is not None:
+            vectors[i] = cached
+        else:
+            missing.setdefault(key, []).append(i)
+    if missing:
+        keys = list(missing)
+        encoded = unit_rows(encode([texts[missing[key][0]] for key in keys]))
+        for key, vector in zip(keys, encoded):
+            _extra.put(SENTENCE_MODEL, key, vector)
+            for i in missing[key]:
+                vectors[i] = vector
+    return np.stack(vectors)
+
+
+def similarity(student: Any, passages: np.ndarray) -> List[float]:
+    """Row-wise cosine similarity of unit vectors, rounded to 4 decimals"""
+    if len(student) == 0:
+        return []
+    scores = np.einsum("ij,ij->i", unit_rows(student), np.asarray(passages, dtype=np.float32))
+    return [round(float(score), 4) for score in np.clip(scores, -1.0, 1.0)]
+
+
+def read_passages(paths: Iterable[str]) -> List[str]:
+    passages = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            passages.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    return passages
+
+
+def build(passages: Iterable[str], encode: Encoder, path: str = PASSAGE_INDEX,
+          model: str = SENTENCE_MODEL) -> int:
+    """Encode every distinct passage and write the index; returns the number of rows"""
+    unique: Dict[str, str] = {}
+    for text in passages:
+        unique.setdefault(content_hash(text), normalize_text(text))
+    keys = list(unique)
+    vectors = unit_rows(encode([unique[key] for key in keys])) if keys else np.zeros((0, 0), np.float32)
+    dirpath = os.path.dirname(path)
+    if dirpath:
+        os.makedirs(dirpath, exist_ok=True)
+    # a running server memory-maps the .npy, so both files are replaced rather
+    # than rewritten in place; the .npz goes last since the registry reloads on it
+    tmp_vectors = f"{os.path.splitext(path)[0]}.tmp.npy"
+    np.save(tmp_vectors, vectors)
+    os.replace(tmp_vectors, path)
+    meta_path = meta_path_for(path)
+    tmp_meta = f"{os.path.splitext(meta_path)[0]}.tmp.npz"
+    np.savez(tmp_meta, keys=np.array(keys), model=np.array(model))
+    os.replace(tmp_meta, meta_path)
+    return len(keys)
+
+
+def sentence_encoder() -> Encoder:
+    from sentence_transformers import SentenceTransformer  # type: ignore
+    model = SentenceTransformer(SENTENCE_MODEL)
+    return lambda texts: model.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "build":
+        sources = sys.argv[2:] or PASSAGE_SOURCES
+        rows = build(read_passages(sources), sentence_encoder())
+        print(f"{rows} passages from {', '.join(sources)} -> {PASSAGE_INDEX} ({SENTENCE_MODEL})")
+    elif command == "check":
+        if not os.path.exists(meta_path_for()):
+            print(f"{PASSAGE_INDEX}: not built (python passage_index.py build)")
+            sys.exit(1)
+        index = load_index(meta_path_for())
+        sources = [p for p in PASSAGE_SOURCES if os.path.exists(p)]
+        missing = [text for text in read_passages(sources) if index.row(text) is None]
+        print(f"{PASSAGE_INDEX}: {len(index)} passages, dim {index.vectors.shape[1] if len(index) else 0}, "
+              f"model {index.model}{'' if index.model == SENTENCE_MODEL else f' (serving {SENTENCE_MODEL}: ignored)'}, "
+              f"{os.path.getsize(PASSAGE_INDEX)} bytes")
+        for text in missing:
+            print(f"  not indexed: {text!r}")
+    else:
+        print("usage: python passage_index.py [build|check]")
+        sys.exit(2)
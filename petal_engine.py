@@ -0,0 +1,355 @@
+# petal_engine.py
+# Pure-NumPy inference for the petal networks.
+# Every petal_* module trains the same build_model() topology:
+#   Dense(16, relu) -> Dense(8, relu) -> Dense(1, sigmoid)
+# so the forward pass is three small matmuls. export_weights() copies the
+# weights out of trained/*_model.h5 into a .npz next to it, and PetalNet
+# evaluates them without TensorFlow. Outputs match Keras to within
+# PARITY_TOLERANCE (float32 arithmetic on both sides).
+#
+# The four exported networks are also stacked into one file (FUSED_PATH):
+# StackedPetalNet scores a 16-value row (reading, logic, writing, memory
+# inputs, 4 each) with one batched matmul per layer and returns all four
+# confidences, bit-identical to the four separate PetalNets.
+#
+#   python petal_engine.py export   # write trained/*_model.npz and trained/petals_fused.npz
+#   python petal_engine.py check    # compare NumPy vs Keras on data/petal_*.csv, fused vs separate
+
+import importlib
+import os
+import sys
+from typing import Any, Callable, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+import model_registry
+
+# max |numpy - keras| allowed on the sigmoid output
+PARITY_TOLERANCE = 1e-5
+
+# "auto": NumPy when an up-to-date .npz exists, Keras otherwise
+# "numpy": always NumPy (fails if the .npz is missing)
+# "keras": always TensorFlow/Keras
+# "onnx": ONNX Runtime on trained/*_model.onnx (see onnx_engine.py), "auto" while the export is stale
+PETAL_BACKEND = os.environ.get("PETAL_BACKEND", "auto")
+
+# weights served by the NumPy backend: "float32", or a variant written by
+# petal_quantize.py ("float16", "int8"); falls back to float32 while the
+# variant is missing or stale
+PETAL_PRECISION = os.environ.get("PETAL_PRECISION", "float32")
+
+# answer on-grid rows from the precomputed tables of petal_lookup.py
+PETAL_LOOKUP = os.environ.get("PETAL_LOOKUP", "0").lower() in ("1", "true", "yes")
+
+PETAL_MODULES = ["petal_reading", "petal_logic", "petal_writing", "petal_memory"]
+
+# all four petal networks stacked, in PETAL_MODULES order
+FUSED_PATH = "trained/petals_fused.npz"
+
+
+def npz_path_for(model_path: str) -> str:
+    """trained/reading_model.h5 -> trained/reading_model.npz"""
+    return os.path.splitext(model_path)[0] + ".npz"
+
+
+class PetalNet:
+    """Dense/ReLU stack with a sigmoid output, evaluated in float32"""
+
+    backend = "numpy"
+
+    def __init__(self, weights: Sequence[np.ndarray]):
+        if len(weights) % 2 != 0:
+            raise ValueError("expected alternating kernel/bias arrays")
+        self.kernels = [np.ascontiguousarray(w, dtype=np.float32) for w in weights[0::2]]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float32) for b in weights[1::2]]
+        self.input_dim = self.kernels[0].shape[0]
+
+    def forward(self, X: np.ndarray) -> np.ndarray:
+        """X: (n_rows, input_dim) -> sigmoid confidences, shape (n_rows,)"""
+        h = np.asarray(X, dtype=np.float32)
+        if h.ndim != 2 or h.shape[1] != self.input_dim:
+            raise ValueError(f"expected rows of {self.input_dim} values, got shape {h.shape}")
+        last = len(self.kernels) - 1
+        for i, (W, b) in enumerate(zip(self.kernels, self.biases)):
+            h = h @ W + b
+            if i < last:
+                np.maximum(h, 0.0, out=h)
+        return (1.0 / (1.0 + np.exp(-h))).reshape(-1)
+
+
+class StackedPetalNet:
+    """Several same-shaped PetalNets evaluated together: kernels are (n_petals, in, out)"""
+
+    def __init__(self, kernels: Sequence[np.ndarray], biases: Sequence[np.ndarray]):
+        self.kernels = [np.ascontiguousarray(w, dtype=np.float32) for w in kernels]
+        # (n_petals, 1, out) so they broadcast over the rows of each petal
+        self.biases = [np.ascontiguousarray(b, dtype=np.float32)[:, None, :] for b in biases]
+        self.n_petals, self.input_dim = self.kernels[0].shape[:2]
+
+    @classmethod
+    def stack(cls, nets: Sequence[PetalNet]) -> "StackedPetalNet":
+        shapes = {tuple(k.shape for k in net.kernels) for net in nets}
+        if len(shapes) != 1:
+            raise ValueError(f"petal networks must share one topology, got {sorted(shapes)}")
+        n_layers = len(nets[0].kernels)
+        return cls(
+            [np.stack([net.kernels[i] for net in nets]) for i in range(n_layers)],
+            [np.stack([net.biases[i] for net in nets]) for i in range(n_layers)],
+        )
+
+    def forward(self, X: np.ndarray) -> np.ndarray:
+        """X: (n_rows, n_petals * input_dim) -> confidences, shape (n_rows, n_petals)"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_petals * self.input_dim:
+            raise ValueError(f"expected rows of {self.n_petals * self.input_dim} values, got shape {X.shape}")
+        # (n_petals, n_rows, input_dim): each petal's slice is the 2-D matmul PetalNet does
+        h = np.ascontiguousarray(X.reshape(X.shape[0], self.n_petals, self.input_dim).transpose(1, 0, 2))
+        last = len(self.kernels) - 1
+        for i, (W, b) in enumerate(zip(self.kernels, self.biases)):
+            h = np.matmul(h, W) + b
+            if i < last:
+                np.maximum(h, 0.0, out=h)
+        return (1.0 / (1.0 + np.exp(-h)))[:, :, 0].T
+
+
+def load_petal_net(npz_path: str) -> PetalNet:
+    """Registry loader for an exported .npz"""
+    with np.load(npz_path) as data:
+        n_layers = int(data["n_layers"])
+        weights = []
+        for i in range(n_layers):
+            weights.append(data[f"kernel_{i}"])
+            weights.append(data[f"bias_{i}"])
+    return PetalNet(weights)
+
+
+def export_weights(model_path: str, npz_path: str | None = None) -> str:
+    """Extract kernel/bias arrays from a Keras .h5 into a compressed .npz"""
+    model = model_registry.load_keras_model(model_path)
+    weights = model.get_weights()
+    npz_path = npz_path or npz_path_for(model_path)
+
+    arrays = {
+        "n_layers": np.array(len(weights) // 2),
+        "source_sha256": np.array(model_registry.file_sha256(model_path)),
+    }
+    for i in range(len(weights) // 2):
+        arrays[f"kernel_{i}"] = weights[2 * i].astype(np.float32)
+        arrays[f"bias_{i}"] = weights[2 * i + 1].astype(np.float32)
+    np.savez_compressed(npz_path, **arrays)
+    return npz_path
+
+
+def load_stacked_net(npz_path: str) -> StackedPetalNet:
+    """Registry loader for FUSED_PATH"""
+    with np.load(npz_path) as data:
+        n_layers = int(data["n_layers"])
+        return StackedPetalNet(
+            [data[f"kernel_{i}"] for i in range(n_layers)],
+            [data[f"bias_{i}"] for i in range(n_layers)],
+        )
+
+
+def export_fused(model_paths: Sequence[str] | None = None, npz_path: str = FUSED_PATH) -> str:
+    """Stack the exported petal networks (PETAL_MODULES order) into one .npz"""
+    model_paths = list(model_paths or _petal_model_paths())
+    for model_path in model_paths:
+        if not model_registry.export_is_current(model_path, npz_path_for(model_path)):
+            raise RuntimeError(f"{npz_path_for(model_path)} is missing or stale, export {model_path} first")
+    stacked = StackedPetalNet.stack([load_petal_net(npz_path_for(p)) for p in model_paths])
+
+    arrays = {
+        "n_layers": np.array(len(stacked.kernels)),
+        "models": np.array(model_paths),
+        "source_sha256": np.array([model_registry.file_sha256(p) for p in model_paths]),
+    }
+    for i, (W, b) in enumerate(zip(stacked.kernels, stacked.biases)):
+        arrays[f"kernel_{i}"] = W
+        arrays[f"bias_{i}"] = b[:, 0, :]
+    np.savez_compressed(npz_path, **arrays)
+    return npz_path
+
+
+def refresh_fused() -> None:
+    """Re-stack FUSED_PATH after a petal was retrained (skipped while another export is stale)"""
+    try:
+        export_fused()
+    except Exception as e:
+        print(f"Warning: {FUSED_PATH} not updated: {e}")
+
+
+def fused_available() -> bool:
+    """True if FUSED_PATH matches the current .h5 of every petal model"""
+    if PETAL_BACKEND in ("keras", "onnx") or PETAL_PRECISION != "float32" or PETAL_LOOKUP:
+        return False
+    if PETAL_BACKEND == "numpy":
+        return os.path.exists(FUSED_PATH)
+    return model_registry.export_is_current(_petal_model_paths(), FUSED_PATH)
+
+
+def get_fused() -> StackedPetalNet:
+    return model_registry.get_model(FUSED_PATH, load_stacked_net)
+
+
+def predict_fused_confidences(rows: Iterable[Sequence[float]]) -> np.ndarray:
+    """Confidences of all petals for 16-value rows, shape (n_rows, n_petals)"""
+    net = get_fused()
+    X = np.asarray(rows, dtype=np.float32)
+    if X.size == 0:
+        return np.empty((0, net.n_petals), dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    with metrics.timer(metrics.INFERENCE_SECONDS, model="fused", backend="numpy"):
+        return net.forward(X)
+
+
+def _use_numpy(model_path: str) -> bool:
+    if PETAL_BACKEND == "numpy":
+        return True
+    if PETAL_BACKEND == "keras":
+        return False
+    # a retrained .h5 falls back to Keras until it is re-exported
+    return model_registry.export_is_current(model_path, npz_path_for(model_path))
+
+
+def _served(model_path: str) -> Tuple[str, Callable[[str], Any]]:
+    """(file, registry loader) that serves model_path under the current settings"""
+    if PETAL_BACKEND == "onnx":
+        import onnx_engine
+        onnx_path = onnx_engine.onnx_path_for(model_path)
+        # a retrained .h5 falls back to NumPy (or Keras) until it is re-exported
+        if onnx_engine.export_is_current(model_path, onnx_path):
+            return onnx_path, onnx_engine.load_petal_session
+    if _use_numpy(model_path):
+        if PETAL_PRECISION != "float32":
+            import petal_quantize
+            path = petal_quantize.quantized_path_for(model_path, PETAL_PRECISION)
+            if model_registry.export_is_current(model_path, path):
+                return path, petal_quantize.load_quantized_net
+        return npz_path_for(model_path), load_petal_net
+    return model_path, model_registry.load_keras_model
+
+
+def get_net(model_path: str) -> Any:
+    """Loaded network for model_path: a PetalNet, an OnnxPetalNet or a Keras model"""
+    path, loader = _served(model_path)
+    return model_registry.get_model(path, loader)
+
+
+def model_version(model_path: str) -> Tuple[str, float]:
+    """Identifies the weights currently served for model_path; changes when they do"""
+    path, _ = _served(model_path)
+    return path, os.path.getmtime(path)
+
+
+def predict_confidences(model_path: str, rows: Iterable[Sequence[float]]) -> np.ndarray:
+    """Sigmoid outputs for a batch of input rows, shape (n_rows,)"""
+    if PETAL_LOOKUP:
+        import petal_lookup
+        table = petal_lookup.get_table(model_path)
+        if table is not None:
+            return _lookup(model_path, table, rows)
+    return _forward(model_path, rows)
+
+
+def _lookup(model_path: str, table: Any, rows: Iterable[Sequence[float]]) -> np.ndarray:
+    """Confidences from a petal_lookup table, running the network for rows it can't answer"""
+    import petal_lookup
+    rows = rows if isinstance(rows, (list, np.ndarray)) else list(rows)
+    if len(rows) == 1 and len(rows[0]) == 4:
+        confidence = table.lookup_one(rows[0])
+        if confidence is not None:
+            petal_lookup.record_rows(model_path, 1, 0)
+            return np.array([confidence], dtype=np.float32)
+        petal_lookup.record_rows(model_path, 0, 1)
+        return _forward(model_path, rows)
+
+    X = np.asarray(rows, dtype=np.float64)
+    if X.ndim != 2 or X.shape[1] != 4 or not len(X):
+        return _forward(model_path, rows)
+    with metrics.timer(metrics.INFERENCE_SECONDS, model=petal_lookup.petal_name(model_path), backend=table.backend):
+        confidences, hit = table.lookup(X)
+    misses = int(len(X) - hit.sum())
+    petal_lookup.record_rows(model_path, len(X) - misses, misses)
+    if misses:
+        confidences[~hit] = _forward(model_path, X[~hit])
+    return confidences
+
+
+def _forward(model_path: str, rows: Iterable[Sequence[float]]) -> np.ndarray:
+    net = get_net(model_path)
+    X = np.asarray(rows, dtype=np.float32)
+    if X.size == 0:
+        return np.empty(0, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    model = os.path.basename(model_path).split("_model")[0]
+    if hasattr(net, "forward"):
+        with metrics.timer(metrics.INFERENCE_SECONDS, model=model, backend=net.backend):
+            return net.forward(X)
+    with metrics.timer(metrics.INFERENCE_SECONDS, model=model, backend="keras"):
+        return np.asarray(net.predict(X, verbose=0)).reshape(-1)
+
+
+def preload(model_paths: Iterable[str]) -> None:
+    """Load each petal model through whichever backend will serve it"""
+    for model_path in model_paths:
+        try:
+            get_net(model_path)
+        except Exception as e:
+            print(f"Warning: Could not preload model {model_path}: {e}")
+
+
+def check_parity(model_path: str, X: np.ndarray) -> float:
+    """Max absolute difference between the NumPy and Keras outputs on X"""
+    keras_out = model_registry.load_keras_model(model_path).predict(X, verbose=0).reshape(-1)
+    numpy_out = load_petal_net(npz_path_for(model_path)).forward(X)
+    return float(np.max(np.abs(keras_out - numpy_out)))
+
+
+def _petal_modules() -> List[Any]:
+    return [importlib.import_module(name) for name in PETAL_MODULES]
+
+
+def _petal_model_paths() -> List[str]:
+    return [module.MODEL_PATH for module in _petal_modules()]
+
+
+def check_fused(X: np.ndarray) -> bool:
+    """True if the fused network reproduces the separate networks exactly on X (n_rows, 16)"""
+    fused = load_stacked_net(FUSED_PATH).forward(X)
+    separate = np.stack([
+        load_petal_net(npz_path_for(path)).forward(X[:, 4 * i:4 * i + 4])
+        for i, path in enumerate(_petal_model_paths())
+    ], axis=1)
+    return bool(np.array_equal(fused, separate))
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+
+    if command == "export":
+        for module in _petal_modules():
+            print(f"{module.MODEL_PATH} -> {export_weights(module.MODEL_PATH)}")
+        print(f"fused -> {export_fused()}")
+    elif command == "check":
+        failed = False
+        inputs = []
+        for module in _petal_modules():
+            X, _ = module.load_data()
+            inputs.append(X.astype(np.float32))
+            diff = check_parity(module.MODEL_PATH, inputs[-1])
+            ok = diff <= PARITY_TOLERANCE
+            failed = failed or not ok
+            print(f"{module.MODEL_PATH}: max |numpy - keras| = {diff:.2e} {'OK' if ok else 'FAIL'}")
+        # every CSV row of every petal, padded with rows from the others
+        n_rows = max(len(X) for X in inputs)
+        fused_X = np.hstack([np.resize(X, (n_rows, X.shape[1])) for X in inputs])
+        ok = check_fused(fused_X)
+        failed = failed or not ok
+        print(f"{FUSED_PATH}: identical to separate networks on {n_rows} rows {'OK' if ok else 'FAIL'}")
+        sys.exit(1 if failed else 0)
+    else:
+        print("usage: python petal_engine.py [export|check]")
+        sys.exit(2)
@@ -1,16 +1,16 @@
-import tensorflow as tf
-import pandas as pd
-import numpy as np
+import petal_engine
 
 MODEL_PATH = "trained/logic_model.h5" # check 🔃
 
 def load_data():
+    import pandas as pd
     df = pd.read_csv("data/petal_logic.csv")
     X = df.drop("logic_risk", axis=1).values
     y = df["logic_risk"].values
     return X, y
 
 def build_model(input_dim):
+    import tensorflow as tf
     model = tf.keras.Sequential([
         tf.keras.layers.Dense(16, activation="relu", input_shape=(input_dim,)),
         tf.keras.layers.Dense(8, activation="relu"),
@@ -28,18 +28,27 @@ def train():
     model = build_model(X.shape[1])
     model.fit(X, y, epochs=30, batch_size=8, verbose=1)
     model.save(MODEL_PATH)
+    petal_engine.export_weights(MODEL_PATH)
+    petal_engine.refresh_fused()
 
-def predict_logic(student_input):
-    model = tf.keras.models.load_model(MODEL_PATH)
-    student_input = np.array(student_input).reshape(1, -1)
+def results_from_confidences(confidences):
+    """Petal output dicts for a sequence of sigmoid confidences"""
+
+    return [
+        {
+            "logic_score": 1 - confidence,
+            "logic_risk": int(confidence > 0.5),
+            "logic_confidence": confidence
+        }
+        for confidence in map(float, confidences)
+    ]
 
-    confidence = float(model.predict(student_input)[0][0])
+def predict_logic_batch(student_inputs):
+    """One vectorized forward pass for a list of 4-value input rows"""
+    return results_from_confidences(petal_engine.predict_confidences(MODEL_PATH, student_inputs))
 
-    return {
-        "logic_score": 1 - confidence,
-        "logic_risk": int(confidence > 0.5),
-        "logic_confidence": confidence
-    }
+def predict_logic(student_input):
+    return predict_logic_batch([student_input])[0]
 
 
 
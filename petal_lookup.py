@@ -0,0 +1,336 @@
+# petal_lookup.py
+# Precomputed petal outputs over the inputs /analyze-test* can produce.
+# Those endpoints clamp each feature to a fixed range and round it to two
+# decimals, and some features are derived from small integer counts, so each
+# petal only ever sees a finite grid of input rows. build() evaluates the
+# petal network once for every row of that grid and stores the confidences
+# as uint16 fixed point (max error 1/131070, below PARITY_TOLERANCE) in
+# trained/<petal>_model.lut.npy, with the grid axes and the sha256 of the .h5
+# in trained/<petal>_model.lut.npz.
+#
+# With PETAL_LOOKUP=1 petal_engine answers on-grid rows with an index
+# computation into the table and runs the network only for rows off the grid
+# (or so close to the 0.5 risk threshold that the rounding could flip it).
+# Tables larger than LOOKUP_MMAP_BYTES are memory-mapped rather than read
+# into memory. A table is ignored while it is missing or stale.
+#
+#   python petal_lookup.py plan    # grid size and table bytes per petal
+#   python petal_lookup.py build   # write the tables (skips petals over LOOKUP_MAX_CELLS)
+#   python petal_lookup.py check   # table vs network on random on-grid rows
+
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+import model_registry
+import petal_engine
+
+LOOKUP_MAX_CELLS = int(float(os.environ.get("LOOKUP_MAX_CELLS", "3e8")))
+LOOKUP_MMAP_BYTES = int(os.environ.get("LOOKUP_MMAP_BYTES", str(16 * 1024 * 1024)))
+
+# confidences are stored as round(confidence * SCALE)
+SCALE = 65535
+# rows whose stored confidence is this close to 0.5 are re-run through the net
+BOUNDARY = 1.0 / SCALE
+# grid values are two-decimal numbers; an input is on the grid if it is within
+# MATCH_TOLERANCE of one (covers float32 round trips, far below the 0.01 step)
+MATCH_TOLERANCE = 1e-4
+BUILD_CHUNK_ROWS = 1 << 20
+
+LOOKUP_ROWS = metrics.counter("petal_lookup_rows_total", "Petal input rows answered from a lookup table (hit) "
+                              "or by running the network (fallback)", ("model", "result"))
+
+
+def steps(low: float, high: float, step: float = 0.01) -> np.ndarray:
+    """Every two-decimal value in [low, high]"""
+    return np.round(low + np.arange(int(round((high - low) / step)) + 1) * step, 2)
+
+
+def ratios(n: int) -> np.ndarray:
+    """round(k / n, 2) for k = 0..n, i.e. a count out of n as a rounded fraction"""
+    return np.unique(np.round(np.arange(n + 1) / n, 2))
+
+
+def codes(X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(round(X * 100) as int64, mask of entries within MATCH_TOLERANCE of that two-decimal value)"""
+    scaled = np.asarray(X, dtype=np.float64) * 100
+    K = np.rint(scaled)
+    return K.astype(np.int64), np.abs(scaled - K) <= MATCH_TOLERANCE * 100
+
+
+class Axis:
+    """
+    One table dimension: the sorted values of a primary feature, plus features
+    that are fully determined by it (e.g. grammar_score = 1 - spelling_penalty).
+    Values are indexed by their two-decimal code through a dense position
+    array, so finding a row's cell is integer arithmetic.
+    """
+
+    def __init__(self, feature: int, values: np.ndarray, dependents: Optional[Dict[int, np.ndarray]] = None):
+        self.feature = feature
+        self.values = np.asarray(values, dtype=np.float64)
+        self.dependents = {f: np.asarray(v, dtype=np.float64) for f, v in (dependents or {}).items()}
+
+        value_codes = np.rint(self.values * 100).astype(np.int64)
+        self.min_code = int(value_codes.min())
+        self.position = np.full(int(value_codes.max()) - self.min_code + 1, -1, dtype=np.int64)
+        self.position[value_codes - self.min_code] = np.arange(len(value_codes))
+        self.dependent_codes = {f: np.rint(v * 100).astype(np.int64) for f, v in self.dependents.items()}
+        # plain lists for single-row lookups
+        self._position_list = self.position.tolist()
+        self._dependent_lists = {f: c.tolist() for f, c in self.dependent_codes.items()}
+
+    def index(self, K: np.ndarray, on: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(grid index, on-grid mask) for rows given as codes() output"""
+        k = K[:, self.feature] - self.min_code
+        ok = on[:, self.feature] & (k >= 0) & (k < len(self.position))
+        idx = self.position[np.where(ok, k, 0)]
+        ok &= idx >= 0
+        idx = np.where(ok, idx, 0)
+        for feature, dependent_codes in self.dependent_codes.items():
+            ok &= on[:, feature] & (dependent_codes[idx] == K[:, feature])
+        return idx, ok
+
+    def index_one(self, row: Sequence[float]) -> int:
+        """Grid index of one row, or -1 if it is off the grid"""
+        x = row[self.feature] * 100
+        k = round(x)
+        if abs(x - k) > MATCH_TOLERANCE * 100:
+            return -1
+        k -= self.min_code
+        if not 0 <= k < len(self._position_list):
+            return -1
+        idx = self._position_list[k]
+        if idx < 0:
+            return -1
+        for feature, dependent_codes in self._dependent_lists.items():
+            x = row[feature] * 100
+            if abs(x - dependent_codes[idx]) > MATCH_TOLERANCE * 100:
+                return -1
+        return idx
+
+
+# Reachable inputs per petal, mirroring the rounding in api.py /analyze-test*
+GRIDS: Dict[str, List[Axis]] = {
+    # [reading_accuracy = words_ratio * 0.5, time 0-10, words_read = words_ratio * 50, pronunciation_errors / 17]
+    "reading": [
+        Axis(2, steps(0, 50), {0: np.round(steps(0, 50) / 100, 2)}),
+        Axis(1, steps(0, 10)),
+        Axis(3, ratios(17)),
+    ],
+    # [correct / total, time 0-10, attempted / total, logical_errors / 20]
+    "logic": [
+        Axis(0, steps(0, 1)),
+        Axis(1, steps(0, 10)),
+        Axis(2, steps(0, 1)),
+        Axis(3, ratios(20)),
+    ],
+    # [grammar = 1 - spelling_errors / 20, time 0-10, word_count 0-50, spelling_errors / 20]
+    "writing": [
+        Axis(3, ratios(20), {0: np.round(1 - ratios(20), 2)}),
+        Axis(1, steps(0, 10)),
+        Axis(2, steps(0, 50)),
+    ],
+    # [recall, response_time / 12, sequence / 15, 1 - errors / 15], all clamped to 0-1
+    "memory": [Axis(feature, steps(0, 1)) for feature in range(4)],
+}
+
+
+def petal_name(model_path: str) -> str:
+    """trained/reading_model.h5 -> reading"""
+    return os.path.basename(model_path).split("_model")[0]
+
+
+def table_paths(model_path: str) -> Tuple[str, str]:
+    """(table .npy, metadata .npz) for model_path"""
+    stem = os.path.splitext(model_path)[0]
+    return f"{stem}.lut.npy", f"{stem}.lut.npz"
+
+
+def grid_shape(axes: Sequence[Axis]) -> Tuple[int, ...]:
+    return tuple(len(axis.values) for axis in axes)
+
+
+class LookupTable:
+    """Confidences of one petal network over its input grid"""
+
+    backend = "lookup"
+
+    def __init__(self, axes: Sequence[Axis], table: np.ndarray):
+        self.axes = list(axes)
+        self.table = table.reshape(-1)
+        self.shape = grid_shape(axes)
+        self.strides = [int(np.prod(self.shape[i + 1:])) for i in range(len(self.shape))]
+        self.mapped = isinstance(table, np.memmap)
+
+    def lookup(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (confidences, hit mask) for the rows of X. Rows that are off the grid,
+        or whose stored value is too close to 0.5 to decide the risk, are not
+        hits and their confidences are undefined.
+        """
+        K, on = codes(X)
+        hit = np.ones(len(K), dtype=bool)
+        flat = np.zeros(len(K), dtype=np.int64)
+        for axis, stride in zip(self.axes, self.strides):
+            idx, ok = axis.index(K, on)
+            flat += idx * stride
+            hit &= ok
+        confidences = self.table[flat].astype(np.float32) / np.float32(SCALE)
+        hit &= np.abs(confidences - 0.5) > BOUNDARY
+        return confidences, hit
+
+    def lookup_one(self, row: Sequence[float]) -> Optional[float]:
+        """Confidence for one row, or None if lookup() would not count it as a hit"""
+        flat = 0
+        for axis, stride in zip(self.axes, self.strides):
+            idx = axis.index_one(row)
+            if idx < 0:
+                return None
+            flat += idx * stride
+        confidence = float(np.float32(self.table[flat]) / np.float32(SCALE))
+        if abs(confidence - 0.5) <= BOUNDARY:
+            return None
+        return confidence
+
+
+def grid_rows(axes: Sequence[Axis], flat: np.ndarray, n_features: int = 4) -> np.ndarray:
+    """Input rows for flat grid indices"""
+    X = np.empty((len(flat), n_features), dtype=np.float32)
+    for axis, idx in zip(axes, np.unravel_index(flat, grid_shape(axes))):
+        X[:, axis.feature] = axis.values[idx]
+        for feature, values in axis.dependents.items():
+            X[:, feature] = values[idx]
+    return X
+
+
+def build(model_path: str) -> str:
+    """Evaluate the exported network of model_path over its grid and write the table"""
+    axes = GRIDS[petal_name(model_path)]
+    shape = grid_shape(axes)
+    n_cells = int(np.prod(shape))
+    if n_cells > LOOKUP_MAX_CELLS:
+        raise ValueError(f"{model_path}: grid {shape} has {n_cells} cells, over LOOKUP_MAX_CELLS={LOOKUP_MAX_CELLS}")
+
+    npz_path = petal_engine.npz_path_for(model_path)
+    if not model_registry.export_is_current(model_path, npz_path):
+        petal_engine.export_weights(model_path)
+    net = petal_engine.load_petal_net(npz_path)
+
+    table_path, meta_path = table_paths(model_path)
+    tmp_table = table_path + ".tmp.npy"
+    table = np.lib.format.open_memmap(tmp_table, mode="w+", dtype=np.uint16, shape=(n_cells,))
+    for start in range(0, n_cells, BUILD_CHUNK_ROWS):
+        flat = np.arange(start, min(start + BUILD_CHUNK_ROWS, n_cells))
+        confidences = net.forward(grid_rows(axes, flat))
+        table[start:start + len(flat)] = np.round(np.clip(confidences, 0, 1) * SCALE).astype(np.uint16)
+    table.flush()
+    del table
+    os.replace(tmp_table, table_path)
+
+    arrays = {
+        "n_axes": np.array(len(axes)),
+        "source_sha256": np.array(model_registry.file_sha256(model_path)),
+    }
+    for i, axis in enumerate(axes):
+        arrays[f"axis_{i}_feature"] = np.array(axis.feature)
+        arrays[f"axis_{i}_values"] = axis.values
+        arrays[f"axis_{i}_dependents"] = np.array(list(axis.dependents), dtype=np.int64)
+        for feature, values in axis.dependents.items():
+            arrays[f"axis_{i}_dependent_{feature}"] = values
+    # written last: the registry reloads the table when this file changes
+    tmp_meta = meta_path + ".tmp.npz"
+    np.savez(tmp_meta, **arrays)
+    os.replace(tmp_meta, meta_path)
+    return table_path
+
+
+def load_lookup_table(meta_path: str) -> LookupTable:
+    """Registry loader for trained/*_model.lut.npz (and the .lut.npy beside it)"""
+    with np.load(meta_path) as data:
+        axes = []
+        for i in range(int(data["n_axes"])):
+            dependents = {int(f): data[f"axis_{i}_dependent_{int(f)}"] for f in data[f"axis_{i}_dependents"]}
+            axes.append(Axis(int(data[f"axis_{i}_feature"]), data[f"axis_{i}_values"], dependents))
+    table_path = meta_path[:-len(".npz")] + ".npy"
+    mmap_mode = "r" if os.path.getsize(table_path) > LOOKUP_MMAP_BYTES else None
+    table = np.load(table_path, mmap_mode=mmap_mode)
+    if table.size != int(np.prod(grid_shape(axes))):
+        raise ValueError(f"{table_path}: {table.size} cells, expected grid {grid_shape(axes)}")
+    return LookupTable(axes, table)
+
+
+def table_available(model_path: str) -> bool:
+    table_path, meta_path = table_paths(model_path)
+    return os.path.exists(table_path) and model_registry.export_is_current(model_path, meta_path)
+
+
+def get_table(model_path: str) -> Optional[LookupTable]:
+    """The lookup table for model_path, or None while it is missing or stale"""
+    meta_path = table_paths(model_path)[1]
+    if not model_registry.export_is_current(model_path, meta_path):
+        return None
+    try:
+        return model_registry.get_model(meta_path, load_lookup_table)
+    except OSError:
+        # .lut.npy missing or unreadable
+        return None
+
+
+def record_rows(model_path: str, hits: int, fallbacks: int) -> None:
+    model = petal_name(model_path)
+    if hits:
+        LOOKUP_ROWS.inc(hits, model=model, result="hit")
+    if fallbacks:
+        LOOKUP_ROWS.inc(fallbacks, model=model, result="fallback")
+
+
+def check(model_path: str, n_rows: int = 200_000, seed: int = 0) -> Dict[str, Any]:
+    """Table vs network on random on-grid rows"""
+    table = load_lookup_table(table_paths(model_path)[1])
+    rng = np.random.default_rng(seed)
+    X = grid_rows(table.axes, rng.integers(0, int(np.prod(table.shape)), n_rows))
+    reference = petal_engine.load_petal_net(petal_engine.npz_path_for(model_path)).forward(X)
+    confidences, hit = table.lookup(X)
+    diff = np.abs(confidences[hit] - reference[hit])
+    return {
+        "rows": n_rows,
+        "hits": int(hit.sum()),
+        "max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+        "flips": int(np.sum((confidences[hit] > 0.5) != (reference[hit] > 0.5))),
+    }
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "plan"
+    model_paths = petal_engine._petal_model_paths()
+
+    if command == "plan":
+        for model_path in model_paths:
+            shape = grid_shape(GRIDS[petal_name(model_path)])
+            cells = int(np.prod(shape))
+            note = "" if cells <= LOOKUP_MAX_CELLS else "  (over LOOKUP_MAX_CELLS)"
+            print(f"{model_path:<28}{str(shape):<26}{cells:>12} cells {cells * 2 / 2**20:>9.1f} MiB{note}")
+    elif command == "build":
+        for model_path in model_paths:
+            started = time.perf_counter()
+            try:
+                path = build(model_path)
+            except ValueError as e:
+                print(f"skipped: {e}")
+                continue
+            print(f"{model_path} -> {path} ({time.perf_counter() - started:.1f}s)")
+    elif command == "check":
+        for model_path in model_paths:
+            if not table_available(model_path):
+                print(f"{model_path:<28}no current table")
+                continue
+            r = check(model_path)
+            print(f"{model_path:<28}hits {r['hits']}/{r['rows']}  max|d| {r['max_abs_diff']:.2e}  flips {r['flips']}")
+    else:
+        print("usage: python petal_lookup.py [plan|build|check]")
+        sys.exit(2)
@@ -1,17 +1,12 @@
-import tensorflow as tf
-import pandas as pd
 import numpy as np
 import random
-
-# 🔒 Fix randomness (training determinism)
-tf.random.set_seed(42)
-np.random.seed(42)
-random.seed(42)
+import petal_engine
 
 MODEL_PATH = "trained/memory_model.h5"
 
 
 def load_data():
+    import pandas as pd
     df = pd.read_csv("data/petal_memory.csv")
     X = df.drop("memory_risk", axis=1).values
     y = df["memory_risk"].values
@@ -19,6 +14,7 @@ def load_data():
 
 
 def build_model(input_dim):
+    import tensorflow as tf
     model = tf.keras.Sequential([
         tf.keras.layers.Dense(16, activation="relu", input_shape=(input_dim,)),
         tf.keras.layers.Dense(8, activation="relu"),
@@ -33,23 +29,40 @@ def build_model(input_dim):
 
 
 def train():
+    import tensorflow as tf
+
+    # 🔒 Fix randomness (training determinism)
+    tf.random.set_seed(42)
+    np.random.seed(42)
+    random.seed(42)
+
     X, y = load_data()
     model = build_model(X.shape[1])
     model.fit(X, y, epochs=30, batch_size=8, verbose=1)
     model.save(MODEL_PATH)
+    petal_engine.export_weights(MODEL_PATH)
+    petal_engine.refresh_fused()
 
 
-def predict_mem(student_input):
-    model = tf.keras.models.load_model(MODEL_PATH)
-    student_input = np.array(student_input).reshape(1, -1)
-    confidence = float(model.predict(student_input)[0][0])
-
+def results_from_confidences(confidences):
+    """Petal output dicts for a sequence of sigmoid confidences"""
     # Standardized petal output
-    return {
-        "memory_score": 1 - confidence,
-        "memory_risk": int(confidence > 0.5),
-        "memory_confidence": confidence
-    }
+    return [
+        {
+            "memory_score": 1 - confidence,
+            "memory_risk": int(confidence > 0.5),
+            "memory_confidence": confidence
+        }
+        for confidence in map(float, confidences)
+    ]
+
+def predict_mem_batch(student_inputs):
+    """One vectorized forward pass for a list of 4-value input rows"""
+    return results_from_confidences(petal_engine.predict_confidences(MODEL_PATH, student_inputs))
+
+
+def predict_mem(student_input):
+    return predict_mem_batch([student_input])[0]
 
 if __name__ == "__main__":
     train()
\ No newline at end of file
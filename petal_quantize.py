@@ -0,0 +1,125 @@
+# petal_quantize.py
+# Post-training weight quantization of the petal networks.
+#   float16: every kernel and bias stored as IEEE half precision
+#   int8:    kernels stored as int8 with one float32 scale per output unit
+#            (symmetric, scale = max|w| / 127); biases stay float32
+# Files sit next to the float32 export (trained/reading_model.int8.npz, ...)
+# and record the sha256 of the .h5 they came from. Serving dequantizes the
+# weights once at load time and runs the usual float32 forward pass, so the
+# quantized variants change accuracy, not code paths. Select one with
+# PETAL_PRECISION=float16|int8 (see petal_engine).
+#
+#   python petal_quantize.py export   # write trained/*_model.float16.npz and *.int8.npz
+#   python petal_quantize.py report   # accuracy and risk flips vs float32 on data/petal_*.csv
+
+import os
+import sys
+from typing import Any, Dict, List
+
+import numpy as np
+
+import model_registry
+import petal_engine
+
+PRECISIONS = ["float16", "int8"]
+
+
+def quantized_path_for(model_path: str, precision: str) -> str:
+    """trained/reading_model.h5 -> trained/reading_model.int8.npz"""
+    return f"{os.path.splitext(model_path)[0]}.{precision}.npz"
+
+
+def quantize_int8(W: np.ndarray):
+    """Per-output-unit symmetric int8: W ~= q * scale"""
+    scale = np.abs(W).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.round(W / scale), -127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+def export_quantized(model_path: str, precision: str) -> str:
+    """Write the float16 or int8 variant of an exported petal network"""
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
+    npz_path = petal_engine.npz_path_for(model_path)
+    if not model_registry.export_is_current(model_path, npz_path):
+        petal_engine.export_weights(model_path)
+    net = petal_engine.load_petal_net(npz_path)
+
+    arrays = {
+        "n_layers": np.array(len(net.kernels)),
+        "precision": np.array(precision),
+        "source_sha256": np.array(model_registry.file_sha256(model_path)),
+    }
+    for i, (W, b) in enumerate(zip(net.kernels, net.biases)):
+        if precision == "float16":
+            arrays[f"kernel_{i}"] = W.astype(np.float16)
+            arrays[f"bias_{i}"] = b.astype(np.float16)
+        else:
+            arrays[f"kernel_q_{i}"], arrays[f"kernel_scale_{i}"] = quantize_int8(W)
+            arrays[f"bias_{i}"] = b
+    path = quantized_path_for(model_path, precision)
+    np.savez_compressed(path, **arrays)
+    return path
+
+
+def load_quantized_net(path: str) -> petal_engine.PetalNet:
+    """Registry loader: dequantize to a float32 PetalNet"""
+    with np.load(path) as data:
+        precision = str(data["precision"])
+        weights = []
+        for i in range(int(data["n_layers"])):
+            if precision == "int8":
+                W = data[f"kernel_q_{i}"].astype(np.float32) * data[f"kernel_scale_{i}"]
+            else:
+                W = data[f"kernel_{i}"]
+            weights.append(W)
+            weights.append(data[f"bias_{i}"])
+    net = petal_engine.PetalNet(weights)
+    net.backend = f"numpy-{precision}"
+    return net
+
+
+def compare(model_path: str, precision: str, X: np.ndarray, y: np.ndarray) -> Dict[str, Any]:
+    """Quantized vs float32 on X: confidence error, accuracy and risk-decision flips"""
+    reference = petal_engine.load_petal_net(petal_engine.npz_path_for(model_path)).forward(X)
+    quantized = load_quantized_net(quantized_path_for(model_path, precision)).forward(X)
+    diff = np.abs(quantized - reference)
+    reference_risk = reference > 0.5
+    quantized_risk = quantized > 0.5
+    return {
+        "rows": len(X),
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "accuracy_float32": float(np.mean(reference_risk == y)),
+        "accuracy": float(np.mean(quantized_risk == y)),
+        "flips": int(np.sum(reference_risk != quantized_risk)),
+        "file_bytes": os.path.getsize(quantized_path_for(model_path, precision)),
+        "float32_file_bytes": os.path.getsize(petal_engine.npz_path_for(model_path)),
+    }
+
+
+def _petal_modules() -> List[Any]:
+    return petal_engine._petal_modules()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+
+    if command == "export":
+        for module in _petal_modules():
+            for precision in PRECISIONS:
+                print(f"{module.MODEL_PATH} -> {export_quantized(module.MODEL_PATH, precision)}")
+    elif command == "report":
+        print(f"{'model':<28}{'precision':<10}{'rows':>6}{'max|d|':>11}{'mean|d|':>11}"
+              f"{'acc f32':>9}{'acc':>8}{'flips':>7}{'bytes':>8}")
+        for module in _petal_modules():
+            X, y = module.load_data()
+            for precision in PRECISIONS:
+                r = compare(module.MODEL_PATH, precision, X.astype(np.float32), y.astype(bool))
+                print(f"{module.MODEL_PATH:<28}{precision:<10}{r['rows']:>6}{r['max_abs_diff']:>11.2e}"
+                      f"{r['mean_abs_diff']:>11.2e}{r['accuracy_float32']:>9.3f}{r['accuracy']:>8.3f}"
+                      f"{r['flips']:>7}{r['file_bytes']:>8}")
+    else:
+        print("usage: python petal_quantize.py [export|report]")
+        sys.exit(2)
@@ -0,0 +1,177 @@
+# request_coalescer.py
+# Micro-batching for single-row petal predictions.
+# Concurrent /predict-* requests are held for a short window (or until
+# max_batch_size rows are waiting) and then scored with one batched call to
+# the petal module's predict_*_batch(). Each caller's future is resolved with
+# its own row's result. The response is not always bit-identical to an
+# unbatched call: float32 matmuls may accumulate in a different order for
+# other batch sizes, so a confidence can move in its last bits (around 1e-7,
+# well inside the 1e-5 PARITY_TOLERANCE that `python petal_engine.py check`
+# verifies against Keras).
+# With an executor the batch runs on its worker threads, off the event loop.
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+from inference_executor import BoundedExecutor, ExecutorSaturated
+
+COALESCE_ENABLED = os.environ.get("COALESCE_ENABLED", "1") != "0"
+COALESCE_WINDOW_MS = float(os.environ.get("COALESCE_WINDOW_MS", "3"))
+COALESCE_MAX_BATCH = int(os.environ.get("COALESCE_MAX_BATCH", "32"))
+
+# upper bounds for the batch size histogram
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+# recent queue waits kept for percentiles
+_WAIT_SAMPLES = 2048
+
+
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RequestCoalescer:
+    """Collects single rows for up to window_ms and scores them as one batch"""
+
+    def __init__(self, name: str, predict_batch: Callable[[List[Any]], List[Any]],
+                 window_ms: float = COALESCE_WINDOW_MS, max_batch_size: int = COALESCE_MAX_BATCH,
+                 executor: Optional[BoundedExecutor] = None):
+        self.name = name
+        self.predict_batch = predict_batch
+        self.executor = executor
+        self.window_s = max(window_ms, 0.0) / 1000
+        self.max_batch_size = max(int(max_batch_size), 1)
+
+        self._pending: List[Tuple[Any, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # the loop keeps only weak references to tasks: hold running batches here
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.scored = 0
+        self.batches = 0
+        self.errors = 0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.max_batch_seen = 0
+        self.wait_ms_total = 0.0
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+
+    @property
+    def pending(self) -> int:
+        """Rows waiting for the current window to close"""
+        return len(self._pending)
+
+    async def submit(self, row: Any) -> Any:
+        """Queue one row and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future, time.perf_counter()))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future, float]]) -> None:
+        # rows whose caller has gone away (cancelled) are not scored
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+        try:
+            await self._score(batch)
+        except asyncio.CancelledError:
+            for _, future, _ in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            # never leave a caller waiting on a batch that failed outside the scoring
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _score(self, batch: List[Tuple[Any, asyncio.Future, float]]) -> None:
+        started = time.perf_counter()
+        self._record_batch(len(batch), [(started - enqueued) * 1000 for _, _, enqueued in batch])
+
+        rows = [row for row, _, _ in batch]
+        try:
+            results = await self._predict(rows)
+        except ExecutorSaturated as e:
+            results = [e] * len(rows)
+        except Exception:
+            # one bad row must not fail its neighbours: score rows one by one
+            results = []
+            for row in rows:
+                try:
+                    results.append((await self._predict([row]))[0])
+                except Exception as e:
+                    self.errors += 1
+                    results.append(e)
+        if len(results) != len(rows):
+            raise ValueError(f"{self.name}: predict_batch returned {len(results)} results for {len(rows)} rows")
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _predict(self, rows: List[Any]) -> List[Any]:
+        if self.executor is not None:
+            return await self.executor.run(self.predict_batch, rows)
+        return self.predict_batch(rows)
+
+    def _record_batch(self, size: int, waits_ms: List[float]) -> None:
+        self.batches += 1
+        self.scored += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+            if size <= bound:
+                self.batch_size_counts[i] += 1
+                break
+        else:
+            self.batch_size_counts[-1] += 1
+        self.wait_ms_total += sum(waits_ms)
+        self._waits.extend(waits_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        labels = [f"<={bound}" for bound in BATCH_SIZE_BUCKETS] + [f">{BATCH_SIZE_BUCKETS[-1]}"]
+        return {
+            "window_ms": self.window_s * 1000,
+            "max_batch_size": self.max_batch_size,
+            "requests": self.requests,
+            "batches": self.batches,
+            "errors": self.errors,
+            "pending": self.pending,
+            "avg_batch_size": round(self.scored / self.batches, 2) if self.batches else 0.0,
+            "max_batch_seen": self.max_batch_seen,
+            "batch_sizes": dict(zip(labels, self.batch_size_counts)),
+            "queue_wait_ms": {
+                "avg": round(self.wait_ms_total / self.scored, 3) if self.scored else 0.0,
+                "p50": round(_percentile(waits, 0.50), 3),
+                "p95": round(_percentile(waits, 0.95), 3),
+                "p99": round(_percentile(waits, 0.99), 3),
+                "max": round(waits[-1], 3) if waits else 0.0,
+            },
+        }
@@ -0,0 +1,113 @@
+# result_cache.py
+# Bounded LRU + TTL cache of prediction results.
+# Inputs reaching the prediction endpoints are short vectors of rounded
+# floats, and retries/page reloads resend identical ones, so api.py looks the
+# exact input vector up here before running inference. Each cache is tied to
+# a model version (the mtimes of the files being served): when a lookup
+# arrives with a different version the cache is cleared, so a retrained or
+# re-exported model never serves stale results.
+# RESULT_CACHE_SIZE entries per cache (0 disables caching), each valid for
+# RESULT_CACHE_TTL_S seconds.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import metrics
+
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "10000"))
+RESULT_CACHE_TTL_S = float(os.environ.get("RESULT_CACHE_TTL_S", "3600"))
+
+CACHE_HITS = metrics.counter("result_cache_hits_total", "Prediction results served from the result cache", ("cache",))
+CACHE_MISSES = metrics.counter("result_cache_misses_total", "Result cache lookups that needed inference", ("cache",))
+
+_MISSING = object()
+
+
+class ResultCache:
+    """Thread-safe LRU with per-entry expiry, invalidated on model version change"""
+
+    def __init__(self, name: str, max_size: int = RESULT_CACHE_SIZE, ttl_s: float = RESULT_CACHE_TTL_S):
+        self.name = name
+        self.max_size = max(int(max_size), 0)
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _check_version(self, version: Hashable) -> None:
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, version: Hashable, key: Hashable) -> Any:
+        """The cached result, or None on a miss"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] < now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+                CACHE_MISSES.inc(cache=self.name)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        CACHE_HITS.inc(cache=self.name)
+        return entry[1]
+
+    def put(self, version: Hashable, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+def vector_key(values: Any) -> Tuple[float, ...]:
+    """Exact input vector as a hashable key"""
+    return tuple(float(v) for v in values)
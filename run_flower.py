@@ -1,6 +1,14 @@
 from flask import Flask, request, jsonify
 import json
 
+import model_registry
+import petal_engine
+import warmup
+import petal_memory
+import petal_logic
+import petal_reading
+import petal_writing
+
 from petal_memory import predict_mem
 from petal_logic import predict_logic
 from petal_reading import predict_read
@@ -123,12 +131,47 @@ def predict_memory_endpoint():
         }), 400
 
 @app.route("/health", methods=["GET"])
+@app.route("/health/live", methods=["GET"])
 def health():
-    """Health check endpoint"""
+    """Liveness: the process is up and serving"""
     return jsonify({
         "status": "healthy",
         "service": "Petal Analysis API"
     })
 
+@app.route("/health/ready", methods=["GET"])
+def ready():
+    """Readiness: the petal models are loaded and answered a dummy prediction"""
+    readiness = warmup.readiness()
+    readiness["model_files"] = model_registry.model_stats()
+    readiness["service"] = "Petal Analysis API"
+    return jsonify(readiness), 200 if readiness["ready"] else 503
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """Per-model load times and reload counts"""
+    return jsonify({
+        "models": model_registry.model_stats()
+    })
+
+PETAL_MODEL_PATHS = [
+    petal_reading.MODEL_PATH,
+    petal_logic.MODEL_PATH,
+    petal_writing.MODEL_PATH,
+    petal_memory.MODEL_PATH,
+]
+
+def load_petals():
+    for model_path in PETAL_MODEL_PATHS:
+        petal_engine.get_net(model_path)
+
+def probe_petals():
+    for predict in (predict_read, predict_logic, predict_write, predict_mem):
+        predict([0.0, 0.0, 0.0, 0.0])
+
+# load the petal models and run one dummy prediction each when the app is created,
+# so /health/ready turns ready under `flask run` and WSGI hosts too (WARMUP=blocking waits here)
+warmup.start({"petals": load_petals}, {"petals": probe_petals})
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,396 @@
+# scoring.py
+# Columnar versions of the /analyze-test1..4 normalization pipelines.
+# Each score_* function takes a dict of equal-length NumPy columns (the
+# request fields) and returns the four output columns, with the same float
+# arithmetic as the per-request code in api.py / api_lite.py, so every value
+# is bit-identical. round2() reproduces Python's round(x, 2), which rounds the
+# exact decimal value of x rather than x * 100 like np.round.
+#
+# rescore() applies them to a whole NDJSON log (entries written by
+# data_logger carry the numeric request fields under "input") or a CSV of raw
+# submissions, a chunk of rows at a time, when scoring rules change.
+#
+#   python scoring.py rescore test_data_logs.ndjson --out rescored.ndjson
+#   python scoring.py rescore submissions.csv --variant lite --test-type reading
+#   python scoring.py check      # columnar vs api.py / api_lite.py on random inputs
+
+import argparse
+import csv
+import json
+import sys
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RESCORE_CHUNK_ROWS = 100_000
+
+Columns = Dict[str, np.ndarray]
+
+
+def round2(x: Any) -> np.ndarray:
+    """Elementwise round(x, 2), bit-identical to Python's"""
+    x = np.asarray(x, dtype=np.float64)
+    scaled = x * 100
+    out = np.rint(scaled) / 100
+    # x * 100 can land on the wrong side of a .5 tie; redo those with round()
+    near_tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) <= 1e-7 * np.maximum(np.abs(scaled), 1)
+    if near_tie.any():
+        out[near_tie] = [round(float(v), 2) for v in x[near_tie]]
+    return out
+
+
+def normalize_score(score: Any, min_val: float = 0.0, max_val: float = 1.0) -> np.ndarray:
+    """
+    max(min_val, min(max_val, score)), elementwise. Written with comparisons
+    like the builtins (which keep their first argument on ties), so -0.0
+    clamps to 0.0 where np.maximum would keep -0.0
+    """
+    score = np.where(score < max_val, score, max_val)
+    return np.where(score > min_val, score, min_val)
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """numerator / denominator where denominator != 0, else 0.0"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator != 0, numerator / np.where(denominator != 0, denominator, 1), 0.0)
+
+
+def compute_time_score(time_ms: np.ndarray, max_time_ms: np.ndarray, range_max: float = 10.0) -> np.ndarray:
+    """api.py compute_time_score: max * (1 - ratio) / (max / range_max), range_max when time_ms <= 0"""
+    time_ratio = _ratio(time_ms, max_time_ms)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = np.where(time_ms > 0, max_time_ms * (1 - time_ratio) / (max_time_ms / range_max), range_max)
+    return np.where(max_time_ms == 0, 0.0, normalize_score(score, 0.0, range_max))
+
+
+def compute_time_score_lite(time_ms: np.ndarray, max_time_ms: np.ndarray, range_max: float = 10.0) -> np.ndarray:
+    """api_lite.py compute_time_score: range_max * (1 - ratio)"""
+    score = range_max * (1 - _ratio(time_ms, max_time_ms))
+    return np.where(max_time_ms == 0, 0.0, normalize_score(score, 0.0, range_max))
+
+
+def compute_word_count_score(words_count: np.ndarray, total_words: np.ndarray) -> np.ndarray:
+    return np.where(total_words == 0, 0.0, normalize_score(_ratio(words_count, total_words) * 50, 0.0, 50.0))
+
+
+# ============ api.py ============
+
+def score_test1(c: Columns) -> List[np.ndarray]:
+    accuracy = np.where(c["total_words"] > 0, normalize_score(_ratio(c["words_read"], c["total_words"])), 0.0) * 0.5
+    return [
+        round2(accuracy),
+        round2(compute_time_score(c["reading_time_ms"], c["max_reading_time_ms"])),
+        round2(compute_word_count_score(c["words_read"], c["total_words"])),
+        round2(normalize_score(c["pronunciation_errors"] / 17)),
+    ]
+
+
+def score_test2(c: Columns) -> List[np.ndarray]:
+    has_questions = c["total_questions"] > 0
+    return [
+        round2(normalize_score(np.where(has_questions, _ratio(c["correct_answers"], c["total_questions"]), 0.0))),
+        round2(compute_time_score(c["logic_time_ms"], c["max_logic_time_ms"])),
+        round2(normalize_score(np.where(has_questions, _ratio(c["questions_attempted"], c["total_questions"]), 0.0))),
+        round2(normalize_score(c["logical_errors"] / 20)),
+    ]
+
+
+def score_test3(c: Columns) -> List[np.ndarray]:
+    return [
+        round2(normalize_score(1.0 - (c["spelling_errors"] / 20))),
+        round2(compute_time_score(c["writing_time_ms"], c["max_writing_time_ms"])),
+        round2(compute_word_count_score(c["words_written"], c["total_words"])),
+        round2(normalize_score(c["spelling_errors"] / 20)),
+    ]
+
+
+def score_test4(c: Columns) -> List[np.ndarray]:
+    return [
+        round2(normalize_score(c["recall_accuracy"])),
+        round2(normalize_score(c["response_time"] / 12)),
+        round2(normalize_score(c["sequence_length"] / 15)),
+        round2(1 - normalize_score(c["error_count"] / 15)),
+    ]
+
+
+# ============ api_lite.py ============
+
+def score_test1_lite(c: Columns) -> List[np.ndarray]:
+    return [
+        round2(normalize_score(np.where(c["total_words"] > 0, _ratio(c["words_read"], c["total_words"]), 0.0))),
+        round2(compute_time_score_lite(c["reading_time_ms"], c["max_reading_time_ms"])),
+        round2(compute_word_count_score(c["words_read"], c["total_words"])),
+        round2(normalize_score(c["pronunciation_errors"] / 17)),
+    ]
+
+
+def score_test2_lite(c: Columns) -> List[np.ndarray]:
+    has_questions = c["total_questions"] > 0
+    return [
+        round2(normalize_score(np.where(has_questions, _ratio(c["correct_answers"], c["total_questions"]), 0.0))),
+        round2(compute_time_score_lite(c["logic_time_ms"], c["max_logic_time_ms"])),
+        # the raw count capped at 16; round() leaves ints as ints
+        np.minimum(c["questions_attempted"], 16).astype(np.int64),
+        round2(normalize_score(c["logical_errors"] / 20)),
+    ]
+
+
+def score_test3_lite(c: Columns) -> List[np.ndarray]:
+    return [
+        round2(normalize_score(1.0 - (c["spelling_errors"] / 20))),
+        round2(compute_time_score_lite(c["writing_time_ms"], c["max_writing_time_ms"])),
+        round2(compute_word_count_score(c["words_written"], c["total_words"])),
+        round2(normalize_score(c["spelling_errors"] / 20)),
+    ]
+
+
+def score_test4_lite(c: Columns) -> List[np.ndarray]:
+    n = len(c["speaking_time_ms"])
+    return [
+        np.zeros(n),
+        round2(compute_time_score_lite(c["speaking_time_ms"], c["max_speaking_time_ms"])),
+        np.ones(n),
+        np.ones(n),
+    ]
+
+
+class Pipeline:
+    """Request fields (name -> default, None if required; integer fields are ints) and a columnar scorer"""
+
+    def __init__(self, scorer: Callable[[Columns], List[np.ndarray]], fields: Dict[str, Optional[float]],
+                 integer: bool = True):
+        self.scorer = scorer
+        self.fields = fields
+        self.integer = integer
+
+    def columns(self, inputs: Sequence[Dict[str, Any]]) -> Tuple[Columns, np.ndarray]:
+        """(columns, valid mask); rows the endpoint would reject are invalid and hold 0 in every column"""
+        valid = np.ones(len(inputs), dtype=bool)
+        columns = {}
+        for name, default in self.fields.items():
+            values = [row.get(name, default) for row in inputs]
+            if all(type(value) is int or type(value) is float for value in values):
+                column = np.array(values, dtype=np.float64)
+                if self.integer:
+                    valid &= np.isfinite(column) & (column == np.floor(column))
+                columns[name] = column
+                continue
+            # mixed types: the slow path
+            column = np.zeros(len(inputs), dtype=np.float64)
+            for i, value in enumerate(values):
+                if isinstance(value, str) and not self.integer:
+                    # the dict endpoint does arithmetic on the raw JSON value
+                    valid[i] = False
+                    continue
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    valid[i] = False
+                    continue
+                if self.integer and not value.is_integer():
+                    valid[i] = False
+                    continue
+                column[i] = value
+            columns[name] = column
+        for name in columns:
+            columns[name][~valid] = 0.0
+        return columns, valid
+
+    def score(self, inputs: Sequence[Dict[str, Any]]) -> List[Optional[List[Any]]]:
+        """Output arrays for each row of inputs (None where the endpoint would reject the row)"""
+        columns, valid = self.columns(inputs)
+        with np.errstate(all="ignore"):
+            outputs = [column.tolist() for column in self.scorer(columns)]
+        return [list(values) if ok else None for ok, values in zip(valid.tolist(), zip(*outputs))]
+
+
+_TEST1 = ("words_read", "total_words", "reading_time_ms", "max_reading_time_ms", "pronunciation_errors")
+_TEST2 = ("questions_attempted", "correct_answers", "total_questions", "logic_time_ms", "max_logic_time_ms",
+          "logical_errors")
+_TEST3 = ("words_written", "total_words", "writing_time_ms", "max_writing_time_ms", "spelling_errors")
+
+# test_type as logged / returned by each API variant -> pipeline
+PIPELINES: Dict[str, Dict[str, Pipeline]] = {
+    "api": {
+        "reading": Pipeline(score_test1, dict.fromkeys(_TEST1)),
+        "logic": Pipeline(score_test2, dict.fromkeys(_TEST2)),
+        "grammar_writing": Pipeline(score_test3, dict.fromkeys(_TEST3)),
+        "memory_recognition": Pipeline(score_test4, {"recall_accuracy": 0.5, "response_time": 6,
+                                                     "sequence_length": 7.5, "error_count": 7.5}, integer=False),
+    },
+    "lite": {
+        "reading": Pipeline(score_test1_lite, dict.fromkeys(_TEST1)),
+        "logic": Pipeline(score_test2_lite, dict.fromkeys(_TEST2)),
+        "grammar_writing": Pipeline(score_test3_lite, dict.fromkeys(_TEST3)),
+        "speaking_audio": Pipeline(score_test4_lite, dict.fromkeys(("speaking_time_ms", "max_speaking_time_ms"))),
+    },
+}
+
+
+def _csv_value(value: str) -> Any:
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+def read_records(path: str, test_type: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Log entries from an NDJSON log (with its rotated segments) or rows of a
+    CSV of raw submissions, as {"test_type", "input", ...} records
+    """
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                values = {key: _csv_value(value) for key, value in row.items() if value != ""}
+                record = {key: values.pop(key) for key in ("user_id", "test_id", "timestamp") if key in values}
+                record["test_type"] = test_type or str(values.pop("test_type", ""))
+                values.pop("test_type", None)
+                record["input"] = values
+                yield record
+        return
+
+    import log_rotation
+    for entry in log_rotation.iter_entries(path):
+        if test_type is not None and entry.get("test_type") != test_type:
+            continue
+        yield entry
+
+
+def _chunks(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rescore(records: Iterable[Dict[str, Any]], variant: str = "api",
+            chunk_rows: int = RESCORE_CHUNK_ROWS) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """
+    (record, status) for every record, with "array" replaced by the re-scored
+    values and the logged one kept as "previous_array". status is "same",
+    "changed", "new" (no previous array), "no_input", "invalid" or "unknown_type".
+    """
+    pipelines = PIPELINES[variant]
+    for chunk in _chunks(records, chunk_rows):
+        by_type: Dict[str, List[int]] = {}
+        statuses: List[str] = [""] * len(chunk)
+        for i, record in enumerate(chunk):
+            if record.get("test_type") not in pipelines:
+                statuses[i] = "unknown_type"
+            elif not isinstance(record.get("input"), dict):
+                statuses[i] = "no_input"
+            else:
+                by_type.setdefault(record["test_type"], []).append(i)
+
+        arrays: Dict[int, Optional[List[Any]]] = {}
+        for test_type, indices in by_type.items():
+            results = pipelines[test_type].score([chunk[i]["input"] for i in indices])
+            arrays.update(zip(indices, results))
+
+        for i, record in enumerate(chunk):
+            if statuses[i]:
+                yield record, statuses[i]
+                continue
+            array = arrays[i]
+            if array is None:
+                yield record, "invalid"
+                continue
+            out = dict(record)
+            previous = record.get("array")
+            if previous is not None:
+                out["previous_array"] = previous
+            out["array"] = array
+            yield out, ("new" if previous is None else "same" if previous == array else "changed")
+
+
+# ============ CHECK ============
+
+def _random_inputs(rng: np.random.Generator, fields: Sequence[str], n: int, integer: bool) -> List[Dict[str, Any]]:
+    rows = []
+    for _ in range(n):
+        row: Dict[str, Any] = {}
+        for name in fields:
+            if integer:
+                # zeros, small counts, millisecond times and the odd negative
+                value = int(rng.choice([0, rng.integers(0, 40), rng.integers(0, 120_000), -rng.integers(0, 100)],
+                                       p=[0.1, 0.5, 0.3, 0.1]))
+            else:
+                value = float(rng.choice([0.0, rng.uniform(-1, 20), round(rng.uniform(0, 15), 2)], p=[0.1, 0.6, 0.3]))
+            row[name] = value
+        rows.append(row)
+    return rows
+
+
+def check(n_rows: int = 20_000, seed: int = 0) -> Dict[str, int]:
+    """Rows where the columnar pipelines differ from the endpoints' own scoring code"""
+    import api
+    import api_lite
+
+    scalar = {
+        ("api", "reading"): lambda row: api.score_test1(api.Test1Data(user_id="u", test_id="t", text_content="", **row)),
+        ("api", "logic"): lambda row: api.score_test2(api.Test2Data(user_id="u", test_id="t", **row)),
+        ("api", "grammar_writing"): lambda row: api.score_test3(api.Test3Data(user_id="u", test_id="t", text_written="",
+                                                                              **row)),
+        ("api", "memory_recognition"): api.score_test4,
+        ("lite", "reading"): lambda row: api_lite.score_test1(api_lite.Test1Data(user_id="u", test_id="t",
+                                                                                 text_content="", **row)),
+        ("lite", "logic"): lambda row: api_lite.score_test2(api_lite.Test2Data(user_id="u", test_id="t", **row)),
+        ("lite", "grammar_writing"): lambda row: api_lite.score_test3(api_lite.Test3Data(
+            user_id="u", test_id="t", text_written="", **row)),
+        ("lite", "speaking_audio"): lambda row: api_lite.score_test4(api_lite.Test4Data(
+            user_id="u", test_id="t", expected_text="", **row)),
+    }
+    rng = np.random.default_rng(seed)
+    mismatches = {}
+    for (variant, test_type), score_one in scalar.items():
+        pipeline = PIPELINES[variant][test_type]
+        inputs = _random_inputs(rng, list(pipeline.fields), n_rows, pipeline.integer)
+        expected = [score_one(row) for row in inputs]
+        actual = pipeline.score(inputs)
+        # compare the JSON the endpoint would return (also catches 1 vs 1.0 and -0.0)
+        mismatches[f"{variant}/{test_type}"] = sum(json.dumps(a) != json.dumps(e) for a, e in zip(actual, expected))
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk re-scoring of raw test submissions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rescore = sub.add_parser("rescore", help="re-score an NDJSON log (and its segments) or a CSV")
+    p_rescore.add_argument("path")
+    p_rescore.add_argument("--variant", choices=sorted(PIPELINES), default="api")
+    p_rescore.add_argument("--test-type", help="only this test_type (CSV: the test_type of every row)")
+    p_rescore.add_argument("--out", help="write every record as NDJSON, re-scored where possible and otherwise "
+                                      "unchanged (default: summary only)")
+    p_check = sub.add_parser("check", help="columnar vs per-request scoring on random inputs")
+    p_check.add_argument("--rows", type=int, default=20_000)
+    args = parser.parse_args()
+
+    if args.command == "rescore":
+        counts: Counter = Counter()
+        out = open(args.out, "w", encoding="utf-8") if args.out else None
+        try:
+            for record, status in rescore(read_records(args.path, args.test_type), args.variant):
+                counts[(record.get("test_type", ""), status)] += 1
+                # records that could not be re-scored are kept as logged, so --out can replace the log
+                if out is not None:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        finally:
+            if out is not None:
+                out.close()
+        print(f"{'test_type':<22}{'status':<14}{'rows':>10}")
+        for (test_type, status), n in sorted(counts.items()):
+            print(f"{test_type:<22}{status:<14}{n:>10}")
+    else:
+        results = check(args.rows)
+        for name, n in results.items():
+            print(f"{name:<32}{n} mismatches / {args.rows}")
+        sys.exit(1 if any(results.values()) else 0)
@@ -173,6 +173,24 @@ def test_multiple_tests():
     print_response(response, "Multiple Tests Analysis Response")
     return response.status_code == 200
 
+def test_batch_prediction():
+    """Test scoring a whole class with the batch endpoints"""
+    print("\n[7] Testing Batch Predictions...")
+    
+    rows = [
+        [0.45, 5.0, 45.0, 0.12],
+        [0.30, 2.5, 30.0, 0.47],
+        [0.10, 1.0, 10.0, 0.88]
+    ]
+    
+    response = requests.post(
+        f"{BASE_URL}/predict-reading-batch",
+        json={"rows": rows},
+        headers={"Content-Type": "application/json"}
+    )
+    print_response(response, "Reading Batch Prediction Response")
+    return response.status_code == 200 and response.json().get("count") == len(rows)
+
 def run_all_tests():
     """Run all tests"""
     print("\n" + "="*60)
@@ -186,6 +204,7 @@ def run_all_tests():
         ("Grammar Analysis", test_grammar_analysis),
         ("Speaking Analysis", test_speaking_analysis),
         ("Multiple Tests", test_multiple_tests),
+        ("Batch Predictions", test_batch_prediction),
     ]
     
     results = {}
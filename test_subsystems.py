@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+"""
+Tests for the stateful subsystems behind the API (no server needed)
+Run this script, or pytest test_subsystems.py; every test works in its own
+temporary directory
+"""
+
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import data_logger
+import history_store
+import log_rotation
+import passage_index
+import scoring
+import tracing
+import transcription_jobs
+import word_align
+from inference_executor import BoundedExecutor
+from request_coalescer import RequestCoalescer
+
+def _entry(i: int, day: str = "2026-10-16") -> dict:
+    return {"timestamp": f"{day}T00:00:{i % 60:02d}Z", "user_id": f"user_{i % 3}", "i": i, "pad": "x" * 40}
+
+def test_log_rotation_manifest():
+    """Size rotation writes compressed segments whose manifest counts add up"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "logs.ndjson")
+        log = log_rotation.RotatingLog(path, max_bytes=2000, daily=False, compression="gzip")
+        for i in range(100):
+            log.write([_entry(i)])
+        log.shutdown()
+
+        manifest = log_rotation.read_manifest(path)
+        assert log.rotations == len(manifest["segments"]) > 1
+        live = sum(1 for _ in open(path, encoding="utf-8"))
+        assert sum(segment["records"] for segment in manifest["segments"]) + live == 100
+        for segment in manifest["segments"]:
+            assert segment["file"].endswith(".ndjson.gz")
+            assert segment["raw_bytes"] <= 2000
+            with gzip.open(os.path.join(tmp, segment["file"]), "rt", encoding="utf-8") as f:
+                assert sum(1 for _ in f) == segment["records"]
+        assert [entry["i"] for entry in log_rotation.iter_entries(path)] == list(range(100))
+
+def test_log_rotation_daily_window():
+    """A new UTC day starts a segment, and iter_entries skips segments outside the window"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "logs.ndjson")
+        log = log_rotation.RotatingLog(path, max_bytes=0, daily=True)
+        log.write([_entry(i, "2026-10-14") for i in range(5)] + [_entry(i, "2026-10-15") for i in range(5, 8)])
+        log.write([_entry(8, "2026-10-16")])
+        log.shutdown()
+
+        segments = log_rotation.read_manifest(path)["segments"]
+        assert [(s["first_timestamp"][:10], s["records"]) for s in segments] == [("2026-10-14", 5), ("2026-10-15", 3)]
+        window = list(log_rotation.iter_entries(path, start="2026-10-15", end="2026-10-15T23:59:59Z"))
+        assert [entry["i"] for entry in window] == [5, 6, 7]
+
+def test_log_rotation_max_segments():
+    """LOG_MAX_SEGMENTS keeps only the newest segments on disk and in the manifest"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "logs.ndjson")
+        log = log_rotation.RotatingLog(path, max_bytes=500, daily=False, max_segments=2)
+        for i in range(60):
+            log.write([_entry(i)])
+        log.shutdown()
+
+        segments = log_rotation.read_manifest(path)["segments"]
+        assert len(segments) == 2
+        on_disk = sorted(name for name in os.listdir(tmp) if name.endswith(".gz"))
+        assert on_disk == [segment["file"] for segment in segments]
+
+def test_log_rotation_two_writers():
+    """Two writers on one file (as two API processes) lose nothing across each other's rotations"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "logs.ndjson")
+        writers = [log_rotation.RotatingLog(path, max_bytes=1500, daily=False) for _ in range(2)]
+        for i in range(200):
+            writers[i % 2].write([_entry(i)])
+        for log in writers:
+            log.shutdown()
+
+        entries = list(log_rotation.iter_entries(path))
+        assert sorted(entry["i"] for entry in entries) == list(range(200))
+        segments = log_rotation.read_manifest(path)["segments"]
+        live = sum(1 for _ in open(path, encoding="utf-8"))
+        assert sum(segment["records"] for segment in segments) + live == 200
+        assert len({segment["file"] for segment in segments}) == len(segments)
+
+def test_log_rotation_pending_segments():
+    """Segments are readable right after rotation, and stay readable if compression fails"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "logs.ndjson")
+        log = log_rotation.RotatingLog(path, max_bytes=1000, daily=False)
+
+        def fail(closed):
+            raise OSError("disk full")
+
+        log._compress = fail
+        for i in range(40):
+            log.write([_entry(i)])
+        segments = log_rotation.read_manifest(path)["segments"]
+        assert log.rotations == len(segments) > 1
+        assert all(segment["compression"] is None for segment in segments)
+        assert [entry["i"] for entry in log_rotation.iter_entries(path)] == list(range(40))
+        log.shutdown()
+
+        # a later writer compresses the leftovers and updates their listing in place
+        log_rotation.RotatingLog(path, max_bytes=1000, daily=False).shutdown()
+        compressed = log_rotation.read_manifest(path)["segments"]
+        assert [s["file"] for s in compressed] == [s["file"] + ".gz" for s in segments]
+        assert [s["records"] for s in compressed] == [s["records"] for s in segments]
+        assert [entry["i"] for entry in log_rotation.iter_entries(path)] == list(range(40))
+
+def test_data_logger_queue():
+    """A full queue drops and counts entries; shutdown writes everything queued; flush returns after it"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "logs.ndjson")
+        history_enabled, history_store.HISTORY_ENABLED = history_store.HISTORY_ENABLED, False
+        try:
+            writer = data_logger._BufferedWriter(path, queue_size=4, batch_size=1, flush_interval_ms=0,
+                                                 block_timeout_ms=0)
+            writing, release = threading.Event(), threading.Event()
+            write = writer._log.write
+
+            def slow_write(entries):
+                writing.set()
+                release.wait(5)
+                write(entries)
+
+            writer._log.write = slow_write
+            assert writer.submit(_entry(0))
+            assert writing.wait(5)
+            # the writer is busy with entry 0: four entries fill the queue, the next two are dropped
+            assert [writer.submit(_entry(i)) for i in range(1, 7)] == [True] * 4 + [False] * 2
+            release.set()
+            writer.shutdown()
+
+            stats = writer.stats()
+            assert (stats["enqueued"], stats["written"], stats["dropped"], stats["backpressure"]) == (5, 5, 2, 2)
+            assert stats["max_queue_depth"] == 4 and stats["queue_depth"] == 0
+            assert [entry["i"] for entry in log_rotation.iter_entries(path)] == [0, 1, 2, 3, 4]
+
+            flushed = threading.Thread(target=writer.flush, daemon=True)
+            flushed.start()
+            flushed.join(5)
+            assert not flushed.is_alive()
+            writer.shutdown()
+        finally:
+            history_store.HISTORY_ENABLED = history_enabled
+
+def _result(user_id: str, test_type: str, timestamp: str, value: float, test_id: str = "t1") -> dict:
+    return {"timestamp": timestamp, "user_id": user_id, "test_id": test_id, "test_type": test_type,
+            "array": [value, 0, 0, 0]}
+
+def test_history_queries():
+    """Per-user history, latest result per test type and results per test_id"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "history.db")
+        history_store.insert_many([
+            _result("user_001", "reading", "2026-10-14T09:00:00Z", 0.1),
+            _result("user_001", "logic", "2026-10-14T09:05:00Z", 0.2),
+            _result("user_001", "reading", "2026-10-15T09:00:00Z", 0.3, test_id="t2"),
+            _result("user_002", "reading", "2026-10-16T09:00:00Z", 0.4, test_id="t2"),
+        ], path=db)
+        assert history_store.count(path=db) == 4
+
+        history = history_store.user_history("user_001", path=db)
+        assert [row["array"][0] for row in history] == [0.3, 0.2, 0.1]
+        assert [row["array"][0] for row in history_store.user_history("user_001", "reading", path=db)] == [0.3, 0.1]
+        assert [row["array"][0] for row in history_store.user_history("user_001", limit=1, path=db)] == [0.3]
+        older = history_store.user_history("user_001", before="2026-10-15T00:00:00Z", path=db)
+        assert [row["array"][0] for row in older] == [0.2, 0.1]
+
+        latest = history_store.latest_results("user_001", path=db)
+        assert {test_type: row["array"][0] for test_type, row in latest.items()} == {"reading": 0.3, "logic": 0.2}
+        assert [row["user_id"] for row in history_store.test_results("t2", path=db)] == ["user_001", "user_002"]
+        assert history_store.user_history("nobody", path=db) == []
+
+def test_history_same_timestamp():
+    """With equal timestamps the later insert is the latest result"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "history.db")
+        history_store.insert_many([_result("u", "memory", "2026-10-16T09:00:00Z", 0.5)], path=db)
+        history_store.insert_many([_result("u", "memory", "2026-10-16T09:00:00Z", 0.6, test_id="t2")], path=db)
+        assert history_store.latest_results("u", path=db)["memory"]["array"][0] == 0.6
+        assert history_store.user_history("u", path=db)[0]["array"][0] == 0.6
+
+def test_history_backfill():
+    """backfill imports the live log and its rotated segments"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path, db = os.path.join(tmp, "logs.ndjson"), os.path.join(tmp, "history.db")
+        log = log_rotation.RotatingLog(path, max_bytes=1000, daily=False)
+        log.write([_entry(i) for i in range(30)])
+        log.write([_entry(i) for i in range(30, 40)])
+        log.shutdown()
+        assert history_store.backfill(path, path=db, batch_size=7) == 40
+        assert len(history_store.user_history("user_0", limit=100, path=db)) == 14
+
+def test_history_backfill_twice():
+    """Re-running backfill (or replaying entries already recorded) adds no duplicates"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path, db = os.path.join(tmp, "logs.ndjson"), os.path.join(tmp, "history.db")
+        entries = [_result(f"user_{i % 2}", "reading", f"2026-10-16T09:00:{i:02d}Z", i / 10) for i in range(6)]
+        log = log_rotation.RotatingLog(path, max_bytes=0, daily=False)
+        log.write(entries[:4])
+        log.shutdown()
+        assert history_store.insert_many(entries[:2], path=db) == 2
+        assert history_store.backfill(path, path=db) == 2
+        assert history_store.backfill(path, path=db) == 0
+        assert history_store.count(path=db) == 4
+
+        log = log_rotation.RotatingLog(path, max_bytes=0, daily=False)
+        log.write(entries[4:])
+        log.shutdown()
+        assert history_store.backfill(path, path=db) == 2
+        assert history_store.count(path=db) == 6
+        assert len(history_store.user_history("user_0", path=db)) == 3
+        assert history_store.latest_results("user_1", path=db)["reading"]["array"][0] == 0.5
+
+def test_tracing_spans():
+    """Spans inside a trace are recorded, also on executor threads; errors are named; finish clears the trace"""
+    executor = BoundedExecutor(2, 4, name="test-tracing")
+
+    @tracing.traced("work")
+    def work():
+        time.sleep(0.01)
+
+    def fail():
+        with tracing.span("fail"):
+            raise ValueError("boom")
+
+    async def handler():
+        trace = tracing.start("request", user_id="user_001")
+        try:
+            with tracing.span("outer"):
+                await executor.run(work)
+            try:
+                await executor.run(fail)
+            except ValueError:
+                pass
+        finally:
+            tracing.finish(trace)
+        return trace
+
+    trace = asyncio.run(handler())
+    executor.shutdown()
+    spans = {span["name"]: span for span in trace.timings()["spans"]}
+    assert set(spans) == {"outer", "work", "fail"}
+    assert spans["work"]["duration_ms"] >= 10
+    assert spans["outer"]["start_ms"] <= spans["work"]["start_ms"]
+    assert spans["fail"]["error"] == "ValueError" and "error" not in spans["work"]
+    assert trace.duration_ms >= spans["outer"]["duration_ms"]
+    assert tracing.current() is None
+    with tracing.span("no trace"):
+        pass
+
+def test_tracing_sampling():
+    """Slow traces are always kept and written as NDJSON; fast ones follow TRACE_SAMPLE_RATE"""
+    with tempfile.TemporaryDirectory() as tmp:
+        saved = tracing._log, tracing.TRACE_SAMPLE_RATE, tracing.TRACE_SLOW_MS
+        tracing._log = tracing._TraceLog(os.path.join(tmp, "traces.ndjson"), 60, 100)
+        tracing.TRACE_SAMPLE_RATE, tracing.TRACE_SLOW_MS = 0.0, 5
+        try:
+            tracing.finish(tracing.start("fast"))
+            slow = tracing.start("slow", test_id="t1")
+            with tracing.span("sleep"):
+                time.sleep(0.01)
+            tracing.finish(slow)
+            tracing._log.flush()
+            stats = tracing._log.stats()
+            with open(os.path.join(tmp, "traces.ndjson"), encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+        finally:
+            tracing._log, tracing.TRACE_SAMPLE_RATE, tracing.TRACE_SLOW_MS = saved
+        assert stats["finished"] == 2 and stats["sampled"] == stats["written"] == 1
+        assert [(r["name"], r["test_id"], [s["name"] for s in r["spans"]]) for r in records] == [("slow", "t1", ["sleep"])]
+
+def test_tracing_log_rotation():
+    """The trace log is size-rotated and keeps only TRACE_MAX_SEGMENTS segments"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "traces.ndjson")
+        trace_log = tracing._TraceLog(path, 60, 1000, max_bytes=2000, max_segments=2)
+        for i in range(20):
+            for _ in range(5):
+                trace_log.add({"name": "request", "timestamp": f"2026-10-16T00:00:{i:02d}Z", "i": i, "pad": "x" * 60})
+            trace_log.flush()
+        trace_log.shutdown()
+
+        assert trace_log.stats()["written"] == 100
+        segments = log_rotation.read_manifest(path)["segments"]
+        assert len(segments) == 2 and os.path.getsize(path) <= 2000
+        assert sorted(name for name in os.listdir(tmp) if name.endswith(".gz")) == [s["file"] for s in segments]
+        kept = [record["i"] for record in log_rotation.iter_entries(path)]
+        assert kept == sorted(kept) and kept[-1] == 19 and len(kept) < 100
+
+def test_request_coalescer():
+    """Rows batch by window and by size; a bad row fails alone; cancelled rows are not scored"""
+    executor = BoundedExecutor(2, 4, name="test-coalescer")
+    batches = []
+
+    def predict_batch(rows):
+        batches.append(list(rows))
+        if "bad" in rows:
+            raise ValueError("bad row")
+        return [row.upper() for row in rows]
+
+    async def scenario():
+        window = RequestCoalescer("window", predict_batch, window_ms=20, max_batch_size=10, executor=executor)
+        assert await asyncio.gather(*(window.submit(row) for row in "abc")) == ["A", "B", "C"]
+        assert batches == [["a", "b", "c"]]
+
+        batches.clear()
+        size = RequestCoalescer("size", predict_batch, window_ms=1000, max_batch_size=2)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(size.submit(row) for row in "defg"))
+        assert results == ["D", "E", "F", "G"] and batches == [["d", "e"], ["f", "g"]]
+        assert time.perf_counter() - started < 0.5
+
+        batches.clear()
+        results = await asyncio.gather(*(window.submit(row) for row in ["h", "bad", "i"]), return_exceptions=True)
+        assert results[0] == "H" and results[2] == "I" and isinstance(results[1], ValueError)
+        assert batches == [["h", "bad", "i"], ["h"], ["bad"], ["i"]]
+        assert window.errors == 1
+
+        batches.clear()
+        gone = asyncio.ensure_future(window.submit("j"))
+        kept = asyncio.ensure_future(window.submit("k"))
+        await asyncio.sleep(0)
+        gone.cancel()
+        assert await kept == "K" and gone.cancelled()
+        assert batches == [["k"]]
+        assert window.stats()["requests"] == 8 and not window._tasks and not size._tasks
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+@contextmanager
+def _job_queue(**settings):
+    """A job database and spool directory in a temporary directory, with module settings overridden"""
+    with tempfile.TemporaryDirectory() as tmp:
+        settings = dict({"JOBS_SPOOL_DIR": os.path.join(tmp, "spool"), "JOB_RETRY_DELAY_S": 0.0}, **settings)
+        saved = {name: getattr(transcription_jobs, name) for name in settings}
+        for name, value in settings.items():
+            setattr(transcription_jobs, name, value)
+        try:
+            yield os.path.join(tmp, "jobs.db")
+        finally:
+            for name, value in saved.items():
+                setattr(transcription_jobs, name, value)
+
+def _submit(db: str, name: str, priority: int = 0) -> str:
+    return transcription_jobs.submit("test", {"name": name}, [("clip.wav", io.BytesIO(b"RIFF"))], priority, path=db)
+
+def test_jobs_priority_and_spool():
+    """Jobs are claimed highest priority first, then oldest; the clips are spooled per job"""
+    with _job_queue() as db:
+        ids = [_submit(db, "low"), _submit(db, "high", priority=5), _submit(db, "low2")]
+        claimed = [transcription_jobs.claim("w1", path=db) for _ in range(4)]
+        assert [job["request"]["name"] for job in claimed[:3]] == ["high", "low", "low2"]
+        assert claimed[3] is None
+        audio = claimed[0]["request"]["audio"]
+        assert len(audio) == 1 and open(audio[0], "rb").read() == b"RIFF"
+        assert transcription_jobs.get(ids[0], path=db)["status"] == "running"
+        assert transcription_jobs.counts(path=db)["running"] == 3
+
+def test_jobs_queue_limit():
+    """A full queue raises QueueFull and leaves no spooled audio behind"""
+    with _job_queue(JOB_QUEUE_MAX=2) as db:
+        _submit(db, "a")
+        _submit(db, "b")
+        try:
+            _submit(db, "c")
+            raise AssertionError("QueueFull not raised")
+        except transcription_jobs.QueueFull:
+            pass
+        assert transcription_jobs.counts(path=db)["queued"] == 2
+        assert len(os.listdir(transcription_jobs.JOBS_SPOOL_DIR)) == 2
+
+def test_jobs_lease_and_retry():
+    """An expired lease or a dead worker puts the job back until it runs out of attempts"""
+    with _job_queue(JOB_LEASE_S=0.05, JOB_MAX_ATTEMPTS=3) as db:
+        job_id = _submit(db, "a")
+        assert transcription_jobs.claim("w1", path=db)["attempts"] == 1
+        time.sleep(0.1)
+        # w1 stopped renewing its lease: w2 reclaims the job and w1 can no longer complete it
+        assert transcription_jobs.claim("w2", path=db)["attempts"] == 2
+        assert not transcription_jobs.heartbeat(job_id, "w1", path=db)
+        assert not transcription_jobs.complete(job_id, "w1", {}, path=db)
+        assert transcription_jobs.release_worker("w2", path=db) == 1
+        assert transcription_jobs.get(job_id, path=db)["error"] == "worker w2 exited"
+        assert transcription_jobs.claim("w3", path=db)["attempts"] == 3
+        assert transcription_jobs.fail(job_id, "w3", "ValueError: boom", path=db) == "failed"
+        job = transcription_jobs.get(job_id, path=db)
+        assert (job["status"], job["attempts"], job["error"]) == ("failed", 3, "ValueError: boom")
+
+def test_jobs_process_and_deliver():
+    """process_one retries a handler that raises, stores the result, and hands it over to be logged once"""
+    calls = []
+
+    def handler(get_model, request):
+        calls.append(request["name"])
+        if len(calls) == 1:
+            raise RuntimeError("transient")
+        return {"name": request["name"], "model": get_model()}
+
+    with _job_queue(JOB_MAX_ATTEMPTS=2) as db:
+        transcription_jobs.HANDLERS["test"] = handler
+        try:
+            job_id = _submit(db, "a")
+            assert transcription_jobs.process_one("w1", lambda: "stub", path=db) == "queued"
+            assert transcription_jobs.process_one("w1", lambda: "stub", path=db) == "done"
+            assert transcription_jobs.process_one("w1", lambda: "stub", path=db) is None
+        finally:
+            del transcription_jobs.HANDLERS["test"]
+        job = transcription_jobs.get(job_id, path=db)
+        assert (job["status"], job["attempts"], job["result"]) == ("done", 2, {"name": "a", "model": "stub"})
+        assert not os.path.exists(os.path.join(transcription_jobs.JOBS_SPOOL_DIR, job_id))
+        assert [job["job_id"] for job in transcription_jobs.take_unlogged(path=db)] == [job_id]
+        assert transcription_jobs.take_unlogged(path=db) == []
+        assert transcription_jobs.prune(older_than_s=-1, path=db) == 1
+        assert transcription_jobs.get(job_id, path=db) is None
+
+class _CountingEncoder:
+    """Stand-in for a SentenceTransformer: a deterministic vector per text, counting what it encodes"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return np.array([[len(text), text.count("a") + 1.0, sum(map(ord, text)) % 7 + 1.0] for text in texts],
+                        dtype=np.float32)
+
+def test_passage_index_hits_and_misses():
+    """Indexed passages are never encoded again; an unknown passage is encoded once, then served from the LRU"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "passages.emb.npy")
+        encode = _CountingEncoder()
+        passages = ["The cat sat on the mat.", "A  bird   can fly.", "The cat sat on the mat."]
+        assert passage_index.build(passages, encode, path=path) == 2
+        assert encode.encoded == ["The cat sat on the mat.", "A bird can fly."]
+
+        index = passage_index.get_index(path)
+        assert len(index) == 2 and index.row(" A bird can   fly. ") == 1
+        assert isinstance(index.vectors, np.memmap)
+
+        encode.encoded.clear()
+        unknown = f"An unindexed passage {time.time_ns()}"
+        texts = ["A bird can fly.", unknown, "The cat sat on the mat.", unknown]
+        vectors = passage_index.passage_vectors(texts, encode, path=path)
+        assert encode.encoded == [unknown]
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+        assert np.array_equal(vectors[0], index.vectors[1]) and np.array_equal(vectors[1], vectors[3])
+        passage_index.passage_vectors([unknown], encode, path=path)
+        assert encode.encoded == [unknown]
+
+        scores = passage_index.similarity(encode(["A bird can fly.", "zzz"]), vectors[:2])
+        assert scores[0] == 1.0 and -1.0 <= scores[1] < 1.0
+
+        # rebuilding replaces the files: the served memory map keeps its old rows
+        served = np.array(index.vectors)
+        assert passage_index.build(passages + ["A new passage."], encode, path=path) == 3
+        assert np.array_equal(np.array(index.vectors), served)
+        assert len(passage_index.get_index(path)) == 3
+        assert sorted(os.listdir(tmp)) == ["passages.emb.npy", "passages.emb.npz"]
+
+def test_passage_index_other_model():
+    """An index built for another model is not served"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "passages.emb.npy")
+        passage_index.build(["The cat sat."], _CountingEncoder(), path=path, model="another-model")
+        assert passage_index.get_index(path) is None
+        assert passage_index.get_index(os.path.join(tmp, "missing.emb.npy")) is None
+
+def test_word_align_matches_dp():
+    """The bit-parallel aligner agrees with the plain dynamic programme on random word sequences"""
+    result = word_align.check(n_pairs=500, seed=1)
+    assert result["distance_mismatches"] == 0 and result["count_mismatches"] == 0
+
+def test_word_align_reading_counts():
+    """Words read, mispronounced, skipped and added for a misread passage"""
+    counts = word_align.reading_counts("The quick brown fox jumps over the lazy dog.",
+                                       "um the quick brown fax jumps the lazy dog")
+    assert counts == {"words_read": 7, "total_words": 9, "pronunciation_errors": 1,
+                      "words_skipped": 1, "extra_words": 1}
+    steps = word_align.align(word_align.words("the girl's hat"), word_align.words("The girl’s cat"))
+    assert [step.op for step in steps] == ["match", "match", "substitution"]
+    assert word_align.reading_counts("one two", "")["words_skipped"] == 2
+    assert word_align.edit_distance([], ["extra", "words"]) == 2
+
+def test_scoring_matches_endpoints():
+    """The columnar pipelines give the endpoints' arrays exactly"""
+    mismatches = scoring.check(n_rows=2000, seed=1)
+    assert mismatches and not any(mismatches.values()), mismatches
+
+def test_rescore_keeps_every_record():
+    """Records that cannot be re-scored come back unchanged, with their status"""
+    reading = {"words_read": 8, "total_words": 10, "reading_time_ms": 5000, "max_reading_time_ms": 10000,
+               "pronunciation_errors": 2}
+    records = [
+        {"test_type": "reading", "input": reading, "array": [0, 0, 0, 0]},
+        {"test_type": "reading", "array": [1, 2, 3, 4]},
+        {"test_type": "reading", "input": dict(reading, total_words=0)},
+        {"test_type": "unknown", "input": reading},
+    ]
+    results = list(scoring.rescore(records, chunk_rows=3))
+    assert [status for _, status in results] == ["changed", "no_input", "new", "unknown_type"]
+    assert results[0][0]["previous_array"] == [0, 0, 0, 0]
+    assert [record for record, _ in results[1:2] + results[3:]] == [records[1], records[3]]
+
+def run_all_tests():
+    """Run all tests"""
+    print("\n" + "="*60)
+    print("  Subsystem Tests")
+    print("="*60)
+
+    tests = [
+        ("Log Rotation Manifest", test_log_rotation_manifest),
+        ("Log Rotation Daily Window", test_log_rotation_daily_window),
+        ("Log Rotation Max Segments", test_log_rotation_max_segments),
+        ("Log Rotation Two Writers", test_log_rotation_two_writers),
+        ("Log Rotation Pending Segments", test_log_rotation_pending_segments),
+        ("Data Logger Queue", test_data_logger_queue),
+        ("History Queries", test_history_queries),
+        ("History Same Timestamp", test_history_same_timestamp),
+        ("History Backfill", test_history_backfill),
+        ("History Backfill Twice", test_history_backfill_twice),
+        ("Tracing Spans", test_tracing_spans),
+        ("Tracing Sampling", test_tracing_sampling),
+        ("Tracing Log Rotation", test_tracing_log_rotation),
+        ("Request Coalescer", test_request_coalescer),
+        ("Jobs Priority And Spool", test_jobs_priority_and_spool),
+        ("Jobs Queue Limit", test_jobs_queue_limit),
+        ("Jobs Lease And Retry", test_jobs_lease_and_retry),
+        ("Jobs Process And Deliver", test_jobs_process_and_deliver),
+        ("Passage Index Hits And Misses", test_passage_index_hits_and_misses),
+        ("Passage Index Other Model", test_passage_index_other_model),
+        ("Word Align Matches DP", test_word_align_matches_dp),
+        ("Word Align Reading Counts", test_word_align_reading_counts),
+        ("Scoring Matches Endpoints", test_scoring_matches_endpoints),
+        ("Rescore Keeps Every Record", test_rescore_keeps_every_record),
+    ]
+
+    results = {}
+
+    for test_name, test_func in tests:
+        started = time.perf_counter()
+        try:
+            test_func()
+            results[test_name] = True
+        except Exception as e:
+            print(f"\n❌ Error in {test_name}: {type(e).__name__}: {e}")
+            results[test_name] = False
+        print(f"{test_name:.<40} {'✓ PASSED' if results[test_name] else '✗ FAILED'} "
+              f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+
+    total_passed = sum(results.values())
+    print("-"*60)
+    print(f"Total: {total_passed}/{len(results)} tests passed")
+    print("="*60)
+    return total_passed == len(results)
+
+if __name__ == "__main__":
+    raise SystemExit(0 if run_all_tests() else 1)
@@ -0,0 +1,225 @@
+# tracing.py
+# Lightweight per-request spans, no external collector.
+# A handler opens a trace with start(); code anywhere below it (including on
+# inference executor threads, which inherit the request's context) records
+# named spans with `with span("petal.reading"):` or the @traced decorator.
+# Outside a trace span() costs one context variable lookup.
+#
+# finish() closes the trace. A TRACE_SAMPLE_RATE fraction of traces, plus
+# every trace slower than TRACE_SLOW_MS, is buffered and appended to
+# TRACE_LOG_FILE (NDJSON) by a background thread every
+# TRACE_FLUSH_INTERVAL_S seconds. The file is rotated like the test data log
+# (log_rotation.py): past TRACE_ROTATE_BYTES it becomes a compressed segment,
+# and only the newest TRACE_MAX_SEGMENTS segments are kept, so a slow server
+# tracing every request still has a bounded trace log. Clients sending
+# DEBUG_HEADER get the timings in the response instead of having to dig
+# through the log.
+
+import atexit
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from log_rotation import RotatingLog
+
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", "500"))
+TRACE_LOG_FILE = os.environ.get("TRACE_LOG_FILE", "traces.ndjson")
+TRACE_FLUSH_INTERVAL_S = float(os.environ.get("TRACE_FLUSH_INTERVAL_S", "10"))
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", "10000"))
+TRACE_ROTATE_BYTES = int(os.environ.get("TRACE_ROTATE_BYTES", str(16 * 1024 * 1024)))
+TRACE_MAX_SEGMENTS = int(os.environ.get("TRACE_MAX_SEGMENTS", "8"))
+
+DEBUG_HEADER = "X-Debug-Timings"
+
+_current: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Spans recorded for one request"""
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.timestamp = datetime.utcnow().isoformat() + "Z"
+        self.started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, started: float, ended: float, error: Optional[str] = None) -> None:
+        record = {
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round((ended - started) * 1000, 3),
+        }
+        if error is not None:
+            record["error"] = error
+        with self._lock:
+            self.spans.append(record)
+
+    def timings(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {"total_ms": self.duration_ms, "spans": spans}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.timings(), name=self.name, timestamp=self.timestamp, **self.attributes)
+
+
+def start(name: str, **attributes: Any) -> Trace:
+    """Open a trace and make it current for this request's context"""
+    trace = Trace(name, attributes)
+    _current.set(trace)
+    return trace
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Record the with-block as a span of the current trace (no-op without one)"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        trace.add(name, started, time.perf_counter(), error)
+
+
+def traced(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator form of span()"""
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _TraceLog:
+    """Buffers sampled traces and appends them to TRACE_LOG_FILE (size-rotated) periodically"""
+
+    def __init__(self, path: str, flush_interval_s: float, buffer_size: int,
+                 max_bytes: int = TRACE_ROTATE_BYTES, max_segments: int = TRACE_MAX_SEGMENTS):
+        self.path = path
+        self.flush_interval_s = max(flush_interval_s, 0.1)
+        self.buffer_size = max(buffer_size, 1)
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._file: Optional[RotatingLog] = None
+
+        self.finished = 0
+        self.sampled = 0
+        self.written = 0
+        self.dropped = 0
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            if len(self._buffer) >= self.buffer_size:
+                self.dropped += 1
+                return
+            self._buffer.append(record)
+            self.sampled += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-log", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        try:
+            with self._lock:
+                if self._file is None:
+                    # opened on first use: most processes never write a trace
+                    self._file = RotatingLog(self.path, max_bytes=self.max_bytes, daily=False,
+                                             max_segments=self.max_segments)
+            self._file.write(batch)
+            with self._lock:
+                self.written += len(batch)
+        except Exception as e:
+            print(f"⚠️ tracing: failed to write {len(batch)} traces: {e}")
+            with self._lock:
+                self.dropped += len(batch)
+
+    def shutdown(self) -> None:
+        """Write what is buffered and finish compressing rotated segments"""
+        self.flush()
+        with self._lock:
+            rotating, self._file = self._file, None
+        if rotating is not None:
+            rotating.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        rotating = self._file
+        rotation = rotating.stats() if rotating is not None else None
+        with self._lock:
+            return {
+                "file": self.path,
+                "sample_rate": TRACE_SAMPLE_RATE,
+                "slow_ms": TRACE_SLOW_MS,
+                "finished": self.finished,
+                "sampled": self.sampled,
+                "written": self.written,
+                "dropped": self.dropped,
+                "buffered": len(self._buffer),
+                "rotation": rotation,
+            }
+
+
+_log = _TraceLog(TRACE_LOG_FILE, TRACE_FLUSH_INTERVAL_S, TRACE_BUFFER_SIZE)
+
+
+def finish(trace: Trace) -> Trace:
+    """Close the trace and hand it to the sampled trace log"""
+    trace.duration_ms = round((time.perf_counter() - trace.started) * 1000, 3)
+    _current.set(None)
+    with _log._lock:
+        _log.finished += 1
+    if trace.duration_ms >= TRACE_SLOW_MS or random.random() < TRACE_SAMPLE_RATE:
+        _log.add(trace.to_dict())
+    return trace
+
+
+def wants_timings(headers: Any) -> bool:
+    """True if the request asked for a timings block (DEBUG_HEADER: 1/true)"""
+    return str(headers.get(DEBUG_HEADER, "")).lower() in ("1", "true", "yes")
+
+
+def flush() -> None:
+    _log.flush()
+
+
+def stats() -> Dict[str, Any]:
+    return _log.stats()
+
+
+atexit.register(_log.shutdown)
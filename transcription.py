@@ -0,0 +1,186 @@
+# transcription.py
+# Server-side transcription of reading-test recordings (faster-whisper).
+# The model runs with CTranslate2 int8 weights on the CPU and Silero VAD
+# trimming, so silence before, between and after the words is never decoded.
+# Each clip's transcript is aligned word by word with the passage the child
+# was asked to read (word_align.py): matched words count as words read,
+# substituted words as pronunciation errors, so neither has to be trusted
+# from the client.
+#
+# Clips run on their own bounded pool (TRANSCRIBE_WORKERS threads, at most
+# TRANSCRIBE_QUEUE_SIZE waiting), separate from the inference executor, so a
+# burst of uploads can only ever delay other uploads, never /predict-* or
+# /analyze-test*. Every clip reports its real-time factor
+# (processing seconds / audio seconds).
+#
+#   WHISPER_MODEL (base), WHISPER_COMPUTE_TYPE (int8), WHISPER_BEAM_SIZE (1),
+#   WHISPER_LANGUAGE (en), WHISPER_VAD (1), TRANSCRIBE_CPU_THREADS (half the cores)
+
+import os
+import threading
+import time
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Sequence, Union
+
+import metrics
+import word_align
+from inference_executor import BoundedExecutor
+
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+WHISPER_COMPUTE_TYPE = os.environ.get("WHISPER_COMPUTE_TYPE", "int8")
+WHISPER_BEAM_SIZE = int(os.environ.get("WHISPER_BEAM_SIZE", "1"))
+WHISPER_LANGUAGE = os.environ.get("WHISPER_LANGUAGE", "en") or None
+WHISPER_VAD = os.environ.get("WHISPER_VAD", "1") != "0"
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", "1"))
+TRANSCRIBE_QUEUE_SIZE = int(os.environ.get("TRANSCRIBE_QUEUE_SIZE", "8"))
+TRANSCRIBE_CPU_THREADS = int(os.environ.get("TRANSCRIBE_CPU_THREADS", str(max(1, (os.cpu_count() or 1) // 2))))
+TRANSCRIBE_MAX_BYTES = int(os.environ.get("TRANSCRIBE_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# minimum silence (ms) that VAD cuts out of a clip
+VAD_MIN_SILENCE_MS = 500
+
+TRANSCRIBE_SECONDS = metrics.histogram("transcription_seconds", "Time to transcribe one audio clip", (),
+                                       metrics.LOAD_BUCKETS)
+TRANSCRIBE_RTF = metrics.histogram("transcription_rtf", "Real-time factor per clip (processing / audio seconds)",
+                                   (), (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0))
+AUDIO_SECONDS = metrics.counter("transcription_audio_seconds_total", "Audio transcribed, before and after VAD",
+                                ("stage",))
+
+pool = BoundedExecutor(TRANSCRIBE_WORKERS, TRANSCRIBE_QUEUE_SIZE, name="transcribe")
+
+_lock = threading.Lock()
+_clips = 0
+_audio_s = 0.0
+_processing_s = 0.0
+
+
+def load_model() -> Any:
+    """WhisperModel for CPU inference with int8 weights"""
+    from faster_whisper import WhisperModel  # type: ignore
+    return WhisperModel(WHISPER_MODEL, device="cpu", compute_type=WHISPER_COMPUTE_TYPE,
+                        cpu_threads=TRANSCRIBE_CPU_THREADS, num_workers=max(TRANSCRIBE_WORKERS, 1))
+
+
+def transcribe_audio(get_model: Callable[[], Any], audio: Union[str, BinaryIO, Any]) -> Dict[str, Any]:
+    """
+    Transcribe one recording, a file or a 16 kHz float32 array (runs on the
+    transcription pool). get_model is the process-wide lazy loader.
+    """
+    global _clips, _audio_s, _processing_s
+    model = get_model()
+    if model is None:
+        raise RuntimeError("Whisper model not available")
+
+    started = time.perf_counter()
+    segments, info = model.transcribe(
+        audio,
+        language=WHISPER_LANGUAGE,
+        beam_size=WHISPER_BEAM_SIZE,
+        vad_filter=WHISPER_VAD,
+        vad_parameters={"min_silence_duration_ms": VAD_MIN_SILENCE_MS} if WHISPER_VAD else None,
+        condition_on_previous_text=False,
+    )
+    transcript = " ".join(segment.text.strip() for segment in segments).strip()
+    processing_s = time.perf_counter() - started
+
+    duration_s = float(getattr(info, "duration", 0.0) or 0.0)
+    speech_s = getattr(info, "duration_after_vad", None)
+    speech_s = float(speech_s) if speech_s is not None else duration_s
+
+    TRANSCRIBE_SECONDS.observe(processing_s)
+    TRANSCRIBE_RTF.observe(processing_s / duration_s if duration_s > 0 else 0.0)
+    AUDIO_SECONDS.inc(duration_s, stage="input")
+    AUDIO_SECONDS.inc(speech_s, stage="speech")
+    with _lock:
+        _clips += 1
+        _audio_s += duration_s
+        _processing_s += processing_s
+    return {"transcript": transcript, "duration_s": duration_s, "speech_s": speech_s, "processing_s": processing_s}
+
+
+def join_parts(parts: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine the transcribe_audio() results of consecutive pieces of one recording"""
+    return {
+        "transcript": " ".join(part["transcript"] for part in parts if part["transcript"]),
+        "duration_s": sum(part["duration_s"] for part in parts),
+        "speech_s": sum(part["speech_s"] for part in parts),
+        "processing_s": sum(part["processing_s"] for part in parts),
+    }
+
+
+def score_clip(expected_text: str, transcript: str, duration_s: float, speech_s: float,
+               processing_s: float) -> Dict[str, Any]:
+    """Align a transcript with the passage it should contain"""
+    rtf = processing_s / duration_s if duration_s > 0 else 0.0
+    return {
+        "expected_text": expected_text,
+        "transcript": transcript,
+        **word_align.reading_counts(expected_text, transcript),
+        "duration_s": round(duration_s, 3),
+        "speech_s": round(speech_s, 3),
+        "processing_s": round(processing_s, 3),
+        "rtf": round(rtf, 3),
+    }
+
+
+def transcribe_clip(get_model: Callable[[], Any], audio: Union[str, BinaryIO], expected_text: str) -> Dict[str, Any]:
+    """Transcribe one recording and compare it with expected_text (runs on the transcription pool)"""
+    return score_clip(expected_text, **transcribe_audio(get_model, audio))
+
+
+def transcribe_piece(get_model: Callable[[], Any], piece: Union[BinaryIO, Any]) -> Dict[str, Any]:
+    """
+    transcribe_audio() for one piece of a streamed upload (runs on the
+    transcription pool). A spooled file is closed here, once it has been read:
+    the request may have ended while the piece was still being transcribed.
+    """
+    try:
+        return transcribe_audio(get_model, piece)
+    finally:
+        if hasattr(piece, "close"):
+            piece.close()
+
+
+def summarize(clips: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Passage totals and the transcription report for a list of transcribed clips"""
+    audio_s = sum(clip["duration_s"] for clip in clips)
+    processing_s = sum(clip["processing_s"] for clip in clips)
+    return {
+        "words_read": sum(clip["words_read"] for clip in clips),
+        "total_words": sum(clip["total_words"] for clip in clips),
+        "pronunciation_errors": sum(clip["pronunciation_errors"] for clip in clips),
+        "transcription": {
+            "clips": clips,
+            "audio_s": round(audio_s, 3),
+            "processing_s": round(processing_s, 3),
+            "rtf": round(processing_s / audio_s, 3) if audio_s > 0 else None,
+        },
+    }
+
+
+def add_semantic_similarity(clips: List[Dict[str, Any]], similarity: Optional[Sequence[float]]) -> Optional[float]:
+    """
+    Record each clip's semantic similarity to its passage and return the
+    whole test's, passages weighted by their length (None without scores)
+    """
+    if not similarity:
+        return None
+    for clip, score in zip(clips, similarity):
+        clip["semantic_similarity"] = score
+    weights = [max(clip["total_words"], 1) for clip in clips]
+    return round(sum(w * score for w, score in zip(weights, similarity)) / sum(weights), 4)
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        clips, audio_s, processing_s = _clips, _audio_s, _processing_s
+    return {
+        "model": WHISPER_MODEL,
+        "compute_type": WHISPER_COMPUTE_TYPE,
+        "vad": WHISPER_VAD,
+        "cpu_threads": TRANSCRIBE_CPU_THREADS,
+        "clips": clips,
+        "audio_s": round(audio_s, 3),
+        "processing_s": round(processing_s, 3),
+        "rtf": round(processing_s / audio_s, 3) if audio_s > 0 else None,
+        "pool": pool.stats(),
+    }
@@ -0,0 +1,523 @@
+# transcription_jobs.py
+# Persistent queue of reading-test transcription jobs (SQLite, stdlib only).
+# POST /jobs/test1-audio spools the clips to JOBS_SPOOL_DIR, inserts a queued
+# row into JOBS_DB and returns a job id at once; TRANSCRIBE_PROCESSES worker
+# processes (each with its own Whisper model) claim jobs highest priority
+# first, oldest first, transcribe and score them, and store the response in
+# the row. A busy class therefore waits in the queue instead of holding HTTP
+# requests open until they time out.
+#
+# A claimed job carries a lease that its worker renews every few seconds. If
+# the worker dies (crash, OOM kill, restart) the supervisor in api.py releases
+# its jobs at once, and any other worker reclaims a job whose lease ran out;
+# either way the job is retried until it has been attempted JOB_MAX_ATTEMPTS
+# times. Jobs that raise are retried after JOB_RETRY_DELAY_S * attempts.
+# Finished rows (and their spooled audio) are kept for JOB_RETENTION_S.
+#
+#   python transcription_jobs.py worker   # run one worker in the foreground
+#   python transcription_jobs.py stats    # jobs per status
+
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import passage_index
+import scoring
+import transcription
+
+JOBS_DB = os.environ.get("JOBS_DB", "transcription_jobs.db")
+JOBS_SPOOL_DIR = os.environ.get("JOBS_SPOOL_DIR", "transcription_spool")
+TRANSCRIBE_PROCESSES = int(os.environ.get("TRANSCRIBE_PROCESSES", "1"))
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "1000"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_S = float(os.environ.get("JOB_LEASE_S", "60"))
+JOB_RETRY_DELAY_S = float(os.environ.get("JOB_RETRY_DELAY_S", "5"))
+JOB_RETENTION_S = float(os.environ.get("JOB_RETENTION_S", str(24 * 3600)))
+
+# seconds between queue polls of an idle worker, and between lease renewals
+POLL_INTERVAL_S = 0.5
+HEARTBEAT_INTERVAL_S = JOB_LEASE_S / 4
+# a worker slot is restarted at most this often, so a model that fails to load cannot spin
+RESTART_MIN_INTERVAL_S = 10.0
+
+STATUSES = ["queued", "running", "done", "failed"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    request TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    logged INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority DESC, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_worker ON jobs (worker, status);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (status, finished_at);
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _connect(path: str = JOBS_DB) -> sqlite3.Connection:
+    """One connection per thread and database file (autocommit; writers use BEGIN IMMEDIATE)"""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        dirpath = os.path.dirname(path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock:
+            if path not in _schema_ready:
+                conn.executescript(SCHEMA)
+                _schema_ready.add(path)
+        connections[path] = conn
+    return conn
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, so claims from several processes never race"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class QueueFull(Exception):
+    """Raised by submit() when JOB_QUEUE_MAX jobs are already waiting"""
+
+
+def _spool_dir(job_id: str) -> str:
+    return os.path.join(JOBS_SPOOL_DIR, job_id)
+
+
+def submit(kind: str, request: Dict[str, Any], clips: Sequence[Tuple[str, Any]], priority: int = 0,
+           path: str = JOBS_DB) -> str:
+    """
+    Queue a job. clips are (filename, file object) pairs; they are copied to
+    the spool directory and their paths added to the request as "audio".
+    """
+    conn = _connect(path)
+    # cheap early answer before copying any audio; the count that counts is taken with the insert
+    waiting = _waiting(conn)
+    if waiting >= JOB_QUEUE_MAX:
+        raise QueueFull(f"{waiting} jobs already queued")
+
+    job_id = uuid.uuid4().hex
+    spool = _spool_dir(job_id)
+    try:
+        os.makedirs(spool, exist_ok=True)
+        audio = []
+        for i, (filename, f) in enumerate(clips):
+            clip_path = os.path.join(spool, f"{i}{os.path.splitext(filename or '')[1]}")
+            with open(clip_path, "wb") as out:
+                shutil.copyfileobj(f, out, 1024 * 1024)
+            audio.append(clip_path)
+
+        now = time.time()
+        with _Transaction(conn):
+            waiting = _waiting(conn)
+            if waiting >= JOB_QUEUE_MAX:
+                raise QueueFull(f"{waiting} jobs already queued")
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, priority, created_at, available_at, max_attempts, request) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, int(priority), now, now, JOB_MAX_ATTEMPTS,
+                 json.dumps(dict(request, audio=audio), ensure_ascii=False)),
+            )
+    except BaseException:
+        shutil.rmtree(spool, ignore_errors=True)
+        raise
+    return job_id
+
+
+def _waiting(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+
+def _requeue(conn: sqlite3.Connection, where: str, params: Sequence[Any], error: str, now: float) -> int:
+    """Put running jobs matching `where` back in the queue, or fail those out of attempts"""
+    conn.execute(
+        f"UPDATE jobs SET status = 'failed', finished_at = ?, worker = NULL, lease_expires = NULL, error = ? "
+        f"WHERE status = 'running' AND attempts >= max_attempts AND {where}",
+        (now, error, *params),
+    )
+    return conn.execute(
+        f"UPDATE jobs SET status = 'queued', available_at = ?, worker = NULL, lease_expires = NULL, error = ? "
+        f"WHERE status = 'running' AND {where}",
+        (now, error, *params),
+    ).rowcount
+
+
+def claim(worker: str, path: str = JOBS_DB) -> Optional[Dict[str, Any]]:
+    """Lease the next runnable job to `worker` (None when the queue is empty)"""
+    now = time.time()
+    with _Transaction(_connect(path)) as conn:
+        _requeue(conn, "lease_expires < ?", (now,), "worker lease expired", now)
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE status = 'queued' AND available_at <= ? "
+            "ORDER BY priority DESC, created_at LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_expires = ?, "
+            "started_at = COALESCE(started_at, ?) WHERE id = ?",
+            (worker, now + JOB_LEASE_S, now, row["id"]),
+        )
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+    return _row_to_dict(job, include_request=True)
+
+
+def heartbeat(job_id: str, worker: str, path: str = JOBS_DB) -> bool:
+    """Extend the lease; False if the job is no longer leased to this worker"""
+    return _connect(path).execute(
+        "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'running'",
+        (time.time() + JOB_LEASE_S, job_id, worker),
+    ).rowcount == 1
+
+
+def complete(job_id: str, worker: str, result: Dict[str, Any], path: str = JOBS_DB) -> bool:
+    return _connect(path).execute(
+        "UPDATE jobs SET status = 'done', finished_at = ?, result = ?, error = NULL, worker = NULL, "
+        "lease_expires = NULL WHERE id = ? AND worker = ? AND status = 'running'",
+        (time.time(), json.dumps(result, ensure_ascii=False), job_id, worker),
+    ).rowcount == 1
+
+
+def fail(job_id: str, worker: str, error: str, path: str = JOBS_DB) -> str:
+    """Retry the job after a backoff, or fail it for good once out of attempts; returns the new status"""
+    now = time.time()
+    with _Transaction(_connect(path)) as conn:
+        row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ? AND status = 'running'",
+                           (job_id, worker)).fetchone()
+        if row is None:
+            return "lost"
+        if row["attempts"] >= row["max_attempts"]:
+            conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, error = ?, worker = NULL, "
+                         "lease_expires = NULL WHERE id = ?", (now, error, job_id))
+            return "failed"
+        conn.execute("UPDATE jobs SET status = 'queued', available_at = ?, error = ?, worker = NULL, "
+                     "lease_expires = NULL WHERE id = ?", (now + JOB_RETRY_DELAY_S * row["attempts"], error, job_id))
+        return "queued"
+
+
+def release_worker(worker: str, path: str = JOBS_DB) -> int:
+    """Requeue the jobs of a worker that died; returns how many went back to the queue"""
+    now = time.time()
+    with _Transaction(_connect(path)) as conn:
+        return _requeue(conn, "worker = ?", (worker,), f"worker {worker} exited", now)
+
+
+def _row_to_dict(row: sqlite3.Row, include_request: bool = False) -> Dict[str, Any]:
+    job = {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "priority": row["priority"],
+        "attempts": row["attempts"],
+        "max_attempts": row["max_attempts"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+    }
+    if row["error"] is not None:
+        job["error"] = row["error"]
+    if row["result"] is not None:
+        job["result"] = json.loads(row["result"])
+    if include_request:
+        job["request"] = json.loads(row["request"])
+    return job
+
+
+def get(job_id: str, path: str = JOBS_DB) -> Optional[Dict[str, Any]]:
+    """A job's status (and result once done), with its queue position while queued"""
+    conn = _connect(path)
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = _row_to_dict(row)
+    if row["status"] == "queued":
+        job["queue_position"] = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+            "(priority > ? OR (priority = ? AND created_at < ?))",
+            (row["priority"], row["priority"], row["created_at"]),
+        ).fetchone()[0] + 1
+    return job
+
+
+def counts(path: str = JOBS_DB) -> Dict[str, int]:
+    rows = _connect(path).execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+    result = {status: 0 for status in STATUSES}
+    result.update({row["status"]: row["n"] for row in rows})
+    return result
+
+
+def take_unlogged(limit: int = 100, path: str = JOBS_DB) -> List[Dict[str, Any]]:
+    """Finished jobs whose result has not been written to the test log yet, marked as logged"""
+    with _Transaction(_connect(path)) as conn:
+        rows = conn.execute("SELECT * FROM jobs WHERE status = 'done' AND logged = 0 ORDER BY finished_at LIMIT ?",
+                            (limit,)).fetchall()
+        conn.executemany("UPDATE jobs SET logged = 1 WHERE id = ?", [(row["id"],) for row in rows])
+    return [_row_to_dict(row, include_request=True) for row in rows]
+
+
+def prune(older_than_s: float = JOB_RETENTION_S, path: str = JOBS_DB) -> int:
+    """Delete finished jobs (and any spooled audio left) older than older_than_s"""
+    conn = _connect(path)
+    cutoff = time.time() - older_than_s
+    rows = conn.execute("SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                        (cutoff,)).fetchall()
+    for row in rows:
+        shutil.rmtree(_spool_dir(row["id"]), ignore_errors=True)
+    conn.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows])
+    return len(rows)
+
+
+# ============ JOB HANDLERS (run in the worker processes) ============
+
+# SentenceTransformer encoder of this worker: None until first used, False if it cannot load
+_encoder: Any = None
+
+
+def _semantic_similarity(transcripts: List[str], passages: List[str]) -> Optional[List[float]]:
+    """api.semantic_similarity for a worker process (None when sentence-transformers is unavailable)"""
+    global _encoder
+    if _encoder is None:
+        try:
+            _encoder = passage_index.sentence_encoder() if importlib.util.find_spec("sentence_transformers") else False
+        except Exception as e:
+            print(f"Warning: semantic similarity unavailable in transcription worker: {e}")
+            _encoder = False
+    if not _encoder:
+        return None
+    scored = [i for i, text in enumerate(transcripts) if text.strip()]
+    scores = [0.0] * len(transcripts)
+    if scored:
+        student = _encoder([transcripts[i] for i in scored])
+        references = passage_index.passage_vectors([passages[i] for i in scored], _encoder)
+        for i, score in zip(scored, passage_index.similarity(student, references)):
+            scores[i] = score
+    return scores
+
+
+def run_test1_audio(get_model: Callable[[], Any], request: Dict[str, Any]) -> Dict[str, Any]:
+    """The /analyze-test1-audio response for a queued submission"""
+    clips = [transcription.transcribe_clip(get_model, audio, text)
+             for audio, text in zip(request["audio"], request["expected_text"])]
+    semantic = transcription.add_semantic_similarity(
+        clips, _semantic_similarity([clip["transcript"] for clip in clips], request["expected_text"]))
+    summary = transcription.summarize(clips)
+    columns = {
+        "words_read": np.array([summary["words_read"]]),
+        "total_words": np.array([summary["total_words"]]),
+        "reading_time_ms": np.array([request["reading_time_ms"]]),
+        "max_reading_time_ms": np.array([request["max_reading_time_ms"]]),
+        "pronunciation_errors": np.array([summary["pronunciation_errors"]]),
+    }
+    return {
+        "user_id": request["user_id"],
+        "test_id": request["test_id"],
+        "test_type": "reading",
+        "array": [float(column[0]) for column in scoring.score_test1(columns)],
+        **summary,
+        "semantic_similarity": semantic,
+    }
+
+
+HANDLERS: Dict[str, Callable[[Callable[[], Any], Dict[str, Any]], Dict[str, Any]]] = {
+    "test1_audio": run_test1_audio,
+}
+
+
+def _keep_leased(job_id: str, worker: str, done: threading.Event, path: str) -> None:
+    while not done.wait(HEARTBEAT_INTERVAL_S):
+        try:
+            heartbeat(job_id, worker, path)
+        except sqlite3.Error:
+            pass
+
+
+def process_one(worker: str, get_model: Callable[[], Any], path: str = JOBS_DB) -> Optional[str]:
+    """Claim and run one job; returns its new status, or None if nothing was runnable"""
+    job = claim(worker, path)
+    if job is None:
+        return None
+    done = threading.Event()
+    threading.Thread(target=_keep_leased, args=(job["job_id"], worker, done, path), daemon=True).start()
+    try:
+        result = HANDLERS[job["kind"]](get_model, job["request"])
+    except Exception as e:
+        return fail(job["job_id"], worker, f"{type(e).__name__}: {e}", path)
+    finally:
+        done.set()
+    if not complete(job["job_id"], worker, result, path):
+        return "lost"
+    shutil.rmtree(_spool_dir(job["job_id"]), ignore_errors=True)
+    return "done"
+
+
+def run_worker(worker: str, load_model: Callable[[], Any] = transcription.load_model,
+               stop: Optional[Any] = None, path: str = JOBS_DB) -> None:
+    """Worker loop: load the model once, then claim jobs until `stop` is set"""
+    model = load_model()
+    get_model = lambda: model
+    while stop is None or not stop.is_set():
+        if process_one(worker, get_model, path) is None:
+            time.sleep(POLL_INTERVAL_S)
+
+
+def _worker_main(worker: str, stop: Any) -> None:
+    try:
+        run_worker(worker, stop=stop)
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerPool:
+    """
+    Keeps TRANSCRIBE_PROCESSES worker processes alive (spawned, so they never
+    inherit the server's threads or loaded models). A background thread
+    restarts workers that exit, requeues their jobs, hands finished jobs to
+    on_done (api.py logs them) and prunes old rows.
+    """
+
+    def __init__(self, processes: int = TRANSCRIBE_PROCESSES,
+                 on_done: Optional[Callable[[Dict[str, Any]], None]] = None, path: str = JOBS_DB):
+        self.processes = max(int(processes), 0)
+        self.on_done = on_done
+        self.path = path
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop = self._ctx.Event()
+        self._workers: Dict[str, Any] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._host = socket.gethostname()
+
+        self.started = 0
+        self.restarts = 0
+        self.requeued = 0
+        self.logged = 0
+
+    def _spawn(self, slot: int) -> None:
+        worker = f"{self._host}:{os.getpid()}:{slot}:{self.started}"
+        process = self._ctx.Process(target=_worker_main, args=(worker, self._stop),
+                                    name=f"transcribe-{slot}", daemon=True)
+        process.start()
+        self._workers[slot] = (worker, process, time.time())
+        self.started += 1
+
+    def start(self) -> None:
+        if self._thread is not None or self.processes == 0:
+            return
+        for slot in range(self.processes):
+            self._spawn(slot)
+        self._thread = threading.Thread(target=self._supervise, name="transcribe-supervisor", daemon=True)
+        self._thread.start()
+
+    def _supervise(self) -> None:
+        last_prune = 0.0
+        while not self._stop.wait(POLL_INTERVAL_S):
+            try:
+                self.check_workers()
+                self.deliver()
+                if time.time() - last_prune > 600:
+                    prune(path=self.path)
+                    last_prune = time.time()
+            except Exception as e:
+                print(f"Warning: transcription job supervisor: {e}")
+
+    def check_workers(self) -> None:
+        for slot, (worker, process, started_at) in list(self._workers.items()):
+            if process.is_alive() or self._stop.is_set():
+                continue
+            self.requeued += release_worker(worker, self.path)
+            if time.time() - started_at < RESTART_MIN_INTERVAL_S:
+                continue
+            self.restarts += 1
+            print(f"Transcription worker {worker} exited with {process.exitcode}; restarting")
+            self._spawn(slot)
+
+    def deliver(self) -> None:
+        if self.on_done is None:
+            return
+        for job in take_unlogged(path=self.path):
+            self.on_done(job)
+            self.logged += 1
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        for worker, process, _ in self._workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(1.0)
+            release_worker(worker, self.path)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.deliver()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processes": self.processes,
+            "alive": sum(process.is_alive() for _, process, _ in self._workers.values()),
+            "started": self.started,
+            "restarts": self.restarts,
+            "requeued": self.requeued,
+            "logged": self.logged,
+            "jobs": counts(self.path),
+            "max_attempts": JOB_MAX_ATTEMPTS,
+            "lease_s": JOB_LEASE_S,
+        }
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "worker":
+        name = f"{socket.gethostname()}:{os.getpid()}:cli"
+        print(f"transcription worker {name} on {JOBS_DB}")
+        try:
+            run_worker(name)
+        except KeyboardInterrupt:
+            release_worker(name)
+    elif command == "stats":
+        print(json.dumps(counts(), indent=2))
+    else:
+        print("usage: python transcription_jobs.py [worker|stats]")
+        sys.exit(2)
@@ -0,0 +1,244 @@
+# tree_engine.py
+# Compiled evaluator for trained/decision_tree_model.pkl.
+# The pickled model is a MultiOutputRegressor of DecisionTreeRegressors (one
+# tree per petal: dyslexia, dyscalculia, dysgraphia, adhd). compile_model()
+# flattens every tree into shared NumPy arrays (feature index, threshold,
+# left/right child, leaf value) so predictions need neither pandas nor sklearn
+# on the request path. Comparisons follow sklearn exactly (inputs are cast to
+# float32 and tested with `x <= threshold`), so results are identical to
+# model.predict.
+#
+#   python tree_engine.py export   # write trained/decision_tree_model.npz
+#   python tree_engine.py check    # compare against model.predict on data/vectortreeper.csv
+
+import os
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+import model_registry
+
+MODEL_PATH = "trained/decision_tree_model.pkl"
+COMPILED_PATH = "trained/decision_tree_model.npz"
+ONNX_PATH = "trained/decision_tree_model.onnx"
+
+# "numpy": CompiledTree (default); "onnx": ONNX Runtime on trained/decision_tree_model.onnx
+# (the CompiledTree while that export is stale)
+TREE_BACKEND = os.environ.get("TREE_BACKEND", "numpy")
+TARGETS = ["dyslexia", "dyscalculia", "dysgraphia", "adhd"]
+
+_LEAF = -1
+
+
+class TreePredictor:
+    """Dict-row helpers shared by the tree backends (subclasses define predict)"""
+
+    feature_names: List[str]
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def to_matrix(self, rows: Iterable[Mapping[str, float]]) -> np.ndarray:
+        """Order dict rows by feature name; names must match the fitted model exactly"""
+        expected = set(self.feature_names)
+        matrix = []
+        for row in rows:
+            if set(row) != expected:
+                missing = sorted(expected - set(row))
+                unexpected = sorted(set(row) - expected)
+                raise ValueError(
+                    f"feature names do not match the model (missing: {missing}, unexpected: {unexpected})"
+                )
+            matrix.append([row[name] for name in self.feature_names])
+        return np.asarray(matrix, dtype=np.float64).reshape(-1, len(self.feature_names))
+
+    def predict_rows(self, rows: Iterable[Mapping[str, float]]) -> np.ndarray:
+        return self.predict(self.to_matrix(rows))
+
+    def predict_one(self, features: Mapping[str, float]) -> List[float]:
+        return [float(v) for v in self.predict_rows([features])[0]]
+
+
+class CompiledTree(TreePredictor):
+    """Flat-array multi-output decision tree"""
+
+    def __init__(self, feature_names: Sequence[str], feature: np.ndarray, threshold: np.ndarray,
+                 left: np.ndarray, right: np.ndarray, value: np.ndarray, roots: np.ndarray,
+                 max_depth: int):
+        self.feature_names = [str(name) for name in feature_names]
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        # value[node, output]: leaf value of `output` (zero for other trees' nodes)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.n_outputs = len(self.roots)
+        self._index = {name: i for i, name in enumerate(self.feature_names)}
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """X: (n_rows, n_features) in feature_names order -> (n_rows, n_outputs)"""
+        # sklearn evaluates trees on float32 inputs
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+            raise ValueError(f"expected rows of {len(self.feature_names)} features, got shape {X.shape}")
+        with metrics.timer(metrics.TREE_EVAL_SECONDS):
+            return self._evaluate(X)
+
+    def _evaluate(self, X: np.ndarray) -> np.ndarray:
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.n_outputs)).copy()
+        for _ in range(self.max_depth):
+            leaf = self.left[nodes] == _LEAF
+            if leaf.all():
+                break
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(leaf, nodes, np.where(go_left, self.left[nodes], self.right[nodes]))
+        return self.value[nodes, np.arange(self.n_outputs)]
+
+def compile_model(model: Any) -> CompiledTree:
+    """Flatten a fitted MultiOutputRegressor / DecisionTreeRegressor"""
+    estimators = getattr(model, "estimators_", None) or [model]
+
+    features, thresholds, lefts, rights, blocks, roots = [], [], [], [], [], []
+    n_outputs = sum(est.tree_.n_outputs for est in estimators)
+    offset, output = 0, 0
+    max_depth = 0
+    for est in estimators:
+        tree = est.tree_
+        n = tree.node_count
+        left = tree.children_left.astype(np.intp)
+        right = tree.children_right.astype(np.intp)
+        features.append(tree.feature)
+        thresholds.append(tree.threshold)
+        lefts.append(np.where(left == _LEAF, _LEAF, left + offset))
+        rights.append(np.where(right == _LEAF, _LEAF, right + offset))
+
+        block = np.zeros((n, n_outputs))
+        for k in range(tree.n_outputs):
+            block[:, output] = tree.value[:, k, 0]
+            roots.append(offset)
+            output += 1
+        blocks.append(block)
+
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n
+
+    feature_names = getattr(model, "feature_names_in_", None)
+    if feature_names is None:
+        feature_names = [f"x{i}" for i in range(estimators[0].n_features_in_)]
+
+    return CompiledTree(
+        feature_names=list(feature_names),
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts),
+        right=np.concatenate(rights),
+        value=np.vstack(blocks),
+        roots=np.array(roots),
+        max_depth=max_depth,
+    )
+
+
+def save_compiled(tree: CompiledTree, npz_path: str, source_sha256: str = "") -> str:
+    np.savez_compressed(
+        npz_path,
+        feature_names=np.array(tree.feature_names),
+        feature=tree.feature,
+        threshold=tree.threshold,
+        left=tree.left,
+        right=tree.right,
+        value=tree.value,
+        roots=tree.roots,
+        max_depth=np.array(tree.max_depth),
+        source_sha256=np.array(source_sha256),
+    )
+    return npz_path
+
+
+def load_compiled(npz_path: str) -> CompiledTree:
+    """Registry loader for an exported .npz"""
+    with np.load(npz_path) as data:
+        return CompiledTree(
+            feature_names=data["feature_names"].tolist(),
+            feature=data["feature"],
+            threshold=data["threshold"],
+            left=data["left"],
+            right=data["right"],
+            value=data["value"],
+            roots=data["roots"],
+            max_depth=int(data["max_depth"]),
+        )
+
+
+def load_and_compile(pkl_path: str) -> CompiledTree:
+    """Registry loader for the pickled sklearn model"""
+    import joblib
+    return compile_model(joblib.load(pkl_path))
+
+
+def export(pkl_path: str = MODEL_PATH, npz_path: str = COMPILED_PATH) -> str:
+    return save_compiled(load_and_compile(pkl_path), npz_path, model_registry.file_sha256(pkl_path))
+
+
+def model_available() -> bool:
+    if TREE_BACKEND == "onnx" and os.path.exists(ONNX_PATH):
+        return True
+    return os.path.exists(MODEL_PATH) or os.path.exists(COMPILED_PATH)
+
+
+def _served() -> Tuple[str, Callable[[str], TreePredictor]]:
+    """(file, registry loader) that serves the tree under the current settings"""
+    if TREE_BACKEND == "onnx":
+        import onnx_engine
+        # a retrained .pkl falls back to the compiled tree until it is re-exported
+        if onnx_engine.export_is_current(MODEL_PATH, onnx_engine.TREE_ONNX_PATH):
+            return onnx_engine.TREE_ONNX_PATH, onnx_engine.load_tree_session
+    if model_registry.export_is_current(MODEL_PATH, COMPILED_PATH):
+        return COMPILED_PATH, load_compiled
+    return MODEL_PATH, load_and_compile
+
+
+def get_tree() -> TreePredictor:
+    """
+    The compiled tree, loaded once per process. Uses the exported .npz when it
+    matches the current .pkl, otherwise compiles the pickle (needs sklearn).
+    With TREE_BACKEND=onnx the ONNX export is served instead.
+    """
+    path, loader = _served()
+    return model_registry.get_model(path, loader)
+
+
+def model_version() -> Tuple[str, float]:
+    """Identifies the tree currently served; changes when it does"""
+    path, _ = _served()
+    return path, os.path.getmtime(path)
+
+
+def predict_petals(features: Mapping[str, float]) -> Dict[str, float]:
+    """Single-row prediction keyed by TARGETS (raw 0-1 model outputs)"""
+    return dict(zip(TARGETS, get_tree().predict_one(features)))
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+
+    if command == "export":
+        print(f"{MODEL_PATH} -> {export()}")
+    elif command == "check":
+        import joblib
+        import pandas as pd
+
+        model = joblib.load(MODEL_PATH)
+        df = pd.read_csv("data/vectortreeper.csv")[list(model.feature_names_in_)]
+        expected = model.predict(df)
+        actual = get_tree().predict(df.values)
+        identical = np.array_equal(expected, actual)
+        print(f"{len(df)} rows: {'identical' if identical else 'MISMATCH'} to model.predict")
+        sys.exit(0 if identical else 1)
+    else:
+        print("usage: python tree_engine.py [export|check]")
+        sys.exit(2)
@@ -0,0 +1,174 @@
+# warmup.py
+# Startup-time bookkeeping and background model warm-up for api.py.
+# Heavy dependencies (TensorFlow, sentence_transformers, faster_whisper) are
+# only imported when an endpoint needs them, so the server answers /health as
+# soon as FastAPI is up. After startup, start() loads the models named in
+# WARMUP_MODELS on a daemon thread (WARMUP=background, the default), before
+# serving (WARMUP=blocking) or not at all (WARMUP=off, models load on first
+# use). After each model loads, its probe runs one dummy prediction so the
+# first real request does not pay for graph tracing or lazy initialisation.
+# report() breaks the startup time down by import and by model; readiness()
+# says whether every warmed model loaded and answered its probe.
+
+import importlib
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+# perf_counter at the time this module was first imported (api.py imports it first)
+PROCESS_START = time.perf_counter()
+
+WARMUP = os.environ.get("WARMUP", "background")
+WARMUP_MODELS = [m.strip() for m in os.environ.get("WARMUP_MODELS", "tree,petals").split(",") if m.strip()]
+
+_lock = threading.Lock()
+_imports: Dict[str, Dict[str, Any]] = {}
+_models: Dict[str, Dict[str, Any]] = {}
+_state: Dict[str, Any] = {"mode": WARMUP, "state": "pending", "started_at": None, "finished_at": None}
+_marks: Dict[str, float] = {}
+
+
+def _utc_iso() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _elapsed_ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 2)
+
+
+def timed_import(name: str) -> Optional[Any]:
+    """Import a module, recording how long it took; None if it is not installed"""
+    started = time.perf_counter()
+    try:
+        module = importlib.import_module(name)
+    except ImportError as e:
+        record_import(name, _elapsed_ms(started), error=str(e))
+        return None
+    record_import(name, _elapsed_ms(started))
+    return module
+
+
+def record_import(name: str, ms: float, error: Optional[str] = None) -> None:
+    with _lock:
+        _imports[name] = {"ms": ms, "ok": error is None}
+        if error is not None:
+            _imports[name]["error"] = error
+
+
+def record_model(name: str, ms: float, error: Optional[str] = None) -> None:
+    with _lock:
+        _models[name] = {"load_time_ms": ms, "ok": error is None}
+        if error is None:
+            _models[name]["loaded_at"] = _utc_iso()
+        else:
+            _models[name]["error"] = error
+
+
+def timed_load(name: str, load: Callable[[], Any]) -> Any:
+    """Run load(), recording its duration under name; exceptions propagate"""
+    started = time.perf_counter()
+    try:
+        result = load()
+    except Exception as e:
+        record_model(name, _elapsed_ms(started), error=str(e))
+        raise
+    record_model(name, _elapsed_ms(started))
+    return result
+
+
+def record_probe(name: str, ms: float, error: Optional[str] = None) -> None:
+    with _lock:
+        info = _models.setdefault(name, {})
+        info["warm_inference_ms"] = ms
+        info["warm_inference_ok"] = error is None
+        if error is not None:
+            info["warm_inference_error"] = error
+
+
+def mark(name: str) -> None:
+    """Remember how long after PROCESS_START a milestone was reached"""
+    _marks[name] = _elapsed_ms(PROCESS_START)
+
+
+def _run(tasks: Dict[str, Callable[[], Any]], probes: Dict[str, Callable[[], Any]]) -> None:
+    _state.update(state="running", started_at=_utc_iso())
+    started = time.perf_counter()
+    for name, task in tasks.items():
+        before = _models.get(name)
+        task_started = time.perf_counter()
+        error = None
+        try:
+            task()
+        except Exception as e:
+            error = str(e)
+            print(f"Warning: warm-up of {name} failed: {e}")
+        # loaders wrapped in timed_load() have already recorded themselves
+        if _models.get(name) is before:
+            record_model(name, _elapsed_ms(task_started), error=error)
+        if not _models[name]["ok"] or name not in probes:
+            continue
+        probe_started = time.perf_counter()
+        try:
+            probes[name]()
+            record_probe(name, _elapsed_ms(probe_started))
+        except Exception as e:
+            print(f"Warning: warm-up inference of {name} failed: {e}")
+            record_probe(name, _elapsed_ms(probe_started), error=str(e))
+    _state.update(state="done", finished_at=_utc_iso(), duration_ms=_elapsed_ms(started))
+    mark("warm")
+
+
+def start(tasks: Dict[str, Callable[[], Any]], probes: Optional[Dict[str, Callable[[], Any]]] = None,
+          mode: str = WARMUP) -> Optional[threading.Thread]:
+    """
+    Warm up the models in tasks (name -> loader) that are listed in
+    WARMUP_MODELS: load each one, then run its probe (name -> dummy
+    prediction) if it has one. mode is "background", "blocking" or "off".
+    Returns the background thread, if any.
+    """
+    selected = {name: task for name, task in tasks.items() if name in WARMUP_MODELS}
+    _state["mode"] = mode
+    _state["required"] = sorted(selected)
+    if mode == "off" or not selected:
+        _state["state"] = "skipped"
+        return None
+    if mode == "blocking":
+        _run(selected, probes or {})
+        return None
+    thread = threading.Thread(target=_run, args=(selected, probes or {}), name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness() -> Dict[str, Any]:
+    """
+    Ready once the warm-up has finished and every warmed model loaded and
+    answered its probe. With WARMUP=off models load on first use, so the
+    process is ready as soon as it serves.
+    """
+    with _lock:
+        models = {name: dict(info) for name, info in _models.items()}
+        state = _state["state"]
+        required = list(_state.get("required", []))
+    failed = [
+        name for name in required
+        if not models.get(name, {}).get("ok") or models[name].get("warm_inference_ok") is False
+    ]
+    return {
+        "ready": state == "skipped" or (state == "done" and not failed),
+        "warmup": state,
+        "failed": failed,
+        "models": models,
+    }
+
+
+def report() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "milestones_ms": dict(_marks),
+            "imports": {name: dict(info) for name, info in _imports.items()},
+            "models": {name: dict(info) for name, info in _models.items()},
+            "warmup": dict(_state, models=WARMUP_MODELS),
+        }
@@ -0,0 +1,223 @@
+# word_align.py
+# Word-level alignment of a reading transcript against the expected passage.
+# Words are mapped to integer ids and the edit distance between the two word
+# sequences is computed with Myers' bit-vector algorithm (Hyyrö's global
+# edit-distance form): one column of the DP matrix is a pair of m-bit
+# vectors of +1/-1 vertical deltas, updated with a handful of integer
+# operations per spoken word. Python integers are arbitrary precision, so a
+# passage of any length is one "word" of bits and the whole alignment costs
+# O(n * ceil(m / 64)) machine operations instead of O(n * m) Python steps.
+#
+# The column vectors are kept, so any cell can be recovered as
+# D[i][j] = j + popcount(Pv_j below row i) - popcount(Mv_j below row i), and
+# the optimal path is traced back cell by cell to report, per passage word,
+# whether it was read (match), mispronounced (substitution) or skipped
+# (omission), and which extra words were inserted. The counts feed
+# /analyze-test1 directly: words_read = matches,
+# pronunciation_errors = substitutions.
+#
+#   python word_align.py check   # bit-parallel vs the plain DP on random word sequences
+#   python word_align.py bench   # time per alignment for passages of 50..1000 words
+
+import re
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+MATCH = "match"
+SUBSTITUTION = "substitution"
+OMISSION = "omission"
+INSERTION = "insertion"
+
+
+class Step(NamedTuple):
+    """One alignment column: op, passage word (None for an insertion), spoken word (None for an omission)"""
+    op: str
+    expected: Optional[str]
+    spoken: Optional[str]
+
+
+def words(text: str) -> List[str]:
+    """Lower-cased words without punctuation ("The girl's hat." -> ["the", "girl's", "hat"])"""
+    return _WORD_RE.findall(text.lower().replace("’", "'"))
+
+
+def _columns(expected: Sequence[str], spoken: Sequence[str]) -> List[Tuple[int, int]]:
+    """(Pv, Mv) vertical-delta bit vectors of every DP column, column 0 first"""
+    m = len(expected)
+    full = (1 << m) - 1
+    peq: Dict[str, int] = {}
+    for i, word in enumerate(expected):
+        peq[word] = peq.get(word, 0) | (1 << i)
+
+    pv, mv = full, 0   # column 0: D[i][0] = i
+    columns = [(pv, mv)]
+    for word in spoken:
+        eq = peq.get(word, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & full) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        # row 0 is D[0][j] = j: every column adds one at the top
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        columns.append((pv, mv))
+    return columns
+
+
+def edit_distance(expected: Sequence[str], spoken: Sequence[str]) -> int:
+    """Word-level Levenshtein distance"""
+    pv, mv = _columns(expected, spoken)[-1]
+    return len(spoken) + pv.bit_count() - mv.bit_count()
+
+
+def align(expected: Sequence[str], spoken: Sequence[str]) -> List[Step]:
+    """
+    One minimal-cost alignment, in passage order. Ties prefer match or
+    substitution, then omission, then insertion.
+    """
+    columns = _columns(expected, spoken)
+
+    def cell(i: int, j: int) -> int:
+        pv, mv = columns[j]
+        below = (1 << i) - 1
+        return j + (pv & below).bit_count() - (mv & below).bit_count()
+
+    steps: List[Step] = []
+    i, j = len(expected), len(spoken)
+    current = cell(i, j)
+    while i > 0 or j > 0:
+        if i > 0 and j > 0:
+            differs = expected[i - 1] != spoken[j - 1]
+            diagonal = cell(i - 1, j - 1)
+            if current == diagonal + differs:
+                steps.append(Step(SUBSTITUTION if differs else MATCH, expected[i - 1], spoken[j - 1]))
+                i, j, current = i - 1, j - 1, diagonal
+                continue
+        if i > 0:
+            up = cell(i - 1, j)
+            if current == up + 1:
+                steps.append(Step(OMISSION, expected[i - 1], None))
+                i, current = i - 1, up
+                continue
+        steps.append(Step(INSERTION, None, spoken[j - 1]))
+        j -= 1
+        current -= 1
+    steps.reverse()
+    return steps
+
+
+def count_edits(expected: Sequence[str], spoken: Sequence[str]) -> Dict[str, int]:
+    """matches, substitutions, deletions (passage words not read) and insertions (extra spoken words)"""
+    counts = {"matches": 0, "substitutions": 0, "deletions": 0, "insertions": 0}
+    keys = {MATCH: "matches", SUBSTITUTION: "substitutions", OMISSION: "deletions", INSERTION: "insertions"}
+    for step in align(expected, spoken):
+        counts[keys[step.op]] += 1
+    return counts
+
+
+def reading_counts(expected_text: str, transcript: str) -> Dict[str, int]:
+    """The /analyze-test1 fields measured from a transcript"""
+    expected = words(expected_text)
+    counts = count_edits(expected, words(transcript))
+    return {
+        "words_read": counts["matches"],
+        "total_words": len(expected),
+        "pronunciation_errors": counts["substitutions"],
+        "words_skipped": counts["deletions"],
+        "extra_words": counts["insertions"],
+    }
+
+
+def _align_dp(expected: Sequence[str], spoken: Sequence[str]) -> Tuple[int, Dict[str, int]]:
+    """Plain O(n * m) dynamic programme with the same tie-breaking, for check()"""
+    n, m = len(expected), len(spoken)
+    cost = [list(range(m + 1))] + [[i] + [0] * m for i in range(1, n + 1)]
+    for i in range(1, n + 1):
+        row, prev = cost[i], cost[i - 1]
+        for j in range(1, m + 1):
+            row[j] = min(prev[j - 1] + (expected[i - 1] != spoken[j - 1]), prev[j] + 1, row[j - 1] + 1)
+
+    counts = {"matches": 0, "substitutions": 0, "deletions": 0, "insertions": 0}
+    i, j = n, m
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and cost[i][j] == cost[i - 1][j - 1] + (expected[i - 1] != spoken[j - 1]):
+            counts["matches" if expected[i - 1] == spoken[j - 1] else "substitutions"] += 1
+            i, j = i - 1, j - 1
+        elif i > 0 and cost[i][j] == cost[i - 1][j] + 1:
+            counts["deletions"] += 1
+            i -= 1
+        else:
+            counts["insertions"] += 1
+            j -= 1
+    return cost[n][m], counts
+
+
+def _misread(rng, passage: List[str], vocabulary: List[str]) -> List[str]:
+    """A plausible transcript: words dropped, swapped for others, or repeated"""
+    spoken = []
+    for word in passage:
+        roll = rng.random()
+        if roll < 0.08:
+            continue
+        if roll < 0.18:
+            spoken.append(rng.choice(vocabulary))
+        else:
+            spoken.append(word)
+        if rng.random() < 0.05:
+            spoken.append(rng.choice(vocabulary))
+    return spoken
+
+
+def check(n_pairs: int = 2000, seed: int = 0) -> Dict[str, int]:
+    """Distance and per-op counts of align() vs the DP on random pairs"""
+    import random
+
+    rng = random.Random(seed)
+    vocabulary = [f"w{k}" for k in range(12)]
+    distance_mismatches = count_mismatches = 0
+    for _ in range(n_pairs):
+        passage = [rng.choice(vocabulary) for _ in range(rng.randint(0, 80))]
+        spoken = _misread(rng, passage, vocabulary) if rng.random() < 0.7 else \
+            [rng.choice(vocabulary) for _ in range(rng.randint(0, 80))]
+        distance, counts = _align_dp(passage, spoken)
+        steps = align(passage, spoken)
+        if edit_distance(passage, spoken) != distance or sum(s.op != MATCH for s in steps) != distance:
+            distance_mismatches += 1
+        if count_edits(passage, spoken) != counts:
+            count_mismatches += 1
+    return {"pairs": n_pairs, "distance_mismatches": distance_mismatches, "count_mismatches": count_mismatches}
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "check":
+        result = check()
+        print(f"{result['pairs']} pairs: {result['distance_mismatches']} distance mismatches, "
+              f"{result['count_mismatches']} count mismatches")
+        sys.exit(1 if result["distance_mismatches"] or result["count_mismatches"] else 0)
+    elif command == "bench":
+        import random
+
+        rng = random.Random(1)
+        vocabulary = [f"w{k}" for k in range(300)]
+        print(f"{'words':>6}{'bit-parallel ms':>17}{'dp ms':>9}")
+        for size in (50, 100, 200, 500, 1000):
+            passage = [rng.choice(vocabulary) for _ in range(size)]
+            spoken = _misread(rng, passage, vocabulary)
+            runs = max(2000 // size, 3)
+            started = time.perf_counter()
+            for _ in range(runs):
+                count_edits(passage, spoken)
+            fast = (time.perf_counter() - started) / runs * 1000
+            started = time.perf_counter()
+            _align_dp(passage, spoken)
+            slow = (time.perf_counter() - started) * 1000
+            print(f"{size:>6}{fast:>17.2f}{slow:>9.1f}")
+    else:
+        print("usage: python word_align.py [check|bench]")
+        sys.exit(2)